@@ -0,0 +1,61 @@
+"""
+The flopro command
+
+  flopro flow     solve the flow problem and write its results; see flopro.flow
+  flopro check    prune the network and check that the flow problem is feasible, without
+                  building the solver; see flopro.feasibility
+
+Subcommand modules are imported when the subcommand runs, so the command starts without loading
+networkx, gprofiler or the plotting code unless the subcommand needs them.
+"""
+import argparse
+import sys
+
+def add_flow_parser(subparsers):
+  from . import flow
+  parser = subparsers.add_parser('flow', help='solve the flow problem and write its results', description=flow.__doc__,
+    formatter_class=argparse.RawDescriptionHelpFormatter)
+  flow.add_flow_args(parser)
+  parser.add_argument('--flow-only', help='Do not perform GSEA and subsequent visualizations, just write the flow_result.graphml', action='store_true')
+  parser.set_defaults(func=flow.run)
+  return parser
+
+def add_check_parser(subparsers):
+  from . import flow
+  parser = subparsers.add_parser('check', help='check that the flow problem is feasible without solving it', description="""
+Prune the network as flow does and check, from its connected components, whether
+min-sources * min-targets units of flow can get from the sources to the targets. Exits with
+status {} if they cannot.
+""".format(flow.EXIT_INFEASIBLE))
+  flow.add_network_args(parser)
+  parser.add_argument('--sources-file', required=True)
+  parser.add_argument('--targets-file', required=True)
+  parser.add_argument('--min-sources', type=int, required=True)
+  parser.add_argument('--min-targets', type=int, required=True)
+  parser.set_defaults(func=check)
+  return parser
+
+def check(args):
+  from . import flow
+  if args.precheck == 'none':
+    sys.stderr.write('--precheck none does not check anything; use counts or maxflow\n')
+    sys.exit(2)
+  problem = flow.FlowProblem.load(args.edges_file, args.min_sources, args.min_targets, cache_dir=args.network_cache_dir,
+    dedupe=args.dedupe, prune=args.prune, precheck=args.precheck, solver=args.solver)
+  problem.set_terminals(flow.parse_nodes(args.sources_file), flow.parse_nodes(args.targets_file))
+  feasibility = problem.check_feasibility()
+  print(feasibility.summary(args.min_sources, args.min_targets))
+  if not feasibility.feasible:
+    sys.exit(flow.EXIT_INFEASIBLE)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog='flopro', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  subparsers = parser.add_subparsers(dest='command', metavar='command')
+  subparsers.required = True
+  add_flow_parser(subparsers)
+  add_check_parser(subparsers)
+  args = parser.parse_args(argv)
+  args.func(args)
+
+if __name__ == "__main__":
+  main()
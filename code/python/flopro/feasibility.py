@@ -0,0 +1,165 @@
+"""
+Check whether the flow problem of flow.py can be solved before building the solver
+
+flow.py sends min_sources * min_targets units of flow from an artificial source, over arcs of
+capacity min_targets to each source protein, through the network, and over arcs of capacity
+min_sources from each target protein to an artificial target. Network arcs have capacity equal
+to the total flow, so they never limit it. The maximum flow is therefore the sum over connected
+components of the network of
+
+  min(n_sources * min_targets, n_targets * min_sources)
+
+where n_sources and n_targets count the sources and targets in the component, and the problem is
+feasible exactly when that sum reaches min_sources * min_targets. Once the connected components
+are known this takes milliseconds, where an infeasible Solve() runs the full solver.
+"""
+import numpy as np
+
+PRECHECK_MODES = ['none', 'counts', 'maxflow']
+PRECHECK_DEFAULT = 'maxflow'
+
+def connected_components(n_nodes, tail, head, labels=None):
+  """
+  Parameters
+  ----------
+  n_nodes : int
+
+  tail, head : np.ndarray of int
+    undirected edges
+
+  labels : np.ndarray of int or None
+    labels returned by an earlier call; the components are then those of the earlier edges
+    together with <tail> and <head>, so a growing network can be labelled edges at a time
+
+  Returns
+  -------
+  labels : np.ndarray of int64
+    smallest node id in the connected component of each node
+  """
+  tail = np.asarray(tail, dtype=np.int64)
+  head = np.asarray(head, dtype=np.int64)
+  if labels is None:
+    parent = np.arange(n_nodes, dtype=np.int64)
+  else:
+    parent = np.array(labels, dtype=np.int64)
+  while True:
+    # hook the root of the larger id onto the smaller root across every edge joining two trees
+    root_tail = parent[tail]
+    root_head = parent[head]
+    joining = root_tail != root_head
+    if not joining.any():
+      return parent
+    root_tail, root_head = root_tail[joining], root_head[joining]
+    np.minimum.at(parent, np.maximum(root_tail, root_head), np.minimum(root_tail, root_head))
+    # point every node at its root
+    while True:
+      grandparent = parent[parent]
+      if (grandparent == parent).all():
+        break
+      parent = grandparent
+
+class Feasibility(object):
+  """
+  Result of check_feasibility
+
+  Attributes
+  ----------
+  feasible : bool
+
+  n_sources, n_targets : int
+    sources and targets in the network
+
+  n_reachable_sources, n_reachable_targets : int
+    sources in a connected component with a target, and targets in one with a source
+
+  max_flow : int or None
+    maximum flow, or None if only the counts were checked
+
+  max_min_sources, max_min_targets : int or None
+    largest --min-sources that is feasible with the given --min-targets and largest
+    --min-targets that is feasible with the given --min-sources, or 0 if there is none; None if
+    only the counts were checked
+  """
+  def __init__(self, feasible, n_sources, n_targets, n_reachable_sources, n_reachable_targets, max_flow=None, max_min_sources=None, max_min_targets=None):
+    self.feasible = feasible
+    self.n_sources = n_sources
+    self.n_targets = n_targets
+    self.n_reachable_sources = n_reachable_sources
+    self.n_reachable_targets = n_reachable_targets
+    self.max_flow = max_flow
+    self.max_min_sources = max_min_sources
+    self.max_min_targets = max_min_targets
+
+  def to_dict(self):
+    return dict(self.__dict__)
+
+  def summary(self, min_sources, min_targets):
+    rv = '{} of {} sources can reach a target and {} of {} targets can be reached from a source'.format(
+      self.n_reachable_sources, self.n_sources, self.n_reachable_targets, self.n_targets)
+    if self.max_flow is not None:
+      rv += '; maximum flow {} of {} required'.format(self.max_flow, min_sources * min_targets)
+    if not self.feasible:
+      if self.max_min_sources is not None:
+        rv += '; largest feasible --min-sources with --min-targets {}: {}; largest feasible --min-targets with --min-sources {}: {}'.format(
+          min_targets, self.max_min_sources, min_sources, self.max_min_targets)
+      else:
+        rv += '; at most --min-sources {} and --min-targets {} can be feasible'.format(self.n_reachable_sources, self.n_reachable_targets)
+    return rv
+
+def _max_flows(source_counts, target_counts, min_sources, min_targets):
+  """
+  Maximum flow for each pair of capacities, given the number of sources and targets in each
+  component; <min_sources> and <min_targets> are broadcast against each other
+  """
+  min_sources = np.asarray(min_sources, dtype=np.int64)[..., np.newaxis]
+  min_targets = np.asarray(min_targets, dtype=np.int64)[..., np.newaxis]
+  return np.minimum(source_counts * min_targets, target_counts * min_sources).sum(axis=-1)
+
+def check_feasibility(labels, source_ids, target_ids, min_sources, min_targets, mode=PRECHECK_DEFAULT):
+  """
+  Parameters
+  ----------
+  labels : np.ndarray of int
+    connected component of each node; see connected_components
+
+  source_ids, target_ids : np.ndarray of int
+    node ids of the sources and targets in the network
+
+  min_sources, min_targets : int
+    see flow.py
+
+  mode : str
+    'counts' only checks that enough sources can reach a target and enough targets can be
+    reached from a source, which is necessary but not sufficient; 'maxflow' also computes the
+    maximum flow, which is exact
+
+  Returns
+  -------
+  feasibility : Feasibility
+  """
+  if mode not in PRECHECK_MODES or mode == 'none':
+    raise ValueError('Unknown precheck mode "{}"; must be counts or maxflow'.format(mode))
+  source_ids = np.unique(np.asarray(source_ids, dtype=np.int64))
+  target_ids = np.unique(np.asarray(target_ids, dtype=np.int64))
+  components, inverse = np.unique(np.concatenate((labels[source_ids], labels[target_ids])), return_inverse=True)
+  source_counts = np.bincount(inverse[:len(source_ids)], minlength=len(components))
+  target_counts = np.bincount(inverse[len(source_ids):], minlength=len(components))
+  both = (source_counts > 0) & (target_counts > 0)
+  n_reachable_sources = int(source_counts[both].sum())
+  n_reachable_targets = int(target_counts[both].sum())
+  feasible = n_reachable_sources >= min_sources and n_reachable_targets >= min_targets
+  if mode == 'counts':
+    return Feasibility(feasible, len(source_ids), len(target_ids), n_reachable_sources, n_reachable_targets)
+
+  source_counts, target_counts = source_counts[both], target_counts[both]
+  max_flow = int(_max_flows(source_counts, target_counts, min_sources, min_targets))
+  feasible = max_flow >= min_sources * min_targets
+
+  # largest feasible value of each parameter with the other one fixed
+  candidates = np.arange(1, n_reachable_sources + 1)
+  ok = candidates[_max_flows(source_counts, target_counts, candidates, min_targets) >= candidates * min_targets]
+  max_min_sources = int(ok.max()) if len(ok) > 0 else 0
+  candidates = np.arange(1, n_reachable_targets + 1)
+  ok = candidates[_max_flows(source_counts, target_counts, min_sources, candidates) >= min_sources * candidates]
+  max_min_targets = int(ok.max()) if len(ok) > 0 else 0
+  return Feasibility(feasible, len(source_ids), len(target_ids), n_reachable_sources, n_reachable_targets, max_flow, max_min_sources, max_min_targets)
@@ -0,0 +1,849 @@
+"""
+Find paths, by solving the min-cost flow problem, through a protein-protein interaction network that connect source proteins in the <sources_file> with targets in the <targets_file>.
+
+Usage: flopro flow --min-sources 1 --min-targets 1 --edges-file data/edges_file.txt --mapping-file data/mapping_file.txt --sources-file data/hf_curve_shape_ensp_stringdb_filter.txt --targets-file data/gene_lists/mehle_targets_ensp.txt --outdir flow_results
+
+The protein-protein interaction network given by <edges_file> has proteins identified by Ensembl protein identifiers (ENSP) and consists of edges or
+interactions between proteins in the ABC format. That is, lines are three, space-delimited tokens:
+<ensp_a> <ensp_b> <weight>
+where the weight is the strength of the interaction. We typically use https://string-db.org/.
+<min_sources> constrains the flow program to require it to include the number <min_sources> source proteins in the result. Higher values find pathways shared among more of the source proteins but at the expense of the strength of interaction evidence. A value of 1 imposes no constraint. Similar remarks can be made for <min_targets>.
+
+The flow result is output to the file flow_result.graphml. If <flow_only> is not provided, the program then
+performs Gene Set Enrichment Analysis on the connected components in the output network. Each connected
+component can have multiple significant enrichments, so the first 10 significant enrichments are written
+to files in the <output_dir>. For example the *_0_*.gv and *_0_*.png files report the most significant enrichment
+for each connected component. The *_1_* files report the next most significant enrichment, and so on. The network
+does not vary across these files, only the enrichments.
+
+Because it is often convenient to use HGNC gene identifiers, you can provide a <mapping_file> to translate ENSP identifiers used by the program to HGNC identifiers to be used in the output files.
+
+From Python, FlowProblem loads a network, takes the sources and targets, solves and returns the
+flow as a flopro.flow_result.FlowResult. networkx, gprofiler and flopro.plot are imported only
+by the functions that use them, so importing this module and solving a flow problem does not
+load them.
+
+Authors: Anthony Gitter, Chris Magnano, Aaron Baker
+"""
+import sys
+import os, os.path
+import numpy as np
+from . import flow_curve as flow_curve_module
+from . import flow_paths
+from . import flow_result as flow_result_module
+from . import feasibility as feasibility_module
+from . import metrics as metrics_module
+from . import network as network_module
+from . import prune as prune_module
+from . import solvers
+from . import thresholds as thresholds_module
+
+# exit statuses when the flow problem cannot be solved, unless --no-exit-on-fail is given
+EXIT_SOLVE_FAILED = 21
+EXIT_INFEASIBLE = 22
+EXIT_TIMEOUT = 23
+
+# outcome of a run, recorded as the status metric: solved; found infeasible by the precheck or the
+# solver; stopped by the time limit; or failed otherwise
+STATUSES = ['optimal', 'infeasible', 'timeout', 'failed']
+
+# exit status of each outcome but optimal
+EXIT_STATUSES = {'infeasible': EXIT_INFEASIBLE, 'timeout': EXIT_TIMEOUT, 'failed': EXIT_SOLVE_FAILED}
+
+def exit_status(statuses):
+  ''' Return the exit status of runs with outcomes <statuses>: 0 if every
+  run was solved, or else that of their most pressing outcome, timeout, then
+  failed, then infeasible, mapped as for a single run by EXIT_STATUSES.
+  '''
+  for status in ['timeout', 'failed', 'infeasible']:
+    if status in statuses:
+      return EXIT_STATUSES[status]
+  return 0
+
+def remove_node(G, node):
+  """
+  Wrapper around networkx.classes.graph.Graph.remove_node to return a dict mapping an incident node to its edge attributes
+  """
+  rv = {}
+  for edge in G.edges(node, data=True):
+    u = edge[0]
+    v = edge[1]
+    edge_attr = edge[2]
+    t = None
+    if u == node:
+      t = v
+    else:
+      t = u
+    rv[t] = edge_attr
+  G.remove_node(node)
+  return rv
+
+def parse_nodes(node_file):
+  ''' Parse a list of sources or targets and return a set '''
+  with open(node_file) as node_f:
+    lines = node_f.readlines()
+    nodes = set(map(str.strip, lines))
+  return nodes
+
+def read_sources(sources_file, sim_index=None):
+  ''' Parse <sources_file> as parse_nodes does or, if <sim_index> is given,
+  return the sources of that simulation in the sample matrix <sources_file>
+  written by flow_sim_screens.py (see flopro.sim_samples).
+  '''
+  if sim_index is None:
+    return parse_nodes(sources_file)
+  from . import sim_samples
+  return sim_samples.SimSamples.read(sources_file).sources(sim_index)
+
+def load_network(edges_file, cache_dir=None, dedupe=network_module.DEDUPE_DEFAULT, verbose=False):
+  ''' Load the weighted undirected edges of <edges_file> from the compiled
+  network cache (see flopro.network), which is built from <edges_file> on
+  first use. Lines repeating an interaction are merged according to
+  <dedupe> when the network is compiled. The arrays are memory-mapped, so
+  processes on one host that load the same network share its pages.
+  '''
+  network = network_module.load_network(edges_file, cache_dir=cache_dir, dedupe=dedupe, verbose=verbose)
+  if verbose:
+    sys.stdout.write('{} interactions, {} duplicate lines dropped (dedupe policy {})\n'.format(network.n_edges, network.manifest.get('n_duplicates', 0), network.manifest.get('dedupe', 'none')))
+  return network
+
+def prune_network(network, id_table, sources, targets, mode=prune_module.PRUNE_DEFAULT):
+  ''' Remove the parts of <network> that cannot carry flow from <sources>
+  to <targets>; see flopro.prune. The pruning statistics are printed.
+  '''
+  source_ids = id_table.ids(list(sources))
+  target_ids = id_table.ids(list(targets))
+  pruned = prune_module.prune_network(network.n_nodes, network.tail, network.head, network.cost,
+    source_ids[source_ids >= 0], target_ids[target_ids >= 0], mode=mode)
+  print(pruned.summary())
+  return pruned
+
+def precheck(pruned, id_table, sources, targets, min_sources, min_targets, mode=feasibility_module.PRECHECK_DEFAULT):
+  ''' Check whether <min_sources> * <min_targets> units of flow can get
+  from <sources> to <targets> over the edges of <pruned> without building
+  the solver; see flopro.feasibility.
+  '''
+  labels = feasibility_module.connected_components(id_table.n_nodes, pruned.tail, pruned.head)
+  source_ids = id_table.ids(list(sources))
+  target_ids = id_table.ids(list(targets))
+  return feasibility_module.check_feasibility(labels, source_ids[source_ids >= 0], target_ids[target_ids >= 0],
+    min_sources, min_targets, mode=mode)
+
+def build_solver(tail, head, cost, cap, solver=solvers.SOLVER_DEFAULT):
+  ''' Construct a weighted directed graph in which an undirected edge i is
+  represented with a pair of directed edges, arcs 2i and 2i+1.  Use the
+  specified cost as the edge weight and a default capacity of <cap>.  The
+  graph is held by a new <solver>; see flopro.solvers.
+  '''
+  G = solvers.make_solver(solver)
+  arc_tails = np.stack((tail, head), axis=1).ravel()
+  arc_heads = np.stack((head, tail), axis=1).ravel()
+  arc_costs = np.repeat(cost, 2)
+  G.AddArcsWithCapacityAndUnitCost(arc_tails, arc_heads, np.full(len(arc_tails), int(cap), dtype=np.int64), arc_costs)
+  return G
+
+def construct_digraph(edges_file, cap, cache_dir=None, dedupe=network_module.DEDUPE_DEFAULT, solver=solvers.SOLVER_DEFAULT, verbose=False):
+  ''' Parse a list of weighted undirected edges.  Construct a weighted
+  directed graph in which an undirected edge is represented with a pair of
+  directed edges, without pruning; see load_network and build_solver.
+  '''
+  network = load_network(edges_file, cache_dir=cache_dir, dedupe=dedupe, verbose=verbose)
+  return build_solver(network.tail, network.head, network.cost, cap, solver=solver), network.id_table()
+
+def print_graph(graph):
+  ''' Print the edges in a graph '''
+  print('\n'.join(sorted(map(str, graph.edges(data=True)))))
+
+def add_sources_targets(G, sources, targets, id_table, source_capacity, default_target_capacity, target_capacity_dict=None):
+  '''
+  Similar to ResponseNet, add an artificial source node that is connected
+  to the real source nodes with directed edges.  Unlike ResponseNet, these
+  directed edges should have weight of 0 and Infinite capacity.  Also add an
+  artificial target node that has directed edges from the real target nodes
+  with the same weights and capacities as the source node edges.  The new
+  nodes have ids id_table.source_id and id_table.target_id and are named
+  "source" and "target" in results.
+
+  Parameters
+  ==========
+  G : flopro.solvers.OrtoolsSolver or flopro.solvers.SspSolver
+    graph object created by build_solver
+
+  sources : list
+    list of hashable node names which are used as sources in the min cost flow
+
+  targets : list
+    list of hashable node names which are used as targets in the min cost flow
+
+  id_table : flopro.id_table.IdTable
+    mapping between node names and node ids
+
+  source_capacity : int
+    positive integer to use as source node capacity
+
+  default_target_capacity : int
+    postitive integer to use as target node capacity
+
+  target_capacity_dict: dict<string, int>
+    mapping of node name to capacity for an edge from that node to the artifical target/sink node
+  '''
+  default_weight = 0
+  sources = list(sources)
+  targets = list(targets)
+
+  for source_id in id_table.ids(sources).tolist():
+    if source_id >= 0:
+      G.AddArcWithCapacityAndUnitCost(id_table.source_id, source_id, source_capacity, default_weight)
+
+  for target, target_id in zip(targets, id_table.ids(targets).tolist()):
+    if target_id >= 0:
+      capacity = None
+      if target_capacity_dict is not None and target in target_capacity_dict:
+        capacity = target_capacity_dict[target]
+      else:
+        capacity = default_target_capacity
+      G.AddArcWithCapacityAndUnitCost(target_id, id_table.target_id, capacity, default_weight)
+
+def flow_result(G, id_table, pruned=None):
+  ''' Return the arcs of the solved graph <G> that carry positive flow as a
+  flopro.flow_result.FlowResult.  If <G> was built from the pruned network
+  <pruned>, flow on contracted chains is mapped back onto the original
+  edges.
+  '''
+  return flow_result_module.FlowResult.from_solver(G, id_table, pruned)
+
+def write_output_to_sif(G,out_file_name,id_table,pruned=None):
+  ''' Write the edges between network nodes that carry flow in the solved
+  graph <G> as tab-separated node pairs.
+  '''
+
+  out_file = open(out_file_name,"w")
+  result = flow_result(G, id_table, pruned)
+  numE = 0
+  for (node1, node2, flow), is_network_edge in zip(result.edges(), result.is_network_edge.tolist()):
+    if not is_network_edge:
+      continue
+    numE+=1
+    out_file.write(node1+"\t"+node2+"\n")
+  print("Final network had %d edges" %(numE))
+  out_file.close()
+
+  return
+
+def min_cost_flow(G, flow, id_table, roots, targets, time_limit=None):
+  ''' Use the min cost flow algorithm to distribute the specified amount
+  of flow from sources to targets.  The artificial source should have
+  demand = -flow and the traget should have demand = flow.  output is the
+  filename of the output file.  The graph should have artificial nodes
+  added by add_sources_targets.  Returns True if an optimal flow was found;
+  see solve_flow.
+  '''
+  return solve_flow(G, flow, id_table, time_limit=time_limit) == 'optimal'
+
+def solve_flow(G, flow, id_table, time_limit=None):
+  ''' Set the supply of the artificial source and target of <G> to <flow>
+  and solve, giving up after <time_limit> seconds if it is given (see
+  flopro.solvers).  Returns the status of the run: optimal, infeasible,
+  timeout or failed.
+  '''
+  G.SetNodeSupply(id_table.source_id,int(flow))
+  G.SetNodeSupply(id_table.target_id,int(-1*flow))
+
+  print("Computing min cost flow")
+  status = G.Solve() if time_limit is None else G.Solve(time_limit=time_limit)
+  if status == G.OPTIMAL:
+    print("Solved!")
+    print(G.OptimalCost())
+    return 'optimal'
+  elif status == G.TIMEOUT:
+    print("The solver did not finish within {} seconds".format(time_limit))
+    return 'timeout'
+  elif status == G.INFEASIBLE:
+    print("The flow problem is infeasible")
+    return 'infeasible'
+  else:
+    print("There was an issue with the solver")
+    return 'failed'
+
+def or2nx(G, id_table, pruned=None):
+  ''' Return the flow graph of the solved graph <G>, including the
+  artificial source and target; see flow_result.
+  '''
+  return flow_result(G, id_table, pruned).to_networkx(terminals=True)
+
+def write_flow_result(H, outdir, flow, network, weight_threshold=None, status=None):
+  ''' Write the flow graph <H>, without the artificial source and target,
+  to flow_result.graphml and record the run in flow_meta.tsv, including
+  the <weight_threshold> the network was filtered at and the <status> of a
+  run that did not finish, if any.
+  '''
+  import networkx as nx
+  nx.write_graphml(H, os.path.join(outdir, 'flow_result.graphml'))
+
+  # record which network revision produced this result
+  with open(os.path.join(outdir, 'flow_meta.tsv'), 'w') as fh:
+    fh.write('{}\t{}\n'.format('flow', flow))
+    fh.write('{}\t{}\n'.format('network_version', network.version))
+    fh.write('{}\t{}\n'.format('network_revision', network.revision))
+    if weight_threshold is not None:
+      fh.write('{}\t{}\n'.format('weight_threshold', weight_threshold))
+    if status is not None:
+      fh.write('{}\t{}\n'.format('status', status))
+
+class FlowProblem(object):
+  """
+  The flow problem of one run: <min_sources> * <min_targets> units of flow from the sources,
+  each of which may send at most <min_targets> units, to the targets, each of which may receive
+  at most <min_sources> units, over the undirected edges of <network>. Each step is run when
+  it is first needed, so solve() alone prunes, checks, builds and solves; calling the steps
+  one by one lets a caller time them.
+
+  Parameters
+  ----------
+  network : flopro.network.CompiledNetwork
+
+  min_sources, min_targets : int
+
+  prune : str
+    see flopro.prune.prune_network
+
+  precheck : str
+    see flopro.feasibility; 'none' skips the check
+
+  solver : str
+    see flopro.solvers
+
+  time_limit : float or None
+    seconds the solver may run; see flopro.solvers
+
+  Attributes
+  ----------
+  pruned : flopro.prune.PrunedNetwork or None
+
+  feasibility : flopro.feasibility.Feasibility or None
+    result of the check, if one was run
+
+  G : flopro.solvers.OrtoolsSolver or flopro.solvers.SspSolver or None
+    solver holding the problem once it is built
+
+  solved : bool or None
+    whether the last solve() found an optimal flow
+
+  status : str or None
+    outcome of the last solve(), one of STATUSES
+  """
+  def __init__(self, network, min_sources, min_targets, prune=prune_module.PRUNE_DEFAULT, precheck=feasibility_module.PRECHECK_DEFAULT, solver=solvers.SOLVER_DEFAULT, time_limit=None):
+    self.network = network
+    self.id_table = network.id_table()
+    self.min_sources = min_sources
+    self.min_targets = min_targets
+    self.flow = min_sources * min_targets
+    self.prune = prune
+    self.precheck = precheck
+    self.solver = solver
+    self.time_limit = time_limit
+    self.sources = set()
+    self.targets = set()
+    self._reset()
+
+  @classmethod
+  def load(cls, edges_file, min_sources, min_targets, cache_dir=None, dedupe=network_module.DEDUPE_DEFAULT, verbose=False, **kwargs):
+    """
+    Load the network of <edges_file> (see load_network) and return a FlowProblem over it; other
+    keyword arguments are passed to FlowProblem
+    """
+    network = load_network(edges_file, cache_dir=cache_dir, dedupe=dedupe, verbose=verbose)
+    return cls(network, min_sources, min_targets, **kwargs)
+
+  def _reset(self):
+    self.pruned = None
+    self.feasibility = None
+    self.G = None
+    self._terminal_arcs = False
+    self.solved = None
+    self.status = None
+
+  def set_terminals(self, sources, targets):
+    """
+    Set the source and target protein names; names not in the network are ignored. Any earlier
+    pruning, check or solver is discarded.
+    """
+    self.sources = set(sources)
+    self.targets = set(targets)
+    self._reset()
+
+  def prune_network(self):
+    if self.pruned is None:
+      self.pruned = prune_network(self.network, self.id_table, self.sources, self.targets, mode=self.prune)
+    return self.pruned
+
+  def check_feasibility(self):
+    """
+    Returns
+    -------
+    feasibility : flopro.feasibility.Feasibility or None
+      None if the precheck mode is 'none'
+    """
+    if self.precheck != 'none' and self.feasibility is None:
+      self.feasibility = precheck(self.prune_network(), self.id_table, self.sources, self.targets, self.min_sources, self.min_targets, mode=self.precheck)
+    return self.feasibility
+
+  def build_solver(self):
+    """
+    Add the arcs of the pruned network to a new solver
+    """
+    if self.G is None:
+      pruned = self.prune_network()
+      self.G = build_solver(pruned.tail, pruned.head, pruned.cost, self.flow, solver=self.solver)
+    return self.G
+
+  def add_sources_targets(self):
+    """
+    Add the arcs from the artificial source to the sources and from the targets to the
+    artificial target
+    """
+    G = self.build_solver()
+    if not self._terminal_arcs:
+      add_sources_targets(G, self.sources, self.targets, self.id_table, self.min_targets, self.min_sources)
+      self._terminal_arcs = True
+    return G
+
+  def solve(self):
+    """
+    Returns
+    -------
+    solved : bool
+      False if the check finds the problem infeasible, in which case the solver is not built, or
+      if the solver finds no optimal flow in time; self.status says which
+    """
+    feasibility = self.check_feasibility()
+    if feasibility is not None and not feasibility.feasible:
+      self.status = 'infeasible'
+    else:
+      G = self.add_sources_targets()
+      self.status = solve_flow(G, self.flow, self.id_table, time_limit=self.time_limit)
+    self.solved = self.status == 'optimal'
+    return self.solved
+
+  @property
+  def optimal_cost(self):
+    return self.G.OptimalCost() if self.solved else None
+
+  @property
+  def has_partial_result(self):
+    """
+    Whether the solver stopped at the time limit with part of the flow sent, which only the ssp
+    solver does
+    """
+    return self.status == 'timeout' and self.solver == 'ssp' and self.G.Flows().any()
+
+  def result(self, partial=False):
+    """
+    Parameters
+    ----------
+    partial : bool
+      if True, also return the flow sent before the time limit, see has_partial_result
+
+    Returns
+    -------
+    result : flopro.flow_result.FlowResult
+      arcs carrying flow, mapped back onto the edges of the network
+    """
+    if not self.solved and not (partial and self.has_partial_result):
+      raise ValueError('Flow problem has not been solved')
+    return flow_result(self.G, self.id_table, self.pruned)
+
+  def flow_curve(self):
+    """
+    Returns
+    -------
+    curve : flopro.flow_curve.FlowCurve
+      optimal cost and subnetwork for every flow value up to the total flow; the problem must
+      have been solved with the ssp solver
+    """
+    if not self.solved:
+      raise ValueError('Flow problem has not been solved')
+    return flow_curve_module.flow_curve(self.G, self.id_table, self.pruned)
+
+def solve_thresholds(network, thresholds, sources, targets, min_sources, min_targets, prune=prune_module.PRUNE_DEFAULT,
+    precheck=feasibility_module.PRECHECK_DEFAULT, solver=solvers.SOLVER_DEFAULT, time_limit=None, metrics=None):
+  '''
+  Solve the flow problem on the subnetworks of <network> with the edges at
+  or above each of the weight <thresholds>, from the tightest to the
+  loosest; see flopro.thresholds.  Connected components for the check are
+  updated with the edges added at each threshold, and a threshold whose
+  pruned problem is the same as that of the previous solved one reuses its
+  solution.
+
+  Parameters
+  ==========
+  metrics : flopro.metrics.Metrics or None
+    records phases named <phase>@<threshold>
+
+  Returns
+  =======
+  results : generator of flopro.thresholds.ThresholdResult
+    one per distinct threshold, tightest first
+  '''
+  if metrics is None:
+    metrics = metrics_module.Metrics()
+  sweep = thresholds_module.ThresholdSweep(network, thresholds)
+  id_table = network.id_table()
+  source_ids = id_table.ids(list(sources))
+  target_ids = id_table.ids(list(targets))
+  source_ids, target_ids = source_ids[source_ids >= 0], target_ids[target_ids >= 0]
+  labels = None
+  previous = None
+  for i, threshold in enumerate(sweep.thresholds):
+    record = thresholds_module.ThresholdResult(threshold, sweep.n_edges[i])
+    if previous is not None:
+      record.cost_upper_bound = previous.optimal_cost
+    if precheck != 'none':
+      with metrics.phase('precheck@{}'.format(threshold)):
+        added = sweep.added_edge_ids(i)
+        labels = feasibility_module.connected_components(id_table.n_nodes, network.tail[added], network.head[added], labels=labels)
+        record.feasibility = feasibility_module.check_feasibility(labels, source_ids, target_ids, min_sources, min_targets, mode=precheck)
+      if not record.feasibility.feasible:
+        record.status = 'infeasible'
+        yield record
+        continue
+    with metrics.phase('prune@{}'.format(threshold)):
+      problem = FlowProblem(sweep.subnetwork(i), min_sources, min_targets, prune=prune, precheck='none', solver=solver, time_limit=time_limit)
+      problem.set_terminals(sources, targets)
+      problem.prune_network()
+    if previous is not None and thresholds_module.same_problem(previous.problem.pruned, problem.pruned):
+      record.problem = previous.problem
+      record.reused_from = previous.threshold
+    else:
+      with metrics.phase('solve@{}'.format(threshold)):
+        problem.solve()
+      record.problem = problem
+    record.solved = record.problem.solved
+    record.status = record.problem.status
+    record.optimal_cost = record.problem.optimal_cost
+    if record.solved:
+      previous = record
+    yield record
+
+def run_thresholds(args, network, sources, targets, metrics):
+  ''' Solve the flow problem at each of --weight-thresholds and write the
+  flow outputs of each to a threshold_<threshold> directory in --outdir,
+  and a summary of all of them to threshold_sweep.tsv.  Returns the
+  number of thresholds solved.
+  '''
+  flow = args.min_sources * args.min_targets
+  n_solved = 0
+  with open(os.path.join(args.outdir, 'threshold_sweep.tsv'), 'w') as fh:
+    fh.write('threshold\tn_edges\tfeasible\tstatus\toptimal_cost\tcost_upper_bound\treused_from\toutdir\n')
+    results = solve_thresholds(network, args.weight_thresholds, sources, targets, args.min_sources, args.min_targets,
+      prune=args.prune, precheck=args.precheck, solver=args.solver, time_limit=args.time_limit, metrics=metrics)
+    for record in results:
+      outdir = 'NA'
+      if record.solved:
+        n_solved += 1
+        outdir = os.path.join(args.outdir, 'threshold_{}'.format(record.threshold))
+        if not os.path.exists(outdir):
+          os.mkdir(outdir)
+        with metrics.phase('write@{}'.format(record.threshold)):
+          result = record.problem.result()
+          write_flow_result(result.to_networkx(), outdir, flow, network, weight_threshold=record.threshold)
+          flow_paths.decompose_paths(result).write(outdir)
+      feasible = 'NA' if record.feasibility is None else record.feasibility.feasible
+      fh.write('\t'.join(map(str, [record.threshold, record.n_edges, feasible, record.status, record.optimal_cost,
+        record.cost_upper_bound, record.reused_from, outdir])).replace('None', 'NA') + '\n')
+      print('weight threshold {}: {} edges, {}'.format(record.threshold, record.n_edges,
+        'optimal cost {}'.format(record.optimal_cost) if record.solved else record.status))
+  metrics.set('n_thresholds_solved', n_solved)
+  return n_solved
+
+def run(args):
+  ''' Parse a weighted edge list, source list, and target list.  Run
+  min cost flow or k-shortest paths on the graph to find source-target
+  paths.  Write the solutions to a file.
+  '''
+  flow = args.min_sources * args.min_targets
+  if (args.flow_curve or args.anytime) and args.solver != 'ssp':
+    # the curve is read from the augmenting paths of the ssp solver, which is also the only one
+    # that has a partial flow when it runs out of time
+    args.solver = 'ssp'
+
+  metrics = metrics_module.Metrics(verbose=args.verbose)
+  if args.from_flow_result:
+    # render the flow graph an earlier --flow-only run solved, without solving it again
+    import networkx as nx
+    with metrics.phase('parse'):
+      sources = read_sources(args.sources_file, sim_index=args.sim_index)
+      targets = parse_nodes(args.targets_file)
+      H = nx.read_graphml(os.path.join(args.outdir, 'flow_result.graphml'))
+    render_flow_result(args, H, sources, targets, metrics)
+    write_metrics(metrics, args, fn='flow_render_metrics.json')
+    return
+  metrics.set('solver', args.solver)
+  metrics.set('prune', args.prune)
+  metrics.set('flow', flow)
+
+  # rescale flow/capacity if optional arguments are present
+  with metrics.phase('parse'):
+    sources = read_sources(args.sources_file, sim_index=args.sim_index)
+    targets = parse_nodes(args.targets_file)
+    network = load_network(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe, verbose=args.verbose)
+    problem = FlowProblem(network, args.min_sources, args.min_targets, prune=args.prune, precheck=args.precheck, solver=args.solver, time_limit=args.time_limit)
+    problem.set_terminals(sources, targets)
+  metrics.set('network_version', network.version)
+  metrics.set('n_network_nodes', network.n_nodes)
+  metrics.set('n_network_edges', network.n_edges)
+
+  if args.weight_thresholds is not None:
+    n_solved = run_thresholds(args, network, sources, targets, metrics)
+    write_metrics(metrics, args)
+    if n_solved == 0:
+      sys.stderr.write('Could not solve at any weight threshold\n')
+      sys.exit(0 if args.no_exit_on_fail else EXIT_SOLVE_FAILED)
+    return
+  with metrics.phase('prune'):
+    pruned = problem.prune_network()
+  metrics.set('prune_stats', pruned.stats)
+  if args.precheck != 'none':
+    with metrics.phase('precheck'):
+      feasibility = problem.check_feasibility()
+    metrics.set('feasibility', feasibility.to_dict())
+    print(feasibility.summary(args.min_sources, args.min_targets))
+    if not feasibility.feasible:
+      metrics.set('solved', False)
+      metrics.set('status', 'infeasible')
+      write_metrics(metrics, args)
+      append_sim_result(args, network, 'infeasible', metrics)
+      sys.stderr.write('Infeasible: {}\n'.format(feasibility.summary(args.min_sources, args.min_targets)))
+      if args.no_exit_on_fail:
+        sys.exit(0)
+      else:
+        sys.exit(EXIT_INFEASIBLE)
+  with metrics.phase('construct'):
+    problem.build_solver()
+  with metrics.phase('add_sources_targets'):
+    G = problem.add_sources_targets()
+  metrics.set('n_solver_nodes', G.NumNodes())
+  metrics.set('n_solver_arcs', G.NumArcs())
+
+  # update state of G with the solution
+  with metrics.phase('solve'):
+    solved = problem.solve()
+  metrics.set('solved', solved)
+  metrics.set('status', problem.status)
+
+  if not solved:
+    H = None
+    if problem.status == 'timeout' and args.anytime and problem.has_partial_result:
+      # write the optimal flow of the amount sent before the time ran out
+      with metrics.phase('write_partial'):
+        result = problem.result(partial=True)
+        sent = int(result.flows[result.tails == problem.id_table.source_id].sum())
+        H = result.to_networkx()
+        write_flow_result(H, args.outdir, sent, network, status=problem.status)
+        flow_paths.decompose_paths(result).write(args.outdir)
+      metrics.set('flow_sent', sent)
+      metrics.set('partial_cost', problem.G.OptimalCost())
+    write_metrics(metrics, args)
+    append_sim_result(args, network, problem.status, metrics, H=H)
+    if problem.status == 'timeout':
+      sys.stderr.write('Timed out after {} seconds\n'.format(args.time_limit))
+    elif problem.status == 'infeasible':
+      sys.stderr.write('Infeasible\n')
+    else:
+      sys.stderr.write('Could not solve\n')
+    if args.no_exit_on_fail:
+      sys.exit(0)
+    else:
+      sys.exit(exit_status([problem.status]))
+  metrics.set('optimal_cost', problem.optimal_cost)
+
+  with metrics.phase('extract'):
+    result = problem.result()
+    H = result.to_networkx()
+  metrics.set('n_flow_edges', int(result.is_network_edge.sum()))
+  metrics.set('n_flow_nodes', H.number_of_nodes())
+
+  # write flow result graphml and flow_meta.tsv
+  with metrics.phase('write_graphml'):
+    write_flow_result(H, args.outdir, flow, network)
+    append_sim_result(args, network, problem.status, metrics, cost=problem.optimal_cost, H=H)
+
+  # write the source -> target paths of the flow and per-source and per-target summaries
+  with metrics.phase('decompose'):
+    decomposition = flow_paths.decompose_paths(result)
+    decomposition.write(args.outdir)
+  metrics.set('n_flow_paths', len(decomposition.paths))
+
+  # write the optimal cost and the edges added and removed for every flow value up to <flow>
+  if args.flow_curve:
+    with metrics.phase('flow_curve'):
+      problem.flow_curve().write(args.outdir)
+
+  if not args.flow_only:
+    render_flow_result(args, H, sources, targets, metrics)
+
+  write_metrics(metrics, args)
+
+def render_flow_result(args, H, sources, targets, metrics):
+  ''' Perform GSEA on the connected components of the flow graph <H> and
+  render it and its enrichments to --outdir.
+  '''
+  flow_outfile = os.path.join(args.outdir, 'flow_result.gv')
+  comp_enrich_map_outfile = os.path.join(args.outdir, 'comp_enrich_map.txt')
+
+  # gprofiler and graphviz rendering are only needed from here on
+  from . import gsea
+  from . import plot
+
+  # perform GSEA on the connected components in the flow result graph
+  with metrics.phase('gsea'):
+    enrich_dir = os.path.join(args.outdir, 'enrich')
+    if not os.path.exists(enrich_dir):
+      os.mkdir(enrich_dir)
+    set_fp_pairs = gsea.gsea_connected_components(H, enrich_dir)
+
+    # document which component is associated with which enrichment result
+    # its a ragged csv where each line is a connected component
+    # the first column is the file path to the enrichment
+    # the 2..N-1 column is for gene 1, gene 2, ..., gene N in the connected component
+    with open(comp_enrich_map_outfile, 'w') as fh:
+      for gene_set, fp in set_fp_pairs:
+        fh.write(",".join([fp] + list(gene_set)) + "\n")
+
+  with metrics.phase('render'):
+    # write flow result graphviz
+    weights = None
+    if args.node_weights is not None:
+      # parse --node-weights
+      weights = {}
+      with open(args.node_weights, 'r') as fh:
+        for line in fh:
+          line = line.rstrip()
+          node, weight = line.split(',')
+          weights[node] = float(weight)
+    plot.vis_node_clusters_gv(H, open(flow_outfile, 'w'), sources, targets, weights=weights)
+
+    # write enrichment graphviz
+    if args.visualization == 'single':
+      plot.vis_single_community(H, sources, targets, set_fp_pairs, args)
+
+    elif args.visualization == 'multi':
+      enrich_fps = list(map(lambda x: x[1], set_fp_pairs))
+      plot.vis_multi_community(H, sources, targets, enrich_fps, args, weights=weights)
+
+def write_metrics(metrics, args, fn='flow_metrics.json'):
+  ''' Write the run's per-phase metrics to <fn> in the output directory and,
+  with --metrics-out, append them to that file as a JSON line.
+  '''
+  metrics.write_json(os.path.join(args.outdir, fn))
+  if args.metrics_out is not None:
+    metrics.append_jsonl(args.metrics_out, outdir=args.outdir, sources_file=args.sources_file, targets_file=args.targets_file)
+
+def append_sim_result(args, network, status, metrics, cost=None, H=None):
+  ''' With --sim-results, append the status, optimal cost, metrics and flow
+  graph <H> of this run to that store (see flopro.sim_results), numbered by
+  --sim-index.
+  '''
+  if args.sim_results is None:
+    return
+  from . import sim_results
+  store = sim_results.ResultStore.for_network(args.sim_results, network)
+  nodes, edges = ((), ()) if H is None else (H.nodes(), H.edges(data='flow'))
+  store.append_result(-1 if args.sim_index is None else args.sim_index, status, cost, nodes, edges, metrics.to_dict())
+
+def add_flow_args(parser):
+  parser.add_argument('--mapping-file')
+  add_network_args(parser)
+  parser.add_argument('--sources-file',
+                      help='source node file path',
+                      type=str,
+                      required=True)
+  parser.add_argument('--sim-index',
+                      help='read the sources of this simulation from --sources-file, a sample matrix written by flow_sim_screens.py (see flopro.sim_samples)',
+                      type=int)
+  parser.add_argument('--targets-file',
+                      help='target node file path',
+                      type=str,
+                      required=True)
+  parser.add_argument('--outdir',
+                      help='Output directory',
+                      type=str,
+                      required=True)
+  parser.add_argument('--min-sources',
+                      help='Minimum number of sources that flow must pass through',
+                      type=int,
+                      required=True)
+  parser.add_argument('--min-targets',
+                      help='Minimum number of targets that flow must pass through',
+                      type=int,
+                      required=True)
+  parser.add_argument('--node-weights',
+                      help='csv file with lines as <node>,<weight> where smaller weights result in larger nodes')
+  parser.add_argument('--verbose', '-v',
+                      help='if set, produce verbose output',
+                      action='store_true')
+  parser.add_argument('--no-exit-on-fail',
+                      help="If set, produce exit code zero even if min cost flow cannot be solved (useful for ignoring simulation failures)",
+                      action='store_true')
+  parser.add_argument('--metrics-out',
+                      help='append the per-phase metrics of this run, which are always written to flow_metrics.json in --outdir, to this file as one JSON line; many runs can share the file',
+                      type=str)
+  parser.add_argument('--sim-results',
+                      help='append the status, optimal cost, metrics and flow graph of this run, numbered by --sim-index, to this simulation result store, which flow_sim_frequency.py reads instead of flow_result.graphml (see flopro.sim_results)',
+                      type=str)
+  parser.add_argument('--flow-curve',
+                      help='also write the optimal cost and subnetwork for every amount of flow from 1 to min-sources * min-targets, from the same solve, to flow_curve.tsv and flow_curve_edges.tsv (see flopro.flow_curve); implies --solver ssp',
+                      action='store_true')
+  parser.add_argument('--anytime',
+                      help='if --time-limit runs out, still write the flow sent so far, which is the optimal flow of that amount, with its status in flow_meta.tsv; implies --solver ssp, since ortools has no partial solution',
+                      action='store_true')
+  parser.add_argument('--from-flow-result',
+                      help='do not solve; run GSEA and visualization on the flow_result.graphml that an earlier --flow-only run wrote to --outdir, for example to render it with --node-weights that were computed after it was solved. Metrics are written to flow_render_metrics.json',
+                      action='store_true')
+  parser.add_argument('--weight-thresholds',
+                      help='solve on the subnetworks of the edges with weight at least each of these values, from the highest to the lowest, instead of on the whole network; each solved threshold writes flow_result.graphml, flow_meta.tsv and the flow paths to threshold_<value> in --outdir, and threshold_sweep.tsv summarizes all of them. GSEA and visualization are not run (see flopro.thresholds)',
+                      type=float,
+                      nargs='+')
+  parser.add_argument('--visualization',
+                      help='Visualization style. One of "single" or "multi"; default "multi".',
+                      type=str,
+                      default='multi')
+  parser.add_argument("--image-format",
+                      help="Output image file format for network images: either \"png\" or \"svg\". Default \"svg\".",
+                      type=str,
+                      default='svg')
+
+def add_network_cache_args(parser):
+  """
+  Arguments that select the compiled network of --edges-file in the cache, for scripts that also
+  read the network, e.g. its node index (see flopro.node_index)
+  """
+  parser.add_argument('--network-cache-dir',
+                      help='directory of compiled networks built from --edges-file; default is $FLOPRO_CACHE_DIR or .flopro_cache next to --edges-file',
+                      type=str)
+  parser.add_argument('--dedupe',
+                      help='how to merge lines of --edges-file that repeat an interaction, in either direction: keep the max, mean or first weight, or none to keep every line; default max',
+                      choices=network_module.DEDUPE_POLICIES,
+                      default=network_module.DEDUPE_DEFAULT)
+
+def add_network_args(parser):
+  parser.add_argument('--edges-file',
+                      help='edge file path with weights in [0,1], or a compiled network directory (see flopro.network_diff)',
+                      type=str,
+                      required=True)
+  add_network_cache_args(parser)
+  parser.add_argument('--prune',
+                      help='before solving, remove nodes that cannot carry flow: none; dead-ends, which removes nodes not connected to both a source and a target and dead-end branches; or chains, which also contracts chains of degree 2 nodes. The optimal cost is unchanged. Default dead-ends',
+                      choices=prune_module.PRUNE_MODES,
+                      default=prune_module.PRUNE_DEFAULT)
+  parser.add_argument('--precheck',
+                      help='before building the solver, check that the flow can be routed: none; counts, which checks that enough sources and targets can reach each other; or maxflow, which computes the maximum flow from the connected components and is exact. An infeasible run exits with status {} (0 with --no-exit-on-fail) and reports the largest feasible --min-sources and --min-targets. Default maxflow'.format(EXIT_INFEASIBLE),
+                      choices=feasibility_module.PRECHECK_MODES,
+                      default=feasibility_module.PRECHECK_DEFAULT)
+  parser.add_argument('--solver',
+                      help='min-cost flow solver: ortools, or ssp, successive shortest paths, which is faster when min-sources * min-targets is small; both find the same optimal cost (see flopro.solvers). Default ortools',
+                      choices=solvers.SOLVERS,
+                      default=solvers.SOLVER_DEFAULT)
+  parser.add_argument('--time-limit',
+                      help='seconds the solver may run for each flow problem; a run that times out exits with status {} (0 with --no-exit-on-fail) and is recorded with status timeout. ortools then solves in a child process that is killed at the limit (see flopro.solvers)'.format(EXIT_TIMEOUT),
+                      type=float)
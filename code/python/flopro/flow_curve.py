@@ -0,0 +1,172 @@
+"""
+Optimal cost and subnetwork for every amount of flow up to the total, from one solve
+
+The ssp solver (see flopro.solvers) sends flow from the artificial source to the artificial
+target along shortest paths of the residual network, one path at a time. After any number f of
+units has been sent the flow is a minimum-cost flow of f units with the same capacities, so the
+sequence of paths found while solving for the total flow F gives the optimal cost and the
+optimal subnetwork for every f from 1 to F. A path of unit cost c that carries a units raises the
+cost by c for each of the a units; the arcs it starts using appear with its first unit and arcs
+whose flow it cancels disappear with its last.
+
+The capacities stay those of the run: each source sends at most --min-targets units and each
+target receives at most --min-sources units. n_sources and n_targets at each flow value show how
+many sources and targets the optimal flow of that amount uses.
+"""
+import os.path
+
+CURVE_FN = 'flow_curve.tsv'
+EDGES_FN = 'flow_curve_edges.tsv'
+
+class FlowCurve(object):
+  """
+  Attributes, one entry per flow value 1, 2, ..., F
+  -------------------------------------------------
+  costs : list of int
+    optimal cost
+
+  marginal_costs : list of int
+    cost of the last unit
+
+  n_edges, n_nodes : list of int
+    network edges, counted in each direction, and network nodes carrying flow
+
+  n_sources, n_targets : list of int
+    sources and targets carrying flow
+
+  added, removed : list of list of (str, str)
+    network edges that start or stop carrying flow at that value
+  """
+  def __init__(self):
+    self.costs = []
+    self.marginal_costs = []
+    self.n_edges = []
+    self.n_nodes = []
+    self.n_sources = []
+    self.n_targets = []
+    self.added = []
+    self.removed = []
+
+  @property
+  def max_flow(self):
+    return len(self.costs)
+
+  def edges(self, flow):
+    """
+    Returns
+    -------
+    edges : set of (str, str)
+      network edges carrying flow in the optimal flow of <flow> units
+    """
+    if flow < 1 or flow > self.max_flow:
+      raise ValueError('Flow value {} is not between 1 and {}'.format(flow, self.max_flow))
+    rv = set()
+    for added, removed in zip(self.added[:flow], self.removed[:flow]):
+      rv.update(added)
+      rv.difference_update(removed)
+    return rv
+
+  def write(self, outdir):
+    """
+    Write the curve to CURVE_FN and the edges added and removed at each flow value to EDGES_FN in
+    <outdir>
+    """
+    with open(os.path.join(outdir, CURVE_FN), 'w') as fh:
+      fh.write('flow\tcost\tmarginal_cost\tn_edges\tn_nodes\tn_sources\tn_targets\tn_added\tn_removed\n')
+      for i in range(self.max_flow):
+        fh.write('{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(i + 1, self.costs[i], self.marginal_costs[i], self.n_edges[i], self.n_nodes[i],
+          self.n_sources[i], self.n_targets[i], len(self.added[i]), len(self.removed[i])))
+    with open(os.path.join(outdir, EDGES_FN), 'w') as fh:
+      fh.write('flow\tchange\ttail\thead\n')
+      for i in range(self.max_flow):
+        for change, edges in (('+', self.added[i]), ('-', self.removed[i])):
+          for tail, head in edges:
+            fh.write('{}\t{}\t{}\t{}\n'.format(i + 1, change, tail, head))
+
+def flow_curve(G, id_table, pruned=None):
+  """
+  Parameters
+  ----------
+  G : flopro.solvers.SspSolver
+    solved graph with the artificial source and target of flow.py
+
+  id_table : flopro.id_table.IdTable
+
+  pruned : flopro.prune.PrunedNetwork or None
+    if <G> was built from <pruned>, contracted chains are mapped back onto the original edges
+
+  Returns
+  -------
+  curve : FlowCurve
+  """
+  if not hasattr(G, 'Augmentations'):
+    raise ValueError('The flow curve needs the augmentations of the ssp solver')
+  n_nodes = id_table.n_nodes
+  # network edges and nodes of each solver arc, which are several for a contracted chain
+  arc_edges = {}
+  def edges_of(arc):
+    if arc not in arc_edges:
+      tail, head = G.Tail(arc), G.Head(arc)
+      if pruned is not None:
+        tails, heads, flows = pruned.expand([arc], [tail], [head], [0])
+      else:
+        tails, heads = [tail], [head]
+      edges = [(t, h) for t, h in zip(tails, heads) if t < n_nodes and h < n_nodes]
+      nodes = sorted(set(node for node in tails + heads if node < n_nodes))
+      arc_edges[arc] = (edges, nodes)
+    return arc_edges[arc]
+
+  arc_flow = {}
+  # number of solver arcs with flow covering each network edge and each network node
+  edge_count = {}
+  node_count = {}
+  n_sources = 0
+  n_targets = 0
+  curve = FlowCurve()
+  cost = 0
+
+  def use(arc, step, changed):
+    nonlocal n_sources, n_targets
+    tail, head = G.Tail(arc), G.Head(arc)
+    if tail == id_table.source_id:
+      n_sources += step
+    if head == id_table.target_id:
+      n_targets += step
+    edges, nodes = edges_of(arc)
+    for node in nodes:
+      node_count[node] = node_count.get(node, 0) + step
+      if node_count[node] == 0:
+        del node_count[node]
+    for edge in edges:
+      edge_count[edge] = edge_count.get(edge, 0) + step
+      if edge_count[edge] == 0:
+        del edge_count[edge]
+        changed.append(edge)
+      elif step > 0 and edge_count[edge] == 1:
+        changed.append(edge)
+
+  for amount, unit_cost, arcs, directions in G.Augmentations():
+    for i in range(amount):
+      added = []
+      removed = []
+      for arc, direction in zip(arcs.tolist(), directions.tolist()):
+        old = arc_flow.get(arc, 0)
+        arc_flow[arc] = old + direction
+        if old == 0 and direction > 0:
+          use(arc, 1, added)
+        elif old == 1 and direction < 0:
+          use(arc, -1, removed)
+      # an edge may be cancelled on one arc and picked up on another along the same path
+      moved = set(added) & set(removed)
+      added = [edge for edge in added if edge not in moved]
+      removed = [edge for edge in removed if edge not in moved]
+      cost += unit_cost
+      curve.costs.append(cost)
+      curve.marginal_costs.append(unit_cost)
+      curve.n_edges.append(len(edge_count))
+      curve.n_nodes.append(len(node_count))
+      curve.n_sources.append(n_sources)
+      curve.n_targets.append(n_targets)
+      curve.added.append(list(zip(id_table.lookup([t for t, h in added]), id_table.lookup([h for t, h in added]))))
+      curve.removed.append(list(zip(id_table.lookup([t for t, h in removed]), id_table.lookup([h for t, h in removed]))))
+  return curve
@@ -0,0 +1,141 @@
+"""
+Decompose a flow into source -> ... -> target paths
+
+decompose_paths splits the flow of a FlowResult (see flopro.flow_result) into paths from the
+artificial source to the artificial target. Each path carries the largest flow that fits on all
+of its arcs, which is then removed from them, so there are at most as many paths as arcs. Flow
+around a cycle, which can only have zero cost in an optimal flow, is dropped. Per-source and
+per-target totals are accumulated while the paths are found.
+"""
+import os.path
+
+PATHS_FN = 'flow_paths.tsv'
+SOURCES_FN = 'flow_path_sources.tsv'
+TARGETS_FN = 'flow_path_targets.tsv'
+
+class PathDecomposition(object):
+  """
+  Attributes
+  ----------
+  paths : list of list of str
+    network nodes of each path, from a source protein to a target protein
+
+  flows : list of int
+    flow on each path
+
+  costs : list of int or None
+    cost of one unit of flow along each path, or None if the result has no arc costs
+
+  sources, targets : dict<str, dict>
+    for each source and target protein: flow, number of paths, total cost of the flow (flow
+    times unit cost, summed over paths) and the targets reached or the sources reaching it
+  """
+  def __init__(self):
+    self.paths = []
+    self.flows = []
+    self.costs = []
+    self.sources = {}
+    self.targets = {}
+
+  def _add(self, nodes, flow, cost):
+    self.paths.append(nodes)
+    self.flows.append(flow)
+    self.costs.append(cost)
+    source, target = nodes[0], nodes[-1]
+    for summary, node, other in ((self.sources, source, target), (self.targets, target, source)):
+      if node not in summary:
+        summary[node] = {'flow': 0, 'n_paths': 0, 'cost': 0 if cost is not None else None, 'reached': []}
+      record = summary[node]
+      record['flow'] += flow
+      record['n_paths'] += 1
+      if cost is not None:
+        record['cost'] += flow * cost
+      if other not in record['reached']:
+        record['reached'].append(other)
+
+  def write(self, outdir):
+    """
+    Write the paths to PATHS_FN and the per-source and per-target summaries to SOURCES_FN and
+    TARGETS_FN in <outdir>
+    """
+    with open(os.path.join(outdir, PATHS_FN), 'w') as fh:
+      fh.write('path\tsource\ttarget\tflow\tcost\tlength\tnodes\n')
+      for i, (nodes, flow, cost) in enumerate(zip(self.paths, self.flows, self.costs)):
+        fh.write('{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(i, nodes[0], nodes[-1], flow, 'NA' if cost is None else cost, len(nodes) - 1, ','.join(nodes)))
+    for fn, summary, column in ((SOURCES_FN, self.sources, 'targets'), (TARGETS_FN, self.targets, 'sources')):
+      with open(os.path.join(outdir, fn), 'w') as fh:
+        fh.write('node\tflow\tn_paths\tcost\tn_{}\t{}\n'.format(column, column))
+        for node, record in summary.items():
+          fh.write('{}\t{}\t{}\t{}\t{}\t{}\n'.format(node, record['flow'], record['n_paths'], 'NA' if record['cost'] is None else record['cost'],
+            len(record['reached']), ','.join(record['reached'])))
+
+def decompose_paths(result):
+  """
+  Parameters
+  ----------
+  result : flopro.flow_result.FlowResult
+    arcs carrying flow, including those from the artificial source and to the artificial target
+
+  Returns
+  -------
+  decomposition : PathDecomposition
+  """
+  id_table = result.id_table
+  source_id = id_table.source_id
+  target_id = id_table.target_id
+  tails = result.tails.tolist()
+  heads = result.heads.tolist()
+  remaining = result.flows.tolist()
+  costs = result.costs.tolist() if result.costs is not None else None
+
+  # arcs out of each node, in result order, and the position of the first that may have flow left
+  out_arcs = {}
+  for arc, tail in enumerate(tails):
+    out_arcs.setdefault(tail, []).append(arc)
+  next_arc = dict.fromkeys(out_arcs, 0)
+
+  def arc_out_of(node):
+    arcs = out_arcs.get(node, [])
+    i = next_arc.get(node, 0)
+    while i < len(arcs) and remaining[arcs[i]] <= 0:
+      i += 1
+    next_arc[node] = i
+    return arcs[i] if i < len(arcs) else None
+
+  decomposition = PathDecomposition()
+  while True:
+    arc = arc_out_of(source_id)
+    if arc is None:
+      break
+    nodes = [source_id]
+    position = {source_id: 0}
+    arcs = []
+    node = source_id
+    while node != target_id:
+      arc = arc_out_of(node)
+      if arc is None:
+        # flow is not conserved at <node>; stop rather than loop forever
+        raise ValueError('No outgoing flow at node {}'.format(id_table.lookup([node])[0]))
+      head = heads[arc]
+      if head in position:
+        # cancel the cycle back to <head>
+        cycle = arcs[position[head]:] + [arc]
+        amount = min(remaining[cycle_arc] for cycle_arc in cycle)
+        for cycle_arc in cycle:
+          remaining[cycle_arc] -= amount
+        for dropped in nodes[position[head] + 1:]:
+          del position[dropped]
+        del arcs[position[head]:]
+        del nodes[position[head] + 1:]
+        node = head
+        continue
+      arcs.append(arc)
+      nodes.append(head)
+      position[head] = len(nodes) - 1
+      node = head
+    amount = min(remaining[path_arc] for path_arc in arcs)
+    for path_arc in arcs:
+      remaining[path_arc] -= amount
+    cost = None if costs is None else sum(costs[path_arc] for path_arc in arcs)
+    decomposition._add(id_table.lookup(nodes[1:-1]), amount, cost)
+  return decomposition
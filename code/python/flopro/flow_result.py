@@ -0,0 +1,133 @@
+"""
+Arcs carrying flow in a solved flow problem
+
+FlowResult keeps the arcs of a solved flow problem that carry positive flow as arrays of node
+ids and flows. They are read from the solver in bulk (see flopro.solvers) rather than arc by
+arc, and are only converted to a networkx graph when to_networkx is called, which is also when
+networkx is imported.
+"""
+import numpy as np
+from .feasibility import connected_components
+from .id_table import SOURCE, TARGET
+
+class FlowResult(object):
+  """
+  Parameters
+  ----------
+  tails, heads : np.ndarray of int64
+    node ids of the arcs carrying flow; the artificial source and target have ids
+    id_table.source_id and id_table.target_id
+
+  flows : np.ndarray of int64
+
+  id_table : flopro.id_table.IdTable
+
+  costs : np.ndarray of int64 or None
+    unit cost of each arc
+  """
+  def __init__(self, tails, heads, flows, id_table, costs=None):
+    self.tails = np.asarray(tails, dtype=np.int64)
+    self.heads = np.asarray(heads, dtype=np.int64)
+    self.flows = np.asarray(flows, dtype=np.int64)
+    self.id_table = id_table
+    self.costs = None if costs is None else np.asarray(costs, dtype=np.int64)
+
+  @classmethod
+  def from_solver(cls, G, id_table, pruned=None):
+    """
+    Parameters
+    ----------
+    G : flopro.solvers.OrtoolsSolver or flopro.solvers.SspSolver
+      solved graph
+
+    id_table : flopro.id_table.IdTable
+
+    pruned : flopro.prune.PrunedNetwork or None
+      if <G> was built from <pruned>, flow on contracted chains is mapped back onto the original
+      edges
+    """
+    flows = G.Flows()
+    arc_ids = np.flatnonzero(flows > 0)
+    tails = [G.Tail(arc_id) for arc_id in arc_ids.tolist()]
+    heads = [G.Head(arc_id) for arc_id in arc_ids.tolist()]
+    costs = [G.UnitCost(arc_id) for arc_id in arc_ids.tolist()]
+    flows = flows[arc_ids].tolist()
+    if pruned is not None:
+      tails, heads, flows, costs = pruned.expand(arc_ids.tolist(), tails, heads, flows, costs)
+    return cls(tails, heads, flows, id_table, costs)
+
+  @property
+  def n_edges(self):
+    return len(self.tails)
+
+  @property
+  def is_network_edge(self):
+    """
+    Boolean mask of the arcs between two network nodes, that is, not from the artificial source
+    or to the artificial target
+    """
+    return (self.tails < self.id_table.n_nodes) & (self.heads < self.id_table.n_nodes)
+
+  def edges(self):
+    """
+    Returns
+    -------
+    edges : list of (str, str, int)
+      tail name, head name and flow of each arc, with the artificial nodes named "source" and
+      "target"
+    """
+    return list(zip(self.id_table.lookup(self.tails.tolist()), self.id_table.lookup(self.heads.tolist()), self.flows.tolist()))
+
+  def nodes(self):
+    """
+    Returns
+    -------
+    nodes : np.ndarray of int64
+      ids of the network nodes carrying flow, in order of first appearance
+    """
+    ids = np.stack((self.tails, self.heads), axis=1).ravel()
+    ids = ids[ids < self.id_table.n_nodes]
+    ids, first = np.unique(ids, return_index=True)
+    return ids[np.argsort(first, kind='stable')]
+
+  def component_labels(self):
+    """
+    Returns
+    -------
+    labels : np.ndarray of int64
+      connected component of each of nodes(), ignoring arc directions and the artificial source
+      and target; components are numbered 0, 1, ... in order of first appearance
+    """
+    nodes = self.nodes()
+    if len(nodes) == 0:
+      return np.zeros(0, dtype=np.int64)
+    order = np.argsort(nodes)
+    mask = self.is_network_edge
+    u = order[np.searchsorted(nodes[order], self.tails[mask])]
+    v = order[np.searchsorted(nodes[order], self.heads[mask])]
+    # nodes are in order of first appearance, so the smallest index in each component does too
+    labels = connected_components(len(nodes), u, v)
+    return np.unique(labels, return_inverse=True)[1].astype(np.int64)
+
+  def to_networkx(self, terminals=False):
+    """
+    Parameters
+    ----------
+    terminals : bool
+      if False, the artificial source and target nodes are left out of the graph; network nodes
+      whose only flow comes from the source and goes to the target remain as isolated nodes
+
+    Returns
+    -------
+    H : nx.DiGraph
+      graph of the arcs carrying flow, with a flow edge attribute
+    """
+    import networkx as nx
+    H = nx.DiGraph()
+    for node1, node2, flow in self.edges():
+      H.add_edge(node1, node2, **{'flow': flow})
+    if not terminals:
+      for node in (SOURCE, TARGET):
+        if node in H:
+          H.remove_node(node)
+    return H
@@ -0,0 +1,101 @@
+"""
+Node identifier table shared by the flow solver and its result writers
+
+Node names are kept as the fixed-width byte array of a compiled network (see flopro.network),
+indexed by node id, rather than as a dict of Python strings. The same array is the id -> name
+mapping; name -> id lookups are vectorized binary searches over a sorted permutation of it.
+When the network is memory-mapped the table does not copy the names.
+
+The flow problem adds two artificial nodes after the network nodes, "source" and "target". They
+are not in the table; their ids are IdTable.source_id and IdTable.target_id.
+"""
+import numpy as np
+
+SOURCE = 'source'
+TARGET = 'target'
+
+class IdTable(object):
+  """
+  Parameters
+  ----------
+  names : np.ndarray of bytes
+    node names indexed by node id
+
+  order, sorted_names : np.ndarray or None
+    the stable argsort of <names> and the names in that order, if already known, e.g. from the
+    name index of flopro.network_diff; they are computed if None
+  """
+  def __init__(self, names, order=None, sorted_names=None):
+    self.names = names
+    self._order = np.argsort(names, kind='stable') if order is None else order
+    self._sorted = names[self._order] if sorted_names is None else sorted_names
+
+  @property
+  def n_nodes(self):
+    return len(self.names)
+
+  @property
+  def source_id(self):
+    return self.n_nodes
+
+  @property
+  def target_id(self):
+    return self.n_nodes + 1
+
+  def __len__(self):
+    return self.n_nodes
+
+  def __contains__(self, name):
+    return self.ids([name])[0] >= 0
+
+  def ids(self, names):
+    """
+    Parameters
+    ----------
+    names : iterable of str
+
+    Returns
+    -------
+    ids : np.ndarray of int64
+      node id of each name, or -1 for names that are not in the network
+    """
+    query = np.array([name.encode() for name in names], dtype=np.bytes_)
+    if len(query) == 0 or self.n_nodes == 0:
+      return np.full(len(query), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(self._sorted, query), self.n_nodes - 1)
+    found = self._sorted[pos] == query
+    return np.where(found, self._order[pos], -1).astype(np.int64)
+
+  def id(self, name):
+    """
+    Raises
+    ------
+    KeyError
+      if <name> is not in the network
+    """
+    node_id = int(self.ids([name])[0])
+    if node_id < 0:
+      raise KeyError(name)
+    return node_id
+
+  def name(self, node_id):
+    return self.lookup([node_id])[0]
+
+  def lookup(self, ids):
+    """
+    Parameters
+    ----------
+    ids : array-like of int
+      network node ids, source_id or target_id
+
+    Returns
+    -------
+    names : list of str
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    rv = np.empty(len(ids), dtype=object)
+    real = ids < self.n_nodes
+    rv[real] = np.char.decode(self.names[ids[real]], 'utf-8')
+    rv[ids == self.source_id] = SOURCE
+    rv[ids == self.target_id] = TARGET
+    return rv.tolist()
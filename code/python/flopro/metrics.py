@@ -0,0 +1,100 @@
+"""
+Per-phase timing and resource metrics for scripts
+
+Metrics records, for each named phase of a run, the wall time, the CPU time of the process and
+the peak resident set size of the process at the end of the phase, along with any other
+statistics the script sets. Peak RSS is the high-water mark of the whole process so far, so the
+phase in which it first rises is the one that allocated the memory. It is read from
+resource.getrusage and is None where that module is unavailable.
+"""
+import sys
+import os
+import json
+import time
+import contextlib
+try:
+  import resource
+except ImportError:
+  resource = None
+
+def peak_rss():
+  """
+  Returns
+  -------
+  rss : int or None
+    peak resident set size of this process in bytes
+  """
+  if resource is None:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, macOS bytes
+  if sys.platform != 'darwin':
+    rss *= 1024
+  return rss
+
+class Metrics(object):
+  """
+  Parameters
+  ----------
+  verbose : bool
+    if True, print each phase's metrics when it ends
+  """
+  def __init__(self, verbose=False):
+    self.verbose = verbose
+    self.phases = []
+    self.stats = {}
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    """
+    Context manager recording the metrics of the phase <name>; a phase that raises is recorded
+    too
+    """
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+      yield
+    finally:
+      record = {
+        'phase': name,
+        'wall_s': time.perf_counter() - wall,
+        'cpu_s': time.process_time() - cpu,
+        'peak_rss_bytes': peak_rss()
+      }
+      self.phases.append(record)
+      if self.verbose:
+        rss = record['peak_rss_bytes']
+        sys.stdout.write('[metrics] {}: wall {:.3f}s, cpu {:.3f}s, peak rss {}\n'.format(name, record['wall_s'], record['cpu_s'],
+          'NA' if rss is None else '{:.1f} MB'.format(rss / 2**20)))
+        sys.stdout.flush()
+
+  def set(self, key, value):
+    self.stats[key] = value
+
+  def to_dict(self):
+    return {
+      'stats': self.stats,
+      'phases': self.phases,
+      'wall_s': sum(record['wall_s'] for record in self.phases),
+      'cpu_s': sum(record['cpu_s'] for record in self.phases),
+      'peak_rss_bytes': peak_rss()
+    }
+
+  def write_json(self, fp):
+    with open(fp, 'w') as fh:
+      json.dump(self.to_dict(), fh, indent=2, sort_keys=True)
+      fh.write('\n')
+
+  def append_jsonl(self, fp, **fields):
+    """
+    Append the metrics and <fields> to <fp> as one JSON line. The line is written with a single
+    write to a file opened for appending, so many processes can append to the same file.
+    """
+    record = dict(fields)
+    record.update(self.to_dict())
+    line = (json.dumps(record, sort_keys=True) + '\n').encode('utf-8')
+    fd = os.open(fp, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+      os.write(fd, line)
+    finally:
+      os.close(fd)
@@ -0,0 +1,404 @@
+"""
+Compiled on-disk representation of an ABC network (see flopro.parsers.abc)
+
+Parsing the multi-million line STRING edges file dominates the start-up time of flow.py and the
+simulation scripts. A compiled network stores the parsed edges as flat arrays:
+
+  names.npy   node names as fixed-width bytes, indexed by node id (first appearance order)
+  tail.npy    int32 node id of the first node on each line
+  head.npy    int32 node id of the second node on each line
+  weight.npy  float64 edge weight as given in the ABC file
+  cost.npy    int64 integer edge cost after applying a cost transform to the weight
+  manifest.json
+
+The arrays are memory-mapped on load, so opening a compiled network costs milliseconds.
+load_network maintains a cache of compiled networks keyed by a content hash of the source file,
+the name of the cost transform and the duplicate edge policy; the cache entry is rebuilt
+whenever the source file changes.
+
+A compiled network may be updated in place with an edge diff (see flopro.network_diff); its
+manifest then names a delta file and counts revisions. The first open of each delta merges it
+into the arrays and saves the result as a compiled network of its own in a subdirectory named
+after the delta, delta-<revision>.merged, which later opens memory-map like the base arrays.
+
+STRING lists each interaction in both directions (A B w and B A w). Unless the dedupe policy is
+'none', a compiled network has one edge per undirected interaction: repeated and reversed lines
+are merged into the first of them, whose weight is set according to the policy (see
+dedupe_edges).
+"""
+import os, os.path
+import sys
+import json
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+from . import SimPathException
+from .id_table import IdTable
+from .parsers.abc import read_abc_arrays
+
+FORMAT_VERSION = 1
+MANIFEST_FN = 'manifest.json'
+ARRAY_NAMES = ['names', 'tail', 'head', 'weight', 'cost']
+CACHE_DIR_ENV = 'FLOPRO_CACHE_DIR'
+CACHE_DIR_DEFAULT = '.flopro_cache'
+
+def cost_linear100(weights):
+  """
+  Google's solver can only handle int weights: map a weight in [0,1] to an integer cost in
+  [0,100] where larger weights (stronger evidence) have lower cost
+  """
+  return ((1 - weights) * 100).astype(np.int64)
+
+COST_TRANSFORMS = {
+  'linear100': cost_linear100
+}
+
+# how to combine the weights of lines that describe the same undirected edge
+DEDUPE_POLICIES = ['max', 'mean', 'first', 'none']
+DEDUPE_DEFAULT = 'max'
+
+class NetworkCacheException(SimPathException):
+  pass
+
+def dedupe_edges(tail, head, weight, policy=DEDUPE_DEFAULT):
+  """
+  Merge edges with the same endpoints, in either direction, into one edge
+
+  Parameters
+  ----------
+  tail, head : np.ndarray of int
+
+  weight : np.ndarray of float
+
+  policy : str
+    weight of a merged edge: 'max' (the least costly), 'mean' or 'first' weight of its lines;
+    'none' keeps every edge
+
+  Returns
+  -------
+  tail, head, weight : np.ndarray
+    distinct edges in order of their first line, in the orientation of that line
+
+  n_dropped : int
+    number of duplicate edges removed
+  """
+  if policy not in DEDUPE_POLICIES:
+    raise NetworkCacheException('Unknown dedupe policy "{}"; must be one of {}'.format(policy, ', '.join(DEDUPE_POLICIES)))
+  if policy == 'none' or len(tail) == 0:
+    return tail, head, weight, 0
+  tail64 = np.asarray(tail, dtype=np.int64)
+  head64 = np.asarray(head, dtype=np.int64)
+  base = int(max(tail64.max(), head64.max())) + 1
+  keys = np.minimum(tail64, head64) * base + np.maximum(tail64, head64)
+  # stable sort so the first line of each edge leads its group
+  order = np.argsort(keys, kind='stable')
+  sorted_keys = keys[order]
+  group_starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+  first = order[group_starts]
+  if policy == 'first':
+    merged = weight[first]
+  elif policy == 'max':
+    merged = np.maximum.reduceat(weight[order], group_starts)
+  else:
+    counts = np.diff(np.append(group_starts, len(order)))
+    merged = np.add.reduceat(weight[order], group_starts) / counts
+  file_order = np.argsort(first)
+  first = first[file_order]
+  return tail[first], head[first], merged[file_order], len(tail) - len(first)
+
+def file_digest(fp, block_size=1 << 20):
+  """
+  Returns
+  -------
+  digest : str
+    hex sha256 of the contents of <fp>
+  """
+  hash_obj = hashlib.sha256()
+  with open(fp, 'rb') as fh:
+    while True:
+      block = fh.read(block_size)
+      if not block:
+        break
+      hash_obj.update(block)
+  return hash_obj.hexdigest()
+
+class CompiledNetwork(object):
+  """
+  Node name table and edge arrays of a network; see module docstring
+  """
+  def __init__(self, names, tail, head, weight, cost, manifest=None):
+    self.names = names
+    self.tail = tail
+    self.head = head
+    self.weight = weight
+    self.cost = cost
+    self.manifest = manifest if manifest is not None else {}
+
+  @property
+  def n_nodes(self):
+    return len(self.names)
+
+  @property
+  def n_edges(self):
+    return len(self.tail)
+
+  @property
+  def revision(self):
+    """
+    Number of edge diffs applied to the network since it was compiled
+    """
+    return self.manifest.get('revision', 0)
+
+  @property
+  def version(self):
+    """
+    Identifier of the network contents: <network id>:r<revision> where the network id is the
+    content hash of the abc file it was compiled from, if known
+    """
+    network_id = self.manifest.get('network_id') or self.manifest.get('source_sha256', 'unknown')[:16]
+    return '{}:r{}'.format(network_id, self.revision)
+
+  def node_names(self):
+    """
+    Returns
+    -------
+    names : list of str
+      node names indexed by node id
+    """
+    return np.char.decode(self.names, 'utf-8').tolist()
+
+  def id_table(self):
+    """
+    Returns
+    -------
+    id_table : flopro.id_table.IdTable
+      name <-> id lookup sharing this network's name array
+    """
+    return IdTable(self.names)
+
+  @classmethod
+  def from_arrays(cls, names, tail, head, weight, cost_transform='linear100', dedupe=DEDUPE_DEFAULT):
+    """
+    Build a network from parsed abc lines; see read_abc_arrays and dedupe_edges
+    """
+    if cost_transform not in COST_TRANSFORMS:
+      raise NetworkCacheException('Unknown cost transform "{}"; must be one of {}'.format(cost_transform, ', '.join(sorted(COST_TRANSFORMS))))
+    tail, head, weight, n_duplicates = dedupe_edges(tail, head, weight, policy=dedupe)
+    names = np.array([name.encode() for name in names], dtype=np.bytes_)
+    cost = COST_TRANSFORMS[cost_transform](weight)
+    manifest = {
+      'format_version': FORMAT_VERSION,
+      'cost_transform': cost_transform,
+      'dedupe': dedupe,
+      'n_duplicates': n_duplicates,
+      'n_nodes': len(names),
+      'n_edges': len(tail),
+      'revision': 0
+    }
+    return cls(names, tail, head, weight, cost, manifest)
+
+  def save(self, outdir):
+    """
+    Write the network to the directory <outdir>, which must not already contain a network
+    """
+    for array_name in ARRAY_NAMES:
+      np.save(os.path.join(outdir, array_name + '.npy'), getattr(self, array_name))
+    # write manifest last: a directory with a manifest is a complete network
+    with open(os.path.join(outdir, MANIFEST_FN), 'w') as fh:
+      json.dump(self.manifest, fh, indent=2, sort_keys=True)
+
+  @classmethod
+  def open(cls, indir, mmap_mode='r'):
+    """
+    Open a network previously written by save. Arrays are memory-mapped according to
+    <mmap_mode> (see numpy.load); use mmap_mode=None to read them into memory.
+    """
+    manifest_fp = os.path.join(indir, MANIFEST_FN)
+    if not os.path.exists(manifest_fp):
+      raise NetworkCacheException('Not a compiled network: {}'.format(indir))
+    with open(manifest_fp) as fh:
+      manifest = json.load(fh)
+    if manifest.get('format_version') != FORMAT_VERSION:
+      raise NetworkCacheException('Compiled network {} has format version {}, expected {}'.format(indir, manifest.get('format_version'), FORMAT_VERSION))
+    if manifest.get('delta') is not None and mmap_mode is not None:
+      merged_dir = os.path.join(indir, merged_dir_name(manifest['delta']))
+      if not os.path.exists(os.path.join(merged_dir, MANIFEST_FN)):
+        network = cls.open(indir, mmap_mode=None)
+        try:
+          write_network(cls(network.names, network.tail, network.head, network.weight, network.cost, {'format_version': FORMAT_VERSION}), merged_dir)
+        except OSError as e:
+          sys.stderr.write('[warning] could not save the merged network {}: {}\n'.format(merged_dir, e))
+          return network
+      merged = cls.open(merged_dir, mmap_mode=mmap_mode)
+      merged.manifest = manifest
+      return merged
+    arrays = {}
+    for array_name in ARRAY_NAMES:
+      arrays[array_name] = np.load(os.path.join(indir, array_name + '.npy'), mmap_mode=mmap_mode)
+    if manifest.get('delta') is not None:
+      with np.load(os.path.join(indir, manifest['delta'])) as delta:
+        arrays = merge_delta(arrays, delta)
+    return cls(manifest=manifest, **arrays)
+
+def merged_dir_name(delta_fn):
+  """
+  Name of the subdirectory of a compiled network holding its arrays merged with the delta file
+  <delta_fn>
+  """
+  return os.path.splitext(delta_fn)[0] + '.merged'
+
+def merge_delta(arrays, delta):
+  """
+  Apply the delta of flopro.network_diff to base network arrays. Edge indices in the delta refer
+  to the base edges followed by the added edges.
+
+  Parameters
+  ----------
+  arrays : dict<str, np.ndarray>
+    keyed by ARRAY_NAMES
+
+  delta : mapping<str, np.ndarray>
+    names, tail, head, weight and cost of added nodes and edges; removed edge indices; and
+    reweighted edge indices with their new weight and cost
+
+  Returns
+  -------
+  arrays : dict<str, np.ndarray>
+  """
+  rv = {}
+  for array_name in ARRAY_NAMES:
+    rv[array_name] = np.concatenate((arrays[array_name], delta[array_name]))
+  reweighted = delta['reweighted']
+  if len(reweighted) > 0:
+    rv['weight'][reweighted] = delta['reweighted_weight']
+    rv['cost'][reweighted] = delta['reweighted_cost']
+  removed = delta['removed']
+  if len(removed) > 0:
+    keep = np.ones(len(rv['tail']), dtype=bool)
+    keep[removed] = False
+    for array_name in ARRAY_NAMES[1:]:
+      rv[array_name] = rv[array_name][keep]
+  return rv
+
+def compile_network(edges_file, outdir, cost_transform='linear100', digest=None, dedupe=DEDUPE_DEFAULT, verbose=False):
+  """
+  Parse <edges_file> and write it as a compiled network to <outdir>; see write_network, which
+  ensures concurrent processes never observe a partially written network
+
+  Returns
+  -------
+  network : CompiledNetwork
+  """
+  names, tail, head, weight = read_abc_arrays(edges_file)
+  network = CompiledNetwork.from_arrays(names, tail, head, weight, cost_transform=cost_transform, dedupe=dedupe)
+  if verbose:
+    sys.stderr.write('[status] dropped {} duplicate edges of {}\n'.format(network.manifest['n_duplicates'], len(tail)))
+  if digest is None:
+    digest = file_digest(edges_file)
+  network.manifest['source'] = os.path.abspath(edges_file)
+  network.manifest['source_sha256'] = digest
+  write_network(network, outdir)
+  return network
+
+def write_network(network, outdir):
+  """
+  Save <network> to a temporary directory next to <outdir> and rename it to <outdir>. If
+  <outdir> already holds a complete network, e.g. one written concurrently by another process,
+  that network is kept.
+  """
+  parent_dir = os.path.dirname(os.path.abspath(outdir))
+  if not os.path.exists(parent_dir):
+    os.makedirs(parent_dir)
+  tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=parent_dir)
+  try:
+    network.save(tmp_dir)
+    try:
+      os.rename(tmp_dir, outdir)
+    except OSError:
+      if not os.path.exists(os.path.join(outdir, MANIFEST_FN)):
+        raise
+  finally:
+    if os.path.exists(tmp_dir):
+      shutil.rmtree(tmp_dir)
+
+def get_cache_dir(edges_file, cache_dir=None):
+  """
+  Resolve the network cache directory: <cache_dir> if given, else the FLOPRO_CACHE_DIR
+  environment variable, else a .flopro_cache directory next to <edges_file>
+  """
+  if cache_dir is None:
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+  if cache_dir is None:
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(edges_file)), CACHE_DIR_DEFAULT)
+  return cache_dir
+
+def write_json_atomic(fp, obj):
+  tmp_fp = '{}.{}.tmp'.format(fp, os.getpid())
+  with open(tmp_fp, 'w') as fh:
+    json.dump(obj, fh)
+  os.replace(tmp_fp, fp)
+
+def load_network(edges_file, cost_transform='linear100', cache_dir=None, verbose=False, dedupe=DEDUPE_DEFAULT):
+  """
+  Load the compiled network for the ABC file <edges_file>, compiling it if needed
+
+  Cache entries are named by the sha256 of the contents of <edges_file>, <cost_transform> and
+  <dedupe>.
+  Hashing a large file is itself slow, so a small stamp file per source path records the size
+  and modification time seen when the content hash was last computed; the hash is only
+  recomputed when those change.
+
+  Parameters
+  ----------
+  edges_file : str
+    path to an ABC file, or to the directory of a compiled network which is opened as is
+
+  cost_transform : str
+    key of COST_TRANSFORMS
+
+  dedupe : str
+    one of DEDUPE_POLICIES; see dedupe_edges
+
+  cache_dir : str or None
+    see get_cache_dir
+
+  Returns
+  -------
+  network : CompiledNetwork
+  """
+  if os.path.isdir(edges_file):
+    # a compiled network maintained by hand, e.g. with edge diffs; see flopro.network_diff
+    return CompiledNetwork.open(edges_file)
+  cache_dir = get_cache_dir(edges_file, cache_dir)
+  if not os.path.exists(cache_dir):
+    try:
+      os.makedirs(cache_dir)
+    except OSError:
+      pass
+
+  source_fp = os.path.abspath(edges_file)
+  stat = os.stat(source_fp)
+  path_key = hashlib.sha1(source_fp.encode()).hexdigest()[:16]
+  stamp_fp = os.path.join(cache_dir, '{}-{}.stamp'.format(path_key, cost_transform))
+
+  # use the content hash from a previous run if the file looks unchanged
+  digest = None
+  if os.path.exists(stamp_fp):
+    try:
+      with open(stamp_fp) as fh:
+        stamp = json.load(fh)
+      if stamp['size'] == stat.st_size and stamp['mtime_ns'] == stat.st_mtime_ns:
+        digest = stamp['sha256']
+    except (ValueError, KeyError):
+      digest = None
+  if digest is None:
+    digest = file_digest(source_fp)
+    write_json_atomic(stamp_fp, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest})
+
+  network_dir = os.path.join(cache_dir, '{}-{}-{}'.format(digest[:32], cost_transform, dedupe))
+  if not os.path.exists(os.path.join(network_dir, MANIFEST_FN)):
+    if verbose:
+      sys.stderr.write('[status] compiling network {} to {}\n'.format(edges_file, network_dir))
+    compile_network(source_fp, network_dir, cost_transform=cost_transform, digest=digest, dedupe=dedupe, verbose=verbose)
+  return CompiledNetwork.open(network_dir)
@@ -0,0 +1,307 @@
+"""
+Update a compiled network (see flopro.network) with an edge diff instead of recompiling it
+
+An edge diff is a text file of records, one per line; blank lines and lines starting with # are
+ignored:
+
+  + A B 0.9   add the interaction A B with weight 0.9; new nodes are added as needed
+  - A B       remove the interaction A B
+  ~ A B 0.5   change the weight of the interaction A B to 0.5
+
+Interactions are undirected: B A addresses the same interaction as A B. Records are applied in
+order, and the whole diff is checked before anything is written.
+
+The base arrays of a compiled network are never modified. apply_diff instead writes a delta file
+holding every change since the network was compiled, delta-<revision>.npz, and then points the
+manifest at it and increments the manifest's revision. The first diff sorts the base edges into
+an edge key index (edge_keys.npy, edge_order.npy) and the base node names into a name index
+(name_order.npy, names_sorted.npy), once; afterwards applying a diff costs time proportional to
+the diff and to the total size of the delta, not to the network. Loading the network is not:
+the first CompiledNetwork.open after each revision merges the delta into the arrays and saves
+the merged copy, in time proportional to the network, and later opens memory-map that copy.
+compact_network folds the delta back into the base arrays.
+"""
+import os, os.path
+import json
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+from . import SimPathException
+from .id_table import IdTable
+from .network import ARRAY_NAMES, COST_TRANSFORMS, MANIFEST_FN, CompiledNetwork, merged_dir_name, write_json_atomic, write_network
+
+EDGE_KEYS_FN = 'edge_keys.npy'
+EDGE_ORDER_FN = 'edge_order.npy'
+NAME_ORDER_FN = 'name_order.npy'
+NAMES_SORTED_FN = 'names_sorted.npy'
+OPS = ['+', '-', '~']
+
+class NetworkDiffException(SimPathException):
+  pass
+
+def parse_diff(fh):
+  """
+  Parameters
+  ----------
+  fh : file-like
+    edge diff; see module docstring
+
+  Returns
+  -------
+  records : list of (int, str, str, str, float or None)
+    line number, op, node names and weight
+  """
+  records = []
+  for line_no, line in enumerate(fh, 1):
+    words = line.split()
+    if not words or words[0].startswith('#'):
+      continue
+    op = words[0]
+    n_words = 3 if op == '-' else 4
+    if op not in OPS or len(words) != n_words:
+      raise NetworkDiffException('Invalid line {}: {}'.format(line_no, line.rstrip()))
+    weight = None
+    if op != '-':
+      try:
+        weight = float(words[3])
+      except ValueError:
+        raise NetworkDiffException('Invalid weight on line {}: {}'.format(line_no, words[3]))
+    records.append((line_no, op, words[1], words[2], weight))
+  return records
+
+def _edge_keys(tail, head):
+  tail = np.asarray(tail, dtype=np.int64)
+  head = np.asarray(head, dtype=np.int64)
+  return (np.minimum(tail, head) << 32) | np.maximum(tail, head)
+
+def _load_edge_index(indir):
+  """
+  Returns
+  -------
+  keys : np.ndarray of int64
+    sorted keys of the base edges
+
+  order : np.ndarray of int64
+    base edge index of each key
+  """
+  keys_fp = os.path.join(indir, EDGE_KEYS_FN)
+  order_fp = os.path.join(indir, EDGE_ORDER_FN)
+  if not os.path.exists(keys_fp):
+    tail = np.load(os.path.join(indir, 'tail.npy'), mmap_mode='r')
+    head = np.load(os.path.join(indir, 'head.npy'), mmap_mode='r')
+    keys = _edge_keys(tail, head)
+    order = np.argsort(keys, kind='stable')
+    _save_atomic(order_fp, order)
+    _save_atomic(keys_fp, keys[order])
+  return np.load(keys_fp, mmap_mode='r'), np.load(order_fp, mmap_mode='r')
+
+def _load_name_index(indir):
+  """
+  Returns
+  -------
+  order : np.ndarray of int64
+    node id of each base node name in sorted order
+
+  sorted_names : np.ndarray of bytes
+    base node names, sorted
+  """
+  order_fp = os.path.join(indir, NAME_ORDER_FN)
+  sorted_fp = os.path.join(indir, NAMES_SORTED_FN)
+  if not os.path.exists(sorted_fp):
+    names = np.load(os.path.join(indir, 'names.npy'), mmap_mode='r')
+    order = np.argsort(names, kind='stable')
+    _save_atomic(order_fp, order)
+    _save_atomic(sorted_fp, names[order])
+  return np.load(order_fp, mmap_mode='r'), np.load(sorted_fp, mmap_mode='r')
+
+def _save_atomic(fp, arr):
+  tmp_fp = '{}.{}.tmp.npy'.format(fp, os.getpid())
+  np.save(tmp_fp, arr)
+  os.replace(tmp_fp, fp)
+
+def _empty_delta(names_dtype):
+  delta = {array_name: np.zeros(0, dtype=dtype) for array_name, dtype in zip(ARRAY_NAMES, [names_dtype, np.int32, np.int32, np.float64, np.int64])}
+  delta['removed'] = np.zeros(0, dtype=np.int64)
+  delta['reweighted'] = np.zeros(0, dtype=np.int64)
+  delta['reweighted_weight'] = np.zeros(0, dtype=np.float64)
+  delta['reweighted_cost'] = np.zeros(0, dtype=np.int64)
+  return delta
+
+def apply_diff(indir, diff_fh):
+  """
+  Apply an edge diff to the compiled network in <indir>; see module docstring
+
+  Parameters
+  ----------
+  indir : str
+    compiled network directory
+
+  diff_fh : file-like
+
+  Returns
+  -------
+  stats : dict
+    new revision and the number of added nodes and edges, removed edges and reweighted edges
+
+  Raises
+  ------
+  NetworkDiffException
+    if a record adds an interaction that exists or removes or reweights one that does not
+  """
+  manifest_fp = os.path.join(indir, MANIFEST_FN)
+  if not os.path.exists(manifest_fp):
+    raise NetworkDiffException('Not a compiled network: {}'.format(indir))
+  with open(manifest_fp) as fh:
+    manifest = json.load(fh)
+  diff_bytes = diff_fh.read()
+  if isinstance(diff_bytes, bytes):
+    diff_bytes = diff_bytes.decode('utf-8')
+  records = parse_diff(diff_bytes.splitlines())
+  cost_transform = COST_TRANSFORMS[manifest['cost_transform']]
+
+  base_names = np.load(os.path.join(indir, 'names.npy'), mmap_mode='r')
+  n_base_nodes = len(base_names)
+  n_base_edges = len(np.load(os.path.join(indir, 'tail.npy'), mmap_mode='r'))
+  if manifest.get('delta') is not None:
+    with np.load(os.path.join(indir, manifest['delta'])) as npz:
+      delta = {key: npz[key] for key in npz.files}
+  else:
+    delta = _empty_delta(base_names.dtype)
+  base_keys, base_order = _load_edge_index(indir)
+
+  # node name -> id for the nodes named in the diff
+  names = set()
+  for line_no, op, name1, name2, weight in records:
+    names.add(name1)
+    names.add(name2)
+  names = sorted(names)
+  name_ids = {}
+  if names:
+    name_order, sorted_names = _load_name_index(indir)
+    table = IdTable(base_names, order=name_order, sorted_names=sorted_names)
+    for name, node_id in zip(names, table.ids(names).tolist()):
+      if node_id >= 0:
+        name_ids[name] = node_id
+  added_names = [name.decode('utf-8') for name in delta['names'].tolist()]
+  for i, name in enumerate(added_names):
+    name_ids[name] = n_base_nodes + i
+
+  # edge key -> indices of added edges, in the base-then-added edge index space
+  added_edges = {}
+  added_rows = list(zip(delta['tail'].tolist(), delta['head'].tolist(), delta['weight'].tolist()))
+  for i, key in enumerate(_edge_keys(delta['tail'], delta['head']).tolist()):
+    added_edges.setdefault(key, []).append(n_base_edges + i)
+  removed = set(delta['removed'].tolist())
+  reweighted = dict(zip(delta['reweighted'].tolist(), delta['reweighted_weight'].tolist()))
+
+  def live_edges(key):
+    left, right = np.searchsorted(base_keys, [key, key + 1])
+    rv = base_order[left:right].tolist() + added_edges.get(key, [])
+    return [i for i in rv if i not in removed]
+
+  stats = {'n_added_nodes': 0, 'n_added': 0, 'n_removed': 0, 'n_reweighted': 0}
+  for line_no, op, name1, name2, weight in records:
+    if op == '+':
+      for name in (name1, name2):
+        if name not in name_ids:
+          name_ids[name] = n_base_nodes + len(added_names)
+          added_names.append(name)
+          stats['n_added_nodes'] += 1
+    if name1 not in name_ids or name2 not in name_ids:
+      raise NetworkDiffException('Line {}: no interaction {} {} in the network'.format(line_no, name1, name2))
+    u, v = name_ids[name1], name_ids[name2]
+    key = int(_edge_keys([u], [v])[0])
+    edges = live_edges(key)
+    if op == '+':
+      if edges:
+        raise NetworkDiffException('Line {}: interaction {} {} is already in the network'.format(line_no, name1, name2))
+      added_edges.setdefault(key, []).append(n_base_edges + len(added_rows))
+      added_rows.append((u, v, weight))
+      stats['n_added'] += 1
+    elif not edges:
+      raise NetworkDiffException('Line {}: no interaction {} {} in the network'.format(line_no, name1, name2))
+    elif op == '-':
+      removed.update(edges)
+      for i in edges:
+        reweighted.pop(i, None)
+      stats['n_removed'] += 1
+    else:
+      for i in edges:
+        reweighted[i] = weight
+      stats['n_reweighted'] += 1
+
+  # write the new delta, then switch the manifest to it
+  revision = manifest.get('revision', 0) + 1
+  added = np.array(added_rows, dtype=np.float64).reshape(-1, 3)
+  reweighted_ids = np.array(sorted(reweighted), dtype=np.int64)
+  reweighted_weight = np.array([reweighted[i] for i in reweighted_ids.tolist()], dtype=np.float64)
+  new_delta = {
+    'names': np.array([name.encode() for name in added_names], dtype=np.bytes_),
+    'tail': added[:, 0].astype(np.int32),
+    'head': added[:, 1].astype(np.int32),
+    'weight': added[:, 2],
+    'cost': cost_transform(added[:, 2]),
+    'removed': np.array(sorted(removed), dtype=np.int64),
+    'reweighted': reweighted_ids,
+    'reweighted_weight': reweighted_weight,
+    'reweighted_cost': cost_transform(reweighted_weight)
+  }
+  if len(new_delta['names']) == 0:
+    new_delta['names'] = np.zeros(0, dtype=base_names.dtype)
+  delta_fn = 'delta-{}.npz'.format(revision)
+  tmp_fp = os.path.join(indir, '.{}.{}.tmp.npz'.format(delta_fn, os.getpid()))
+  np.savez(tmp_fp, **new_delta)
+  os.replace(tmp_fp, os.path.join(indir, delta_fn))
+
+  old_delta = manifest.get('delta')
+  if 'network_id' not in manifest:
+    manifest['network_id'] = manifest.get('source_sha256', hashlib.sha256(os.path.abspath(indir).encode()).hexdigest())[:16]
+  manifest['delta'] = delta_fn
+  manifest['revision'] = revision
+  manifest.setdefault('history', []).append(dict(stats, revision=revision, diff_sha256=hashlib.sha256(diff_bytes.encode('utf-8')).hexdigest()))
+  write_json_atomic(manifest_fp, manifest)
+  # keep the delta of the previous revision for processes that read the old manifest
+  _remove_deltas(indir, keep=[delta_fn, old_delta])
+  stats['revision'] = revision
+  return stats
+
+def _remove_deltas(indir, keep):
+  """
+  Remove the delta files not in <keep>, and their merged networks
+  """
+  merged_keep = [merged_dir_name(fn) for fn in keep if fn is not None]
+  for fn in os.listdir(indir):
+    if fn.startswith('delta-') and fn.endswith('.npz') and fn not in keep:
+      os.remove(os.path.join(indir, fn))
+    elif fn.startswith('delta-') and fn.endswith('.merged') and fn not in merged_keep:
+      shutil.rmtree(os.path.join(indir, fn), ignore_errors=True)
+
+def compact_network(indir):
+  """
+  Rewrite the compiled network in <indir> with its delta merged into the base arrays, keeping
+  its revision and history
+  """
+  network = CompiledNetwork.open(indir, mmap_mode=None)
+  if network.manifest.get('delta') is None:
+    return network
+  manifest = dict(network.manifest)
+  del manifest['delta']
+  manifest['network_id'] = network.version.split(':')[0]
+  manifest['n_nodes'] = network.n_nodes
+  manifest['n_edges'] = network.n_edges
+  network.manifest = manifest
+
+  parent_dir = os.path.dirname(os.path.abspath(indir))
+  new_dir = tempfile.mkdtemp(prefix='.compact-', dir=parent_dir)
+  old_dir = new_dir + '.old'
+  try:
+    shutil.rmtree(new_dir)
+    write_network(network, new_dir)
+    os.rename(indir, old_dir)
+    os.rename(new_dir, indir)
+  finally:
+    for tmp_dir in (new_dir, old_dir):
+      if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+  return network
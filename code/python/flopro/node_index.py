@@ -0,0 +1,121 @@
+"""
+Node universe of a network without its edges
+
+Scripts that only need to know which nodes are in a network, and how many neighbors each has,
+use a NodeIndex instead of building a networkx graph of every weighted edge. A NodeIndex is
+derived from the compiled network of flopro.network, so it comes from the same cache entry as the
+network flow.py solves on, and is rebuilt whenever that entry is.
+"""
+import sys
+import numpy as np
+from .network import DEDUPE_DEFAULT, load_network
+
+class NodeIndex(object):
+  """
+  Sorted, interned node names with their degrees
+
+  Parameters
+  ----------
+  names : list of str
+    sorted node names
+
+  degrees : np.ndarray of int
+    number of distinct neighbors of each node in <names>; a self loop counts twice, as in
+    networkx
+  """
+  def __init__(self, names, degrees):
+    self.names = [sys.intern(name) for name in names]
+    self.degrees = np.asarray(degrees, dtype=np.int64)
+    self._index = dict(zip(self.names, range(len(self.names))))
+
+  def __len__(self):
+    return len(self.names)
+
+  def __contains__(self, name):
+    return name in self._index
+
+  def __iter__(self):
+    return iter(self.names)
+
+  def index(self, name):
+    """
+    Returns
+    -------
+    ind : int
+      position of <name> in names
+
+    Raises
+    ------
+    KeyError
+      if <name> is not in the network
+    """
+    return self._index[name]
+
+  def degree(self, name):
+    return int(self.degrees[self._index[name]])
+
+  @classmethod
+  def from_edges(cls, names, tail, head):
+    """
+    Parameters
+    ----------
+    names : list of str
+      node names indexed by node id
+
+    tail : np.ndarray of int
+
+    head : np.ndarray of int
+      node ids of the edge endpoints; repeated and reversed edges are counted once
+    """
+    base = max(len(names), 1)
+    codes = np.unique(_edge_codes(tail, head, base))
+    degrees = np.bincount(np.concatenate((codes // base, codes % base)), minlength=len(names))
+    order = sorted(range(len(names)), key=names.__getitem__)
+    return cls([names[i] for i in order], degrees[order])
+
+  @classmethod
+  def from_network(cls, network):
+    """
+    Parameters
+    ----------
+    network : flopro.network.CompiledNetwork
+    """
+    names = network.node_names()
+    if network.manifest.get('dedupe', 'none') == 'none':
+      return cls.from_edges(names, network.tail, network.head)
+    # deduped networks, and edge diffs of them, have one edge per interaction already
+    degrees = np.bincount(network.tail, minlength=len(names)) + np.bincount(network.head, minlength=len(names))
+    order = sorted(range(len(names)), key=names.__getitem__)
+    return cls([names[i] for i in order], degrees[order])
+
+def _edge_codes(tail, head, base):
+  """
+  Encode each undirected edge as one integer, smaller node id first; <base> must exceed every
+  node id
+  """
+  tail = np.asarray(tail, dtype=np.int64)
+  head = np.asarray(head, dtype=np.int64)
+  return np.minimum(tail, head) * base + np.maximum(tail, head)
+
+def load_node_index(edges_file, cache_dir=None, dedupe=DEDUPE_DEFAULT):
+  """
+  Derive the node index of <edges_file> from its compiled network, compiling it if needed
+
+  Parameters
+  ----------
+  edges_file : str
+    abc file, or compiled network directory; see flopro.network.load_network
+
+  cache_dir : str or None
+    see flopro.network.get_cache_dir
+
+  dedupe : str
+    see flopro.network.dedupe_edges; the index does not depend on it, but it selects the cache
+    entry, so pass the policy the flow jobs use to share their entry
+
+  Returns
+  -------
+  index : NodeIndex
+  """
+  network = load_network(edges_file, cache_dir=cache_dir, dedupe=dedupe)
+  return NodeIndex.from_network(network)
@@ -3,22 +3,348 @@ The "abc" file format consists of lines each of which defines an edge and its co
 A B 0
 B C 1
 """
-from ppi import SimPathException
-import networkx as nx
+from .. import SimPathException
+import numpy as np
+
+# bytes read per chunk by read_abc_arrays; chunks are extended to the next line boundary
+CHUNK_SIZE = 1 << 24
+
+# bytes.split() separators
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[ord(c) for c in ' \t\n\r\x0b\x0c']] = True
+
+_HASH_MULTIPLIERS = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
 
 class ParseAbcException(SimPathException):
   pass
 
-def parse_abc(fh):
+def _open_binary(fh):
+  """
+  Returns
+  -------
+  fh : io-like
+    binary file handle for a path or a text or binary file handle
+
+  close : bool
+    True if the caller is responsible for closing fh
+  """
   if(type(fh) is str):
-    fh = open(fh, 'r')
-  G = nx.Graph()
-  line_no = 0
-  for line in fh:
+    return open(fh, 'rb'), True
+  return getattr(fh, 'buffer', fh), False
+
+def iter_line_chunks(fh, chunk_size):
+  """
+  Yield blocks of bytes from <fh> that contain only complete lines
+  """
+  remainder = b''
+  while True:
+    block = fh.read(chunk_size)
+    if isinstance(block, str):
+      block = block.encode()
+    if not block:
+      break
+    block = remainder + block
+    cut = block.rfind(b'\n') + 1
+    if cut == 0:
+      remainder = block
+      continue
+    remainder = block[cut:]
+    yield block[:cut]
+  if remainder:
+    yield remainder
+
+def _mix(keys):
+  """
+  splitmix64 finalizer
+  """
+  keys = (keys ^ (keys >> np.uint64(30))) * _HASH_MULTIPLIERS[0]
+  keys = (keys ^ (keys >> np.uint64(27))) * _HASH_MULTIPLIERS[1]
+  return keys ^ (keys >> np.uint64(31))
+
+def _hash_names(names):
+  """
+  Parameters
+  ----------
+  names : np.ndarray of bytes
+
+  Returns
+  -------
+  keys : np.ndarray of uint64
+    hash of each name; independent of the width of the <names> dtype
+  """
+  width = max(8, -(-names.dtype.itemsize // 8) * 8)
+  words = np.ascontiguousarray(names, dtype='S{}'.format(width)).view(np.uint64).reshape(len(names), -1)
+  keys = _mix(words[:, 0])
+  for col in range(1, words.shape[1]):
+    # names do not contain NUL so all zero words are padding
+    word = words[:, col]
+    keys = np.where(word != 0, _mix(keys ^ word), keys)
+  return keys
+
+def _gather_tokens(buf, starts, ends):
+  """
+  Returns
+  -------
+  rows : np.ndarray of uint8 with shape (len(starts), width)
+    the bytes buf[starts[i]:ends[i]] of each token padded with zeros
+
+  lengths : np.ndarray of int
+  """
+  lengths = ends - starts
+  width = max(1, int(lengths.max())) if len(lengths) > 0 else 1
+  padded = np.concatenate((buf, np.zeros(width, dtype=np.uint8)))
+  windows = np.lib.stride_tricks.as_strided(padded, shape=(len(buf), width), strides=(1, 1))
+  rows = windows[starts]
+  if len(lengths) > 0 and lengths.min() < width:
+    rows[np.arange(width) >= lengths[:, None]] = 0
+  return rows, lengths
+
+def _token_bounds(buf):
+  """
+  Locate the tokens of a chunk of whitespace-delimited ASCII
+
+  Returns
+  -------
+  starts : np.ndarray of int or None
+
+  ends : np.ndarray of int or None
+    the tokens of line i are buf[starts[3*i+j]:ends[3*i+j]] for j in 0, 1, 2; both None
+    if any line does not have exactly three tokens or the chunk is not ASCII
+  """
+  if len(buf) == 0 or buf.max() >= 0x80:
+    return None, None
+  is_space = buf <= 32
+  seps = np.flatnonzero(is_space)
+  if not _WHITESPACE[buf[seps]].all():
+    # control characters that are not whitespace
+    return None, None
+  n_lines = len(seps) // 3
+  seps_by_line = seps[:3 * n_lines].reshape(-1, 3)
+  if (len(seps) == 3 * n_lines and buf[-1] == ord('\n') and not is_space[0] and
+      (buf[seps_by_line[:, 2]] == ord('\n')).all() and (buf[seps_by_line[:, :2]] != ord('\n')).all() and
+      (np.diff(seps) > 1).all()):
+    # common layout: a single separator after each token and every third one is a newline
+    ends = seps
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    return starts, ends
+
+  # general layout: count tokens on each line
+  padded = np.concatenate(([True], is_space, [True])).view(np.int8)
+  edges = np.diff(padded)
+  starts = np.flatnonzero(edges == -1)
+  ends = np.flatnonzero(edges == 1)
+  newlines = np.flatnonzero(buf == ord('\n'))
+  n_lines = len(newlines) + (0 if buf[-1] == ord('\n') else 1)
+  if len(starts) != 3 * n_lines:
+    return None, None
+  if (np.searchsorted(newlines, starts) != np.repeat(np.arange(n_lines), 3)).any():
+    return None, None
+  return starts, ends
+
+def _parse_chunk_slow(data, line_no):
+  """
+  Tokenize one line at a time; handles any encoding and identifies malformed lines
+
+  Returns
+  -------
+  words : list of bytes
+    node names, two per line
+
+  weights : list of float
+  """
+  words = []
+  weights = []
+  lines = data.decode('utf-8').split('\n')
+  if lines[-1] == '':
+    lines.pop()
+  for line in lines:
     line_no += 1
-    line = line.rstrip()
-    words = line.split()
-    if(len(words) != 3):
+    tokens = line.split()
+    if(len(tokens) != 3):
+      raise ParseAbcException("Invalid line {}".format(line_no))
+    try:
+      weights.append(float(tokens[2]))
+    except ValueError:
       raise ParseAbcException("Invalid line {}".format(line_no))
-    G.add_edge(words[0], words[1], **{'weight': float(words[2])})
+    words.append(tokens[0].encode())
+    words.append(tokens[1].encode())
+  return words, weights
+
+class _Vocabulary(object):
+  """
+  Node names seen so far, looked up by hash
+
+  Each hash is assigned a slot in a table of at least 64 times as many slots as names. Most
+  lookups are answered by the slot table; hashes whose slot is shared with another name fall
+  back to binary search.
+  """
+  def __init__(self):
+    self.names = []
+    self.name_arr = np.zeros(0, dtype='S1')
+    self.id_keys = np.zeros(0, dtype=np.uint64) # hash of each node id
+    self.keys = np.zeros(0, dtype=np.uint64) # sorted
+    self.key_ids = np.zeros(0, dtype=np.int32) # node id of each key
+    self.slot_bits = 0
+    self.slots = np.full(1, -1, dtype=np.int32)
+
+  def _slot(self, keys):
+    if self.slot_bits == 0:
+      return np.zeros(len(keys), dtype=np.int64)
+    return (keys >> np.uint64(64 - self.slot_bits)).astype(np.int64)
+
+  def _rebuild_slots(self):
+    self.slot_bits = max(10, int(np.ceil(np.log2(max(len(self.names), 1) * 64))))
+    self.slots = np.full(1 << self.slot_bits, -1, dtype=np.int32)
+    key_slots = self._slot(self.id_keys)
+    counts = np.bincount(key_slots, minlength=len(self.slots))
+    self.slots[key_slots] = np.arange(len(self.names), dtype=np.int32)
+    # -2 marks slots shared by several names
+    self.slots[counts > 1] = -2
+
+  def lookup(self, words):
+    """
+    Parameters
+    ----------
+    words : np.ndarray of bytes
+
+    Returns
+    -------
+    ids : np.ndarray of int32 or None
+      node id of each word, adding new names in order of first appearance; None in the
+      unlikely event of a hash collision
+    """
+    word_keys = _hash_names(words)
+    ids = self.slots[self._slot(word_keys)]
+    found = ids >= 0
+    found[found] = self.id_keys[ids[found]] == word_keys[found]
+    shared = np.flatnonzero(ids == -2)
+    if len(shared) > 0:
+      pos = np.minimum(np.searchsorted(self.keys, word_keys[shared]), len(self.keys) - 1)
+      shared_found = self.keys[pos] == word_keys[shared]
+      ids[shared[shared_found]] = self.key_ids[pos[shared_found]]
+      found[shared[shared_found]] = True
+
+    if not found.all():
+      missing = np.flatnonzero(~found)
+      new_keys, first, inverse = np.unique(word_keys[missing], return_index=True, return_inverse=True)
+      # np.unique sorts by key, number new names by position instead
+      order = np.argsort(first, kind='stable')
+      new_ids = np.empty(len(new_keys), dtype=np.int32)
+      new_ids[order] = np.arange(len(self.names), len(self.names) + len(new_keys))
+      ids[missing] = new_ids[inverse.reshape(-1)]
+      new_names = words[missing[first[order]]]
+      self.names.extend(new_names.tolist())
+      self.name_arr = np.concatenate((self.name_arr, new_names))
+      self.id_keys = np.concatenate((self.id_keys, new_keys[order]))
+      self.keys = np.concatenate((self.keys, new_keys))
+      self.key_ids = np.concatenate((self.key_ids, new_ids))
+      key_order = np.argsort(self.keys, kind='stable')
+      self.keys = self.keys[key_order]
+      self.key_ids = self.key_ids[key_order]
+      self._rebuild_slots()
+
+    if (self.name_arr[ids] != words).any():
+      return None
+    return ids
+
+def iter_abc_chunks(fh, names, chunk_size=CHUNK_SIZE):
+  """
+  Parse an abc file in bulk, one chunk at a time
+
+  The file is processed in chunks of about <chunk_size> bytes. Chunks of whitespace-delimited ASCII
+  are tokenized with NumPy; other chunks are parsed line by line.
+
+  Parameters
+  ----------
+  fh : str or io-like
+    file path or open file handle
+
+  names : list
+    empty list; node names (str) are appended in order of first appearance so that the index
+    of a name is its node id. After each chunk, it holds every name seen so far.
+
+  Yields
+  ------
+  tail : np.ndarray of int32
+    node id of the first node on each line of the chunk
+
+  head : np.ndarray of int32
+    node id of the second node on each line of the chunk
+
+  weight : np.ndarray of float64
+
+  Raises
+  ------
+  ParseAbcException
+    if a line does not consist of two node names and a numeric weight
+  """
+  fh, close = _open_binary(fh)
+  vocab = _Vocabulary()
+  line_no = 0
+  try:
+    for data in iter_line_chunks(fh, chunk_size):
+      ids = None
+      buf = np.frombuffer(data, dtype=np.uint8)
+      starts, ends = _token_bounds(buf)
+      if starts is not None:
+        try:
+          rows, lengths = _gather_tokens(buf, starts[2::3], ends[2::3])
+          weights = rows.view('S{}'.format(rows.shape[1])).reshape(-1).astype(np.float64)
+        except ValueError:
+          weights = None
+        if weights is not None:
+          name_starts = np.stack((starts[0::3], starts[1::3]), axis=1).reshape(-1)
+          name_ends = np.stack((ends[0::3], ends[1::3]), axis=1).reshape(-1)
+          rows, lengths = _gather_tokens(buf, name_starts, name_ends)
+          ids = vocab.lookup(rows.view('S{}'.format(rows.shape[1])).reshape(-1))
+      if ids is None:
+        words, weights = _parse_chunk_slow(data, line_no)
+        weights = np.array(weights, dtype=np.float64)
+        ids = vocab.lookup(np.array(words, dtype=np.bytes_))
+        if ids is None:
+          raise ParseAbcException("Unable to assign node identifiers near line {}".format(line_no + 1))
+      line_no += len(weights)
+      names.extend(name.decode('utf-8') for name in vocab.names[len(names):])
+      ids = ids.reshape(-1, 2)
+      yield np.ascontiguousarray(ids[:, 0]), np.ascontiguousarray(ids[:, 1]), weights
+  finally:
+    if close:
+      fh.close()
+
+def read_abc_arrays(fh, chunk_size=CHUNK_SIZE):
+  """
+  Parse an abc file in bulk; see iter_abc_chunks
+
+  Returns
+  -------
+  names : list of str
+    node names in order of first appearance; the index of a name is its node id
+
+  tail : np.ndarray of int32
+    node id of the first node on each line
+
+  head : np.ndarray of int32
+    node id of the second node on each line
+
+  weight : np.ndarray of float64
+  """
+  names = []
+  tails = [np.zeros(0, dtype=np.int32)]
+  heads = [np.zeros(0, dtype=np.int32)]
+  weights = [np.zeros(0, dtype=np.float64)]
+  for tail, head, weight in iter_abc_chunks(fh, names, chunk_size=chunk_size):
+    tails.append(tail)
+    heads.append(head)
+    weights.append(weight)
+  return names, np.concatenate(tails), np.concatenate(heads), np.concatenate(weights)
+
+def parse_abc(fh):
+  # networkx is only needed here; read_abc_arrays, which flopro.network uses, does without it
+  import networkx as nx
+  names, tail, head, weight = read_abc_arrays(fh)
+  G = nx.Graph()
+  G.add_nodes_from(names)
+  G.add_weighted_edges_from(zip(map(names.__getitem__, tail.tolist()), map(names.__getitem__, head.tolist()), weight.tolist()))
   return G
@@ -0,0 +1,291 @@
+"""
+Shrink a flow problem before it is handed to the solver without changing its optimal cost
+
+The flow problem of flow.py sends flow from an artificial source through the source proteins,
+over undirected interactions with non-negative costs, to the target proteins and an artificial
+target. Every interaction is a pair of arcs whose capacity is at least the total flow. In that
+setting a node can only carry flow in an optimal solution if it lies on a path between a source
+and a target, so prune_network removes:
+
+  unreachable nodes
+    nodes whose connected component lacks a source or a target
+  dead ends
+    non-terminal nodes with at most one neighbor, repeatedly, which removes every tree hanging
+    off the rest of the network; flow into a dead end can only come back out the way it came,
+    which is a cycle of non-negative cost
+  self loops
+
+and optionally contracts chains of non-terminal nodes with exactly two incident edges into a
+single edge whose cost is the sum of the chain's costs. Flow over a contracted edge is mapped
+back onto the chain's edges by PrunedNetwork.expand.
+
+Node ids are unchanged; removed nodes simply have no edges.
+"""
+import numpy as np
+
+PRUNE_MODES = ['none', 'dead-ends', 'chains']
+PRUNE_DEFAULT = 'dead-ends'
+
+class PrunedNetwork(object):
+  """
+  Undirected edges left after pruning
+
+  Attributes
+  ----------
+  tail, head : np.ndarray of int64
+
+  cost : np.ndarray of int64
+
+  chains : dict<int, list of int>
+    for each contracted edge, the ids of the nodes strictly between its tail and head
+
+  stats : dict<str, int>
+    see prune_network
+
+  chain_costs : dict<int, list of int>
+    for each contracted edge, the costs of the edges of its chain from tail to head
+  """
+  def __init__(self, tail, head, cost, chains, stats, chain_costs=None):
+    self.tail = tail
+    self.head = head
+    self.cost = cost
+    self.chains = chains
+    self.stats = stats
+    self.chain_costs = chain_costs if chain_costs is not None else {}
+
+  @property
+  def n_edges(self):
+    return len(self.tail)
+
+  def expand(self, arc_ids, tails, heads, flows, costs=None):
+    """
+    Map the flow on the arcs of a solver built with two arcs per edge, edge i being arcs 2i
+    (tail to head) and 2i+1 (head to tail), back onto the edges of the unpruned network. Arcs
+    with ids past the network edges, such as those to the artificial source and target, are
+    passed through.
+
+    Parameters
+    ----------
+    arc_ids, tails, heads, flows : list of int
+      solver arcs carrying flow
+
+    costs : list of int or None
+      unit costs of the arcs
+
+    Returns
+    -------
+    tails, heads, flows : list of int
+
+    costs : list of int
+      only returned if <costs> is given
+    """
+    if costs is None:
+      costs = [None] * len(arc_ids)
+      with_costs = False
+    else:
+      with_costs = True
+    if not self.chains:
+      return (tails, heads, flows, costs) if with_costs else (tails, heads, flows)
+    rv_tails = []
+    rv_heads = []
+    rv_flows = []
+    rv_costs = []
+    for arc_id, tail, head, flow, cost in zip(arc_ids, tails, heads, flows, costs):
+      chain = self.chains.get(arc_id // 2) if arc_id < 2 * self.n_edges else None
+      if chain is None:
+        rv_tails.append(tail)
+        rv_heads.append(head)
+        rv_flows.append(flow)
+        rv_costs.append(cost)
+        continue
+      chain_costs = self.chain_costs.get(arc_id // 2, [None] * (len(chain) + 1))
+      if arc_id % 2 == 1:
+        chain = chain[::-1]
+        chain_costs = chain_costs[::-1]
+      path = [tail] + chain + [head]
+      rv_tails.extend(path[:-1])
+      rv_heads.extend(path[1:])
+      rv_flows.extend([flow] * (len(path) - 1))
+      rv_costs.extend(chain_costs)
+    return (rv_tails, rv_heads, rv_flows, rv_costs) if with_costs else (rv_tails, rv_heads, rv_flows)
+
+  def summary(self):
+    stats = self.stats
+    return 'pruned network from {} nodes and {} edges to {} nodes and {} edges: {} unreachable nodes, {} dead-end nodes, {} self loops removed; {} chain nodes contracted'.format(
+      stats['n_nodes_in'], stats['n_edges_in'], stats['n_nodes_out'], stats['n_edges_out'],
+      stats['n_unreachable'], stats['n_dead_ends'], stats['n_self_loops'], stats['n_contracted'])
+
+def _reachable(n_nodes, tail, head, seeds):
+  """
+  Returns
+  -------
+  visited : np.ndarray of bool
+    nodes connected to any of <seeds> by undirected edges
+  """
+  visited = np.zeros(n_nodes, dtype=bool)
+  visited[seeds] = True
+  frontier = visited.copy()
+  while frontier.any():
+    hit = np.concatenate((head[frontier[tail]], tail[frontier[head]]))
+    hit = hit[~visited[hit]]
+    frontier = np.zeros(n_nodes, dtype=bool)
+    frontier[hit] = True
+    visited |= frontier
+  return visited
+
+def _neighbor_counts(n_nodes, tail, head):
+  """
+  Number of distinct neighbors of each node; <tail> and <head> must not contain self loops
+  """
+  codes = np.unique(np.minimum(tail, head) * n_nodes + np.maximum(tail, head))
+  return np.bincount(np.concatenate((codes // n_nodes, codes % n_nodes)), minlength=n_nodes)
+
+def _contract_chains(n_nodes, tail, head, cost, is_terminal):
+  """
+  Returns
+  -------
+  tail, head, cost : np.ndarray of int64
+    edges with every maximal chain of non-terminal degree 2 nodes replaced by one edge
+
+  chains : dict<int, list of int>
+
+  chain_costs : dict<int, list of int>
+
+  n_contracted : int
+    number of nodes removed
+  """
+  incident = np.bincount(np.concatenate((tail, head)), minlength=n_nodes)
+  inner = (incident == 2) & ~is_terminal
+  chain_edges = np.flatnonzero(inner[tail] | inner[head])
+  if len(chain_edges) == 0:
+    return tail, head, cost, {}, {}, 0
+
+  # the two edges incident to each inner node
+  node_edges = {}
+  for edge in chain_edges.tolist():
+    for node in (int(tail[edge]), int(head[edge])):
+      if inner[node]:
+        node_edges.setdefault(node, []).append(edge)
+
+  keep = np.ones(len(tail), dtype=bool)
+  keep[chain_edges] = False
+  n_kept = int(keep.sum())
+  new_tail = []
+  new_head = []
+  new_cost = []
+  chains = {}
+  chain_costs = {}
+  visited = set()
+  n_contracted = 0
+  for edge in chain_edges.tolist():
+    if edge in visited:
+      continue
+    start = int(tail[edge])
+    node = int(head[edge])
+    if inner[start]:
+      if inner[node]:
+        # walk chains from an end so each is contracted once
+        continue
+      start, node = node, start
+    # walk from the anchor <start> through inner nodes to the other anchor
+    path = []
+    hop_costs = []
+    while True:
+      visited.add(edge)
+      hop_costs.append(int(cost[edge]))
+      if not inner[node]:
+        break
+      path.append(node)
+      edge_a, edge_b = node_edges[node]
+      edge = edge_b if edge_a == edge else edge_a
+      node = int(head[edge]) if int(tail[edge]) == node else int(tail[edge])
+    n_contracted += len(path)
+    if node == start:
+      # a chain from a node back to itself is a cycle and can never carry flow
+      continue
+    chains[n_kept + len(new_tail)] = path
+    chain_costs[n_kept + len(new_tail)] = hop_costs
+    new_tail.append(start)
+    new_head.append(node)
+    new_cost.append(sum(hop_costs))
+  return (np.concatenate((tail[keep], np.array(new_tail, dtype=np.int64))),
+    np.concatenate((head[keep], np.array(new_head, dtype=np.int64))),
+    np.concatenate((cost[keep], np.array(new_cost, dtype=np.int64))),
+    chains, chain_costs, n_contracted)
+
+def prune_network(n_nodes, tail, head, cost, sources, targets, mode=PRUNE_DEFAULT):
+  """
+  Parameters
+  ----------
+  n_nodes : int
+
+  tail, head : np.ndarray of int
+    node ids of the undirected edges
+
+  cost : np.ndarray of int
+    non-negative edge costs
+
+  sources, targets : array-like of int
+    node ids of the terminals
+
+  mode : str
+    one of PRUNE_MODES: 'none' keeps every edge, 'dead-ends' removes unreachable nodes, dead
+    ends and self loops, 'chains' also contracts chains
+
+  Returns
+  -------
+  pruned : PrunedNetwork
+    with stats n_nodes_in, n_edges_in, n_nodes_out, n_edges_out (counting nodes with at least
+    one edge), n_unreachable, n_dead_ends, n_self_loops and n_contracted
+  """
+  if mode not in PRUNE_MODES:
+    raise ValueError('Unknown prune mode "{}"; must be one of {}'.format(mode, ', '.join(PRUNE_MODES)))
+  tail = np.asarray(tail, dtype=np.int64)
+  head = np.asarray(head, dtype=np.int64)
+  cost = np.asarray(cost, dtype=np.int64)
+  sources = np.asarray(sources, dtype=np.int64)
+  targets = np.asarray(targets, dtype=np.int64)
+
+  def n_active(tail, head):
+    return len(np.unique(np.concatenate((tail, head))))
+
+  stats = {
+    'n_nodes_in': n_active(tail, head),
+    'n_edges_in': len(tail),
+    'n_unreachable': 0,
+    'n_dead_ends': 0,
+    'n_self_loops': 0,
+    'n_contracted': 0
+  }
+  chains = {}
+  chain_costs = {}
+  if mode != 'none':
+    loops = tail == head
+    stats['n_self_loops'] = int(loops.sum())
+    tail, head, cost = tail[~loops], head[~loops], cost[~loops]
+
+    # nodes must be connected to both a source and a target
+    alive = _reachable(n_nodes, tail, head, sources) & _reachable(n_nodes, tail, head, targets)
+    keep = alive[tail] & alive[head]
+    n_before = n_active(tail, head)
+    tail, head, cost = tail[keep], head[keep], cost[keep]
+    stats['n_unreachable'] = n_before - n_active(tail, head)
+
+    # peel dead ends
+    is_terminal = np.zeros(n_nodes, dtype=bool)
+    is_terminal[sources] = True
+    is_terminal[targets] = True
+    n_before = n_active(tail, head)
+    while len(tail) > 0:
+      dead = (_neighbor_counts(n_nodes, tail, head) <= 1) & ~is_terminal
+      keep = ~(dead[tail] | dead[head])
+      if keep.all():
+        break
+      tail, head, cost = tail[keep], head[keep], cost[keep]
+    stats['n_dead_ends'] = n_before - n_active(tail, head)
+
+    if mode == 'chains':
+      tail, head, cost, chains, chain_costs, stats['n_contracted'] = _contract_chains(n_nodes, tail, head, cost, is_terminal)
+  stats['n_nodes_out'] = n_active(tail, head)
+  stats['n_edges_out'] = len(tail)
+  return PrunedNetwork(tail, head, cost, chains, stats, chain_costs)
@@ -1,10 +1,10 @@
 import os, os.path
 import sys
 import subprocess as sp
-import multiprocessing as mp
 import networkx as nx
 import distutils.spawn
 import hashlib
+import time
 
 def run_command(outdir, cmd, *args, **kwargs):
   """Run command and throw error if non-zero exit code
@@ -180,7 +180,7 @@ def write_condor_dag(dag_fp, digraph):
     for root in roots:
       # write JOB declaration for root
       job_int = root
-      job_attrs = digraph.node[job_int]
+      job_attrs = digraph.nodes[job_int]
       job_name = job_attrs_to_job_name(**job_attrs)
       job_int_to_name[job_int] = job_name
       job_str = JOB_FMT_STR.format(job_name, condor_submit_fp)
@@ -197,7 +197,7 @@ def write_condor_dag(dag_fp, digraph):
       for edge in edges:
         # write JOB declaration for target
         job_int = edge[1]
-        job_attrs = digraph.node[job_int]
+        job_attrs = digraph.nodes[job_int]
         job_name = job_attrs_to_job_name(**job_attrs)
         job_int_to_name[job_int] = job_name
         fh.write(JOB_FMT_STR.format(job_name, condor_submit_fp) + "\n")
@@ -222,7 +222,33 @@ def bfs_nodes(G, source):
   return node_list
 
 
-def run_digraph(outdir, digraph, condor=False, dry_run=False, root_node=0, exit_on_err=True, **kwargs):
+def _launch_job(job_attrs):
+  """
+  Start the job of a digraph node, writing its stdout and stderr to its 'out' and 'err' files if
+  given
+
+  Returns
+  -------
+  proc : sp.Popen
+
+  fhs : list of io-like
+    files opened for the job, to close when it finishes
+  """
+  args = [job_attrs['exe']] + job_attrs['args']
+  fhs = []
+  stdout_fh = sys.stdout
+  if('out' in job_attrs):
+    stdout_fh = open(job_attrs['out'], 'w')
+    fhs.append(stdout_fh)
+  stderr_fh = sys.stderr
+  if('err' in job_attrs):
+    stderr_fh = open(job_attrs['err'], 'w')
+    fhs.append(stderr_fh)
+  sys.stdout.write("[STATUS] Launching {} > {} 2> {}\n".format(" ".join(args), job_attrs.get('out'), job_attrs.get('err')))
+  sys.stdout.flush()
+  return sp.Popen(args, stdout=stdout_fh, stderr=stderr_fh), fhs
+
+def run_digraph(outdir, digraph, condor=False, dry_run=False, root_node=0, exit_on_err=True, workers=1, **kwargs):
   """
   Run a set of jobs specified by a directed (acyclic) graph
 
@@ -240,7 +266,12 @@ def run_digraph(outdir, digraph, condor=False, dry_run=False, root_node=0, exit_
     if True, do not submit the DAG
 
   exit_on_err : bool
-    if True (and condor False), stop execution of digraph when one of the job nodes fails
+    if True (and condor False), stop execution of digraph when one of the job nodes fails: no
+    further jobs are launched, running jobs are waited for, and sp.CalledProcessError is raised
+
+  workers : int
+    if condor False, the number of jobs run at once; a job is launched once all of its
+    predecessors have finished, in topological order
 
   Returns : TODO
   -------
@@ -254,72 +285,43 @@ def run_digraph(outdir, digraph, condor=False, dry_run=False, root_node=0, exit_
     write_condor_dag(dag_fp, digraph)
     if(not dry_run):
       submit_condor_dag(dag_fp)
+  elif(dry_run):
+    for job_id in nx.topological_sort(digraph):
+      # mock launch this node's job
+      job_attrs = digraph.nodes[job_id]
+      sys.stdout.write("[STATUS] Launching {} > {} 2> {}\n".format(" ".join([job_attrs['exe']] + job_attrs['args']), job_attrs.get('out'), job_attrs.get('err')))
   else:
-    # TODO even with the pool it appears only 1 process is running
-    pool = mp.Pool(processes=mp.cpu_count()-1)
-    digraph = digraph.copy() # add proc node attr pointing to a Popen object
-    #job_order = bfs_nodes(digraph, root_node)
-    job_order = nx.topological_sort(digraph)
-    for job_id in job_order:
-      if(dry_run):
-         # mock launch this node's job
-        job_attrs = digraph.node[job_id]
-        args = [job_attrs['exe']] + job_attrs['args']
-        stdout_fh = None
-        if('out' in job_attrs):
-          stdout_fh = open(job_attrs['out'], 'w')
-        else:
-          stdout_fh = sys.stdout
-        stderr_fh = None
-        if('err' in job_attrs):
-          stderr_fh = open(job_attrs['err'], 'w')
-        else:
-          stderr_fh = sys.stderr
-        sys.stdout.write("[STATUS] Launching {} > {} 2> {}\n".format(" ".join([digraph.node[job_id]['exe']] + digraph.node[job_id]['args']), job_attrs['out'], job_attrs['err']))
-      else:
-        # wait for any predecessors to finish
-        #preds = digraph.predecessors(job_id)
-        #for pred in preds:
-        #  digraph.node[pred]['async_result'].wait()
-
-        #sum_v = 0
-        #for exit in pred_exits:
-        #  sum_v += exit
-        #if(sum_v > 0):
-        #  # then a predecessor failed
-        #  raise RuntimeError("[ERROR] a predecessor to {} failed".format(digraph.node[job_id]['exe']))
-
-        # launch this node's job
-        job_attrs = digraph.node[job_id]
-        args = [job_attrs['exe']] + job_attrs['args']
-        stdout_fh = None
-        if('out' in job_attrs):
-          stdout_fh = open(job_attrs['out'], 'w')
-        else:
-          stdout_fh = sys.stdout
-        stderr_fh = None
-        if('err' in job_attrs):
-          stderr_fh = open(job_attrs['err'], 'w')
-        else:
-          stderr_fh = sys.stderr
-        sys.stdout.write("[STATUS] Launching {} > {} 2> {}\n".format(" ".join([digraph.node[job_id]['exe']] + digraph.node[job_id]['args']), job_attrs['out'], job_attrs['err']))
-
-        #def callback_for_job(exit_status):
-        #  digraph.node[job_id]['exit'] = exit_status
-        #digraph.node[job_id]['exit'] = None
-        # TODO for some reason providing stdout and stderr breaks everything?
-        #async_result = pool.apply_async(sp.check_call, [args]) #, {'stdout': stdout_fh, 'stderr': stderr_fh})
-        #digraph.node[job_id]['async_result'] = async_result
-        #async_result.wait()
-
-        # TODO synchronous only
-        #proc = sp.Popen(args, stdout=stdout_fh, stderr=stderr_fh)
-        exit_code = -1
-        if exit_on_err:
-          exit_code = sp.check_call(args, stdout=stdout_fh, stderr=stderr_fh)
-        else: 
-          exit_code = sp.call(args, stdout=stdout_fh, stderr=stderr_fh)
-        print(exit_code)
+    job_order = list(nx.topological_sort(digraph))
+    n_waiting = dict((job_id, digraph.in_degree(job_id)) for job_id in job_order)
+    running = {}
+    failed = None
+    while job_order or running:
+      # launch ready jobs, earliest in topological order first
+      if failed is None:
+        for job_id in [job_id for job_id in job_order if n_waiting[job_id] == 0]:
+          if len(running) >= max(1, workers):
+            break
+          running[job_id] = _launch_job(digraph.nodes[job_id])
+          job_order.remove(job_id)
+      elif not running:
+        break
+      # wait for any running job to finish
+      finished = []
+      while not finished:
+        finished = [job_id for job_id, (proc, fhs) in running.items() if proc.poll() is not None]
+        if not finished:
+          time.sleep(0.05)
+      for job_id in finished:
+        proc, fhs = running.pop(job_id)
+        for fh in fhs:
+          fh.close()
+        print(proc.returncode)
+        if proc.returncode != 0 and exit_on_err and failed is None:
+          failed = sp.CalledProcessError(proc.returncode, proc.args)
+        for succ in digraph.successors(job_id):
+          n_waiting[succ] -= 1
+    if failed is not None:
+      raise failed
   return job_ids
 
 
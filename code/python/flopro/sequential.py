@@ -0,0 +1,167 @@
+"""
+Besag-Clifford sequential empirical p-values of the nodes of a flow result
+
+The empirical p-value of a node of the real flow result is the fraction of simulated screens
+whose flow graph also has the node (see write_pvals.py). Most nodes appear in many simulated
+flow graphs, and their p-value is clearly large long before a fixed number of simulations has
+been solved. Following Besag and Clifford (1991, Biometrika 78:301), the simulations of a node
+stop counting once it has appeared in <exceedances> of them:
+
+  - a node that appears for the h-th time, with h = <exceedances>, in simulation L is resolved
+    with p-value h / L
+  - a node that appears k < h times in the first m simulations is resolved as not significant
+    once k + 1 > <alpha> * (N + 1), with N = <max_simulation>: its p-value can no longer fall
+    below <alpha>, and is reported as (k + 1) / (m + 1)
+  - a node that appears g < h times in all N simulations has p-value (g + 1) / (N + 1)
+
+The relative standard error of h / L is about 1 / sqrt(h), so <exceedances> sets the precision
+of the large p-values. A node that is significant never stops early: it reaches neither h
+appearances nor the bound of <alpha>, so any screen with one runs all <max_simulation>
+simulations. Stopping a node early as significant would not be valid, since the check repeats
+after every simulation and would call too many nodes significant.
+Simulations stop when every node is resolved or when <max_simulation> have been counted. Because
+each node stops at the simulation that resolves it, the p-values do not depend on how many
+simulations are solved at a time.
+"""
+import numpy as np
+
+EXCEEDANCES_DEFAULT = 10
+ALPHA_DEFAULT = 0.05
+
+class SequentialPvalues(object):
+  """
+  Parameters
+  ----------
+  node_ids : list of int
+    indices into the node universe of the nodes of the real flow result
+
+  n_universe : int
+    size of the node universe
+
+  exceedances : int
+
+  max_simulation : int
+
+  alpha : float or None
+    significance level; a node whose p-value can no longer fall below it is resolved as not
+    significant. None resolves nodes only by <exceedances>
+
+  Attributes
+  ----------
+  counts : np.ndarray of int64
+    simulations that counted for each node and have it in their flow graph
+
+  n_simulation : np.ndarray of int64
+    simulations that counted for each node, its effective number of simulations
+
+  n_total : int
+    simulations counted so far
+  """
+  def __init__(self, node_ids, n_universe, exceedances=EXCEEDANCES_DEFAULT, max_simulation=None, alpha=None):
+    self.node_ids = np.asarray(node_ids, dtype=np.int64)
+    self.exceedances = exceedances
+    self.max_simulation = max_simulation
+    self.alpha = alpha
+    self._position = np.full(n_universe, -1, dtype=np.int64)
+    self._position[self.node_ids] = np.arange(len(self.node_ids))
+    self.counts = np.zeros(len(self.node_ids), dtype=np.int64)
+    self.n_simulation = np.zeros(len(self.node_ids), dtype=np.int64)
+    self.n_total = 0
+
+  @property
+  def exceeded(self):
+    """
+    Returns
+    -------
+    exceeded : np.ndarray of bool
+      whether each node has appeared in <exceedances> simulations
+    """
+    return self.counts >= self.exceedances
+
+  @property
+  def futile(self):
+    """
+    Returns
+    -------
+    futile : np.ndarray of bool
+      whether each node is resolved as not significant: it has not been exceeded, and even if it
+      appeared in none of the remaining simulations its p-value (k + 1) / (N + 1) would not be
+      below <alpha>
+    """
+    if self.alpha is None or self.max_simulation is None:
+      return np.zeros(len(self.node_ids), dtype=bool)
+    return ~self.exceeded & (self.counts + 1 > self.alpha * (self.max_simulation + 1))
+
+  @property
+  def resolved(self):
+    """
+    Returns
+    -------
+    resolved : np.ndarray of bool
+      whether each node has stopped counting, because it was exceeded or cannot be significant
+    """
+    return self.exceeded | self.futile
+
+  @property
+  def done(self):
+    return bool(self.resolved.all()) or (self.max_simulation is not None and self.n_total >= self.max_simulation)
+
+  @property
+  def stop_reason(self):
+    """
+    Returns
+    -------
+    reason : str or None
+      'resolved' if every node is resolved, 'max_simulation' if the simulations ran out first,
+      None if neither
+    """
+    if self.resolved.all():
+      return 'resolved'
+    if self.max_simulation is not None and self.n_total >= self.max_simulation:
+      return 'max_simulation'
+    return None
+
+  def update(self, ids):
+    """
+    Count one simulation, unless the simulations are done
+
+    Parameters
+    ----------
+    ids : np.ndarray of int
+      indices into the node universe of the nodes of its flow graph; none for a simulation that
+      could not be solved, which still counts, as in write_pvals.py
+    """
+    if self.done:
+      return
+    self.n_total += 1
+    counting = ~self.resolved
+    self.n_simulation[counting] += 1
+    hits = self._position[np.asarray(ids, dtype=np.int64)]
+    hits = hits[hits >= 0]
+    self.counts[hits[counting[hits]]] += 1
+
+  def pvalues(self):
+    """
+    Returns
+    -------
+    pvalues : np.ndarray of float
+      p-value of each node so far
+    """
+    # nodes that are not exceeded counted every simulation until they were found futile, or all of them
+    return np.where(self.exceeded, self.exceedances / np.maximum(self.n_simulation, 1), (self.counts + 1) / (self.n_simulation + 1))
+
+  def write(self, fp, names):
+    """
+    Write node, count, effective number of simulations, p-value, whether it is resolved and
+    whether it is resolved as not significant to the tab-separated file <fp>
+
+    Parameters
+    ----------
+    names : list of str
+      node universe
+    """
+    with open(fp, 'w') as fh:
+      fh.write('node\tcount\tn_simulation\tpvalue\tresolved\tfutile\n')
+      for node_id, count, n_simulation, pvalue, resolved, futile in zip(self.node_ids.tolist(), self.counts.tolist(), self.n_simulation.tolist(),
+          self.pvalues().tolist(), self.resolved.tolist(), self.futile.tolist()):
+        fh.write('{}\t{}\t{}\t{:.6g}\t{}\t{}\n'.format(names[node_id], count, n_simulation, pvalue, resolved, futile))
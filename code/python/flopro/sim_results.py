@@ -0,0 +1,400 @@
+"""
+Flow results of many simulated runs in one append-only file
+
+Instead of a flow_result.graphml per simulated run that flow_sim_frequency.py parses back, each
+run appends one record to a shared store file:
+
+  header    magic, universe key, universe size, run number, status code, optimal cost (-1 if
+            none), number of nodes, number of edges and length of the metrics, packed as RECORD
+  nodes     int32 indices of the nodes of the flow graph into the node universe
+  edges     int32 tail indices, int32 head indices and int64 flows of the edges of the flow
+            graph
+  metrics   metrics of the run as UTF-8 JSON, if it recorded any
+
+The node universe is the sorted node names of the network, which are the names of its
+flopro.node_index.NodeIndex, and the universe key is a checksum of them, so a store is only read
+against the network its records were written for. Records are appended to a file opened for
+appending while holding an exclusive lock on it, so the processes of one host can share one
+store. Appends to a file on shared storage from several hosts are not safe, since O_APPEND is
+not atomic over NFS; jobs on different hosts instead each append to their own shard, a file of
+a store directory (see shard_fp), and the shards are read together as one store. If a run
+number appears more than once, as when a run is repeated, its last record is the one read.
+
+A store holds everything the downstream stages need from a simulated run, so flow_batch.py and
+flow_sim_engine.py with --results-only write no per-run output directories, and
+flow_sim_frequency.py, flow_sim_signif.py and write_pvals.py read the store directly.
+
+SimResults reads a store into ragged index arrays: the node indices of all runs concatenated,
+with the offset of each run's first node, so node frequency is one np.bincount; edges are kept
+the same way.
+"""
+import fcntl
+import json
+import os
+import struct
+import zlib
+import numpy as np
+from .flow import STATUSES as FLOW_STATUSES
+
+RESULTS_FN = 'sim_results.bin'
+RESULTS_DIR = 'sim_results.d'
+SHARD_EXT = '.bin'
+
+MAGIC = b'FSR2'
+RECORD = struct.Struct('<4sIIiBqIII')
+
+# statuses of flopro.flow, and unknown for imported flow results whose run recorded no status
+STATUSES = FLOW_STATUSES + ['unknown']
+
+def shard_fp(store_dir, name):
+  """
+  Returns
+  -------
+  fp : str
+    shard of the store directory <store_dir> that the job <name> appends to
+  """
+  return os.path.join(store_dir, name + SHARD_EXT)
+
+def store_files(fp):
+  """
+  Returns
+  -------
+  fps : list of str
+    files of the store <fp>: <fp> itself if it is a file, or the shards of the store directory
+    <fp> by name; none if <fp> does not exist
+  """
+  if os.path.isdir(fp):
+    return [os.path.join(fp, name) for name in sorted(os.listdir(fp)) if name.endswith(SHARD_EXT)]
+  return [fp] if os.path.exists(fp) else []
+
+def read_bytes(fp):
+  """
+  Returns
+  -------
+  data : bytes
+    records of every file of the store <fp>, concatenated
+  """
+  chunks = []
+  for store_fp in store_files(fp):
+    with open(store_fp, 'rb') as fh:
+      chunks.append(fh.read())
+  return b''.join(chunks)
+
+def clear(fp):
+  """
+  Remove the records of the store <fp>, a file or a store directory, so a new series of runs
+  starts afresh; a store directory is kept, empty, for the shards of the new runs
+  """
+  if os.path.isdir(fp):
+    for store_fp in store_files(fp):
+      os.remove(store_fp)
+  elif os.path.exists(fp):
+    os.remove(fp)
+
+def universe_key(names):
+  """
+  Returns
+  -------
+  key : int
+    checksum of the sorted node names <names>
+  """
+  return zlib.crc32('\n'.join(names).encode('utf-8'))
+
+class ResultStore(object):
+  """
+  Writer of the records of runs over one node universe
+
+  Parameters
+  ----------
+  fp : str
+    store file, which is created if it does not exist
+
+  names : list of str
+    sorted node names of the network
+  """
+  def __init__(self, fp, names):
+    self.fp = fp
+    self.names = names
+    self.key = universe_key(names)
+    self._index = dict(zip(names, range(len(names))))
+
+  @classmethod
+  def for_network(cls, fp, network):
+    """
+    Parameters
+    ----------
+    network : flopro.network.CompiledNetwork
+    """
+    return cls(fp, sorted(network.node_names()))
+
+  def node_ids(self, nodes):
+    """
+    Returns
+    -------
+    ids : np.ndarray of int32
+      indices of <nodes> into the node universe
+
+    Raises
+    ------
+    KeyError
+      if one of <nodes> is not in the network
+    """
+    return np.array([self._index[node] for node in nodes], dtype='<i4')
+
+  def encode(self, run, status, cost=None, nodes=(), edges=(), metrics=None):
+    """
+    Parameters
+    ----------
+    run : int
+      run number, which is -1 for a run that is not one of a numbered series
+
+    edges : iterable of (str, str, int)
+      tail, head and flow of each edge of the flow graph
+
+    metrics : dict or None
+      metrics of the run, which must be serializable as JSON
+
+    Returns
+    -------
+    record : bytes
+    """
+    ids = self.node_ids(nodes)
+    edges = list(edges)
+    tails = self.node_ids([edge[0] for edge in edges])
+    heads = self.node_ids([edge[1] for edge in edges])
+    flows = np.array([edge[2] for edge in edges], dtype='<i8')
+    metrics = b'' if metrics is None else json.dumps(metrics, sort_keys=True).encode('utf-8')
+    header = RECORD.pack(MAGIC, self.key, len(self.names), run, STATUSES.index(status), -1 if cost is None else cost, len(ids), len(edges), len(metrics))
+    return b''.join([header, ids.tobytes(), tails.tobytes(), heads.tobytes(), flows.tobytes(), metrics])
+
+  def append(self, records):
+    """
+    Append the encoded <records> to the store, holding an exclusive lock on it until every byte
+    is written
+
+    Raises
+    ------
+    OSError
+      if the store stops accepting bytes
+    """
+    data = memoryview(b''.join(records))
+    fd = os.open(self.fp, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+      fcntl.lockf(fd, fcntl.LOCK_EX)
+      while len(data) > 0:
+        # os.write may write fewer bytes than asked, and at most about 2 GiB at once
+        n = os.write(fd, data)
+        if n == 0:
+          raise OSError('Could not append to {}: wrote 0 bytes'.format(self.fp))
+        data = data[n:]
+    finally:
+      os.close(fd)
+
+  def append_result(self, run, status, cost=None, nodes=(), edges=(), metrics=None):
+    self.append([self.encode(run, status, cost, nodes, edges, metrics)])
+
+class SimResults(object):
+  """
+  Records of a store, one per run
+
+  Attributes
+  ----------
+  runs : np.ndarray of int32
+    run numbers, in the order the runs were first appended
+
+  statuses : np.ndarray of uint8
+    status codes into STATUSES
+
+  costs : np.ndarray of int64
+    optimal costs, -1 if the run has none
+
+  offsets : np.ndarray of int64
+    run i has the nodes indices[offsets[i]:offsets[i + 1]]
+
+  indices : np.ndarray of int32
+    node indices of every run into the node universe
+
+  edge_offsets : np.ndarray of int64
+    run i has the edges tails[edge_offsets[i]:edge_offsets[i + 1]], and so on
+
+  tails, heads : np.ndarray of int32
+    node indices of the edges of every run
+
+  flows : np.ndarray of int64
+
+  run_metrics : list of dict or None
+    metrics of each run, None if it recorded none
+  """
+  def __init__(self, runs, statuses, costs, offsets, indices, edge_offsets=None, tails=None, heads=None, flows=None, run_metrics=None):
+    self.runs = runs
+    self.statuses = statuses
+    self.costs = costs
+    self.offsets = offsets
+    self.indices = indices
+    self.edge_offsets = np.zeros(len(runs) + 1, dtype=np.int64) if edge_offsets is None else edge_offsets
+    self.tails = np.zeros(0, dtype=np.int32) if tails is None else tails
+    self.heads = np.zeros(0, dtype=np.int32) if heads is None else heads
+    self.flows = np.zeros(0, dtype=np.int64) if flows is None else flows
+    self.run_metrics = [None] * len(runs) if run_metrics is None else run_metrics
+
+  def __len__(self):
+    return len(self.runs)
+
+  @property
+  def n_simulation(self):
+    """
+    Number of numbered runs, whatever their status
+    """
+    return int((self.runs >= 0).sum())
+
+  def nodes(self, i):
+    """
+    Returns
+    -------
+    ids : np.ndarray of int32
+      node indices of the i-th run
+    """
+    return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+  def edges(self, i):
+    """
+    Returns
+    -------
+    tails, heads : np.ndarray of int32
+      node indices of the edges of the i-th run
+
+    flows : np.ndarray of int64
+    """
+    start, stop = self.edge_offsets[i], self.edge_offsets[i + 1]
+    return self.tails[start:stop], self.heads[start:stop], self.flows[start:stop]
+
+  def metrics(self, i):
+    return self.run_metrics[i]
+
+  def status(self, i):
+    return STATUSES[self.statuses[i]]
+
+  def status_counts(self):
+    """
+    Returns
+    -------
+    counts : dict of str to int
+      number of runs with each status that at least one run has
+    """
+    counts = np.bincount(self.statuses, minlength=len(STATUSES))
+    return dict((status, int(count)) for status, count in zip(STATUSES, counts.tolist()) if count > 0)
+
+  def _counted(self, statuses):
+    codes = [STATUSES.index(status) for status in statuses]
+    return np.isin(self.statuses, codes)
+
+  def frequency(self, n_nodes, statuses=('optimal',)):
+    """
+    Returns
+    -------
+    counts : np.ndarray of int64
+      number of runs with one of <statuses> whose flow graph has each node
+    """
+    keep = np.repeat(self._counted(statuses), np.diff(self.offsets))
+    return np.bincount(self.indices[keep], minlength=n_nodes)
+
+  def edge_frequency(self, n_nodes, statuses=('optimal',)):
+    """
+    Returns
+    -------
+    tails, heads : np.ndarray of int64
+      node indices of each edge that is in the flow graph of a run with one of <statuses>, by
+      tail and head
+
+    counts : np.ndarray of int64
+      number of those runs whose flow graph has each edge
+
+    flows : np.ndarray of int64
+      total flow of each edge over those runs
+    """
+    keep = np.repeat(self._counted(statuses), np.diff(self.edge_offsets))
+    keys = self.tails[keep].astype(np.int64) * n_nodes + self.heads[keep]
+    keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    flows = np.bincount(inverse.ravel(), weights=self.flows[keep], minlength=len(keys)).astype(np.int64)
+    return keys // n_nodes, keys % n_nodes, counts.astype(np.int64), flows
+
+  @classmethod
+  def from_bytes(cls, data, names=None):
+    """
+    Parameters
+    ----------
+    data : bytes
+      concatenated records
+
+    names : list of str or None
+      sorted node names of the network; if given, every record must have been written for them
+
+    Raises
+    ------
+    ValueError
+      if <data> is not a sequence of records, or its records are for another network than
+      <names> or than each other
+    """
+    key = None if names is None else (universe_key(names), len(names))
+    by_run = {}
+    order = []
+    pos = 0
+    while pos < len(data):
+      magic = data[pos:pos + 4]
+      if magic == MAGIC and pos + RECORD.size <= len(data):
+        magic, record_key, n_universe, run, status, cost, n_ids, n_edges, n_metrics = RECORD.unpack_from(data, pos)
+      elif magic == MAGIC or len(data) - pos < 4:
+        raise ValueError('Truncated record at byte {}'.format(pos))
+      else:
+        raise ValueError('No simulation result record at byte {}'.format(pos))
+      if key is None:
+        key = (record_key, n_universe)
+      elif (record_key, n_universe) != key:
+        raise ValueError('Record at byte {} is for a different network'.format(pos))
+      if pos + RECORD.size + 4 * n_ids + 16 * n_edges + n_metrics > len(data):
+        raise ValueError('Truncated record at byte {}'.format(pos))
+      pos += RECORD.size
+      ids = np.frombuffer(data, dtype='<i4', count=n_ids, offset=pos)
+      pos += 4 * n_ids
+      tails = np.frombuffer(data, dtype='<i4', count=n_edges, offset=pos)
+      heads = np.frombuffer(data, dtype='<i4', count=n_edges, offset=pos + 4 * n_edges)
+      flows = np.frombuffer(data, dtype='<i8', count=n_edges, offset=pos + 8 * n_edges)
+      pos += 16 * n_edges
+      metrics = json.loads(data[pos:pos + n_metrics].decode('utf-8')) if n_metrics > 0 else None
+      pos += n_metrics
+      # runs without a number are all kept; a numbered run keeps its last record
+      run_key = run if run >= 0 else ('unnumbered', len(order))
+      if run_key not in by_run:
+        order.append(run_key)
+      by_run[run_key] = (run, status, cost, ids, tails, heads, flows, metrics)
+    records = [by_run[run_key] for run_key in order]
+
+    def ragged(column, dtype):
+      arrays = [record[column] for record in records]
+      offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+      np.cumsum([len(array) for array in arrays], out=offsets[1:])
+      values = np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype=dtype)
+      return offsets, values
+
+    offsets, indices = ragged(3, np.int32)
+    edge_offsets, tails = ragged(4, np.int32)
+    heads = ragged(5, np.int32)[1]
+    flows = ragged(6, np.int64)[1]
+    return cls(np.array([record[0] for record in records], dtype=np.int32), np.array([record[1] for record in records], dtype=np.uint8),
+      np.array([record[2] for record in records], dtype=np.int64), offsets, indices, edge_offsets=edge_offsets, tails=tails, heads=heads,
+      flows=flows, run_metrics=[record[7] for record in records])
+
+  @classmethod
+  def read(cls, fp, names=None):
+    """
+    Read the store <fp>, a file or a store directory whose shards are read in order of their
+    names; see from_bytes
+
+    Raises
+    ------
+    IOError
+      if <fp> does not exist
+    """
+    if not os.path.exists(fp):
+      raise IOError('No simulation result store {}'.format(fp))
+    return cls.from_bytes(read_bytes(fp), names=names)
@@ -0,0 +1,292 @@
+"""
+Simulated source sets of many screens in one sample matrix
+
+flow_sim_screens.py draws every simulated screen as a set of distinct nodes sampled from a node
+universe, and writes all of them to one .npz file instead of a sim<i>.txt file per simulation:
+
+  names     node universe, sorted
+  samples   int32 matrix with one row per simulation of sorted indices into names
+  seed      entropy of the numpy SeedSequence the samples were drawn from, as a decimal string
+  null      null model the samples were drawn from
+
+Each simulation draws from its own random stream, spawned from the seed sequence, so simulation
+i depends only on the seed and on i: drawing more simulations with the same seed keeps the
+first ones, and any one of them can be reproduced alone.
+
+Two null models are drawn:
+
+  uniform   every node of the universe is equally likely
+  degree    each real source is replaced by a node of the same degree bin of the universe (see
+            DegreeStrata), since screen hits are biased towards hubs
+"""
+import numpy as np
+
+SAMPLES_FN = 'sim_samples.npz'
+
+NULLS = ['uniform', 'degree']
+NULL_DEFAULT = 'uniform'
+MIN_STRATUM_SIZE = 50
+
+class SimSamples(object):
+  """
+  Parameters
+  ----------
+  names : list of str
+    node universe the samples index into
+
+  samples : np.ndarray of int32, shape (n_simulation, sample_size)
+    node indices of each simulation
+
+  seed : int or None
+    entropy the samples were drawn from
+
+  null : str
+    null model the samples were drawn from, one of NULLS
+  """
+  def __init__(self, names, samples, seed=None, null=NULL_DEFAULT):
+    self.names = list(names)
+    self.samples = np.asarray(samples, dtype=np.int32)
+    self.seed = seed
+    self.null = null
+
+  def __len__(self):
+    return self.samples.shape[0]
+
+  @property
+  def sample_size(self):
+    return self.samples.shape[1]
+
+  def sources(self, i):
+    """
+    Returns
+    -------
+    sources : set of str
+      nodes of the i-th simulation
+    """
+    names = self.names
+    return set(names[ind] for ind in self.samples[i].tolist())
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self.sources(i)
+
+  def write(self, fp):
+    seed = '' if self.seed is None else str(self.seed)
+    with open(fp, 'wb') as fh:
+      np.savez_compressed(fh, names=np.array(self.names, dtype=np.str_), samples=self.samples, seed=np.array(seed),
+        null=np.array(self.null))
+
+  @classmethod
+  def read(cls, fp):
+    with np.load(fp) as data:
+      seed = str(data['seed'])
+      return cls(data['names'].tolist(), data['samples'], int(seed) if seed else None, null=str(data['null']))
+
+def _draws(seed_seq, size, n_simulation, start):
+  """
+  Returns
+  -------
+  draws : np.ndarray of float, shape (n_simulation, size)
+    uniform draws in [0, 1) of simulations <start>, ..., each from its own child of <seed_seq>
+  """
+  draws = np.empty((n_simulation, size))
+  for row, i in zip(draws, range(start, start + n_simulation)):
+    # the i-th child of seed_seq.spawn
+    child = np.random.SeedSequence(seed_seq.entropy, spawn_key=(i,))
+    np.random.default_rng(child).random(out=row)
+  return draws
+
+def _floyd(draws, n_nodes):
+  """
+  Returns
+  -------
+  samples : np.ndarray of int64, same shape as <draws>
+    distinct indices below <n_nodes> in each row, drawn uniformly from the row's draws by Floyd's
+    algorithm, one column at a time over every row
+  """
+  n_simulation, size = draws.shape
+  if size > n_nodes:
+    raise ValueError('Cannot sample {} distinct nodes from {}'.format(size, n_nodes))
+  # for j = n - size, ..., n - 1, pick t uniformly in [0, j] and take j instead if t is already
+  # in the sample
+  samples = np.empty((n_simulation, size), dtype=np.int64)
+  for col, j in enumerate(range(n_nodes - size, n_nodes)):
+    picked = np.minimum((draws[:, col] * (j + 1)).astype(np.int64), j)
+    taken = (samples[:, :col] == picked[:, None]).any(axis=1)
+    samples[:, col] = np.where(taken, j, picked)
+  return samples
+
+def sample_indices(n_nodes, size, n_simulation, seed=None, start=0):
+  """
+  Draw <size> distinct indices below <n_nodes>, uniformly, for each of simulations <start>, ...,
+  <start> + <n_simulation> - 1
+
+  Every simulation takes <size> uniform draws from its own stream; the draws of all
+  simulations are then turned into samples together by Floyd's algorithm.
+
+  Returns
+  -------
+  samples : np.ndarray of int32, shape (n_simulation, size)
+    sorted indices of each simulation
+
+  seed : int
+    entropy of the seed sequence, which reproduces the samples if given as <seed>
+  """
+  if size > n_nodes:
+    raise ValueError('Cannot sample {} distinct nodes from {}'.format(size, n_nodes))
+  seed_seq = np.random.SeedSequence(seed)
+  samples = _floyd(_draws(seed_seq, size, n_simulation, start), n_nodes)
+  samples.sort(axis=1)
+  return samples.astype(np.int32), seed_seq.entropy
+
+class DegreeStrata(object):
+  """
+  Nodes of a universe grouped into bins of similar degree; each bin is a range of degrees, and
+  its nodes are a contiguous range of the universe sorted by degree
+
+  Parameters
+  ----------
+  degrees : np.ndarray of int
+    degree of each node of the universe
+
+  starts : list of int
+    bin b has the nodes order[starts[b]:starts[b + 1]]
+
+  Attributes
+  ----------
+  order : np.ndarray of int64
+    universe indices sorted by degree
+
+  min_degrees : np.ndarray of int64
+    smallest degree of each bin
+  """
+  def __init__(self, degrees, starts):
+    self.degrees = np.asarray(degrees, dtype=np.int64)
+    self.order = np.argsort(self.degrees, kind='stable')
+    self.starts = np.asarray(starts, dtype=np.int64)
+    self.min_degrees = self.degrees[self.order[self.starts[:-1]]]
+
+  @classmethod
+  def from_degrees(cls, degrees, min_size=MIN_STRATUM_SIZE):
+    """
+    Bin nodes by floor(log2(degree)) and merge bins, from the highest degrees down, with the bins
+    below them until each has at least <min_size> nodes
+    """
+    degrees = np.asarray(degrees, dtype=np.int64)
+    keys = np.floor(np.log2(np.maximum(np.sort(degrees), 1))).astype(np.int64)
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    # merge from the highest degrees down, so hubs are binned with enough other nodes
+    starts = []
+    end = len(degrees)
+    for bound in bounds[::-1].tolist():
+      if end - bound >= min_size:
+        starts.append(bound)
+        end = bound
+    if len(starts) > 0 and end < min_size:
+      # the lowest bin is too small; merge it into the one above
+      starts.pop()
+    return cls(degrees, [0] + starts[::-1] + [len(degrees)])
+
+  def __len__(self):
+    return len(self.starts) - 1
+
+  def sizes(self):
+    return np.diff(self.starts)
+
+  def stratum(self, degrees):
+    """
+    Returns
+    -------
+    bins : np.ndarray of int64
+      bin of the degree range each of <degrees> falls in
+    """
+    return np.maximum(np.searchsorted(self.min_degrees, np.asarray(degrees, dtype=np.int64), side='right') - 1, 0)
+
+  def matched(self, degrees):
+    """
+    Returns
+    -------
+    strata : DegreeStrata
+      these strata with adjacent bins merged until each bin has at least as many nodes as
+      <degrees> fall in it, so that many distinct nodes can be drawn from it
+    """
+    starts = self.starts.tolist()
+    while True:
+      strata = DegreeStrata(self.degrees, starts)
+      counts = np.bincount(strata.stratum(degrees), minlength=len(strata))
+      short = np.flatnonzero(counts > strata.sizes())
+      if len(short) == 0:
+        return strata
+      if len(strata) == 1:
+        raise ValueError('Cannot sample {} distinct nodes from {}'.format(int(counts.sum()), len(self.degrees)))
+      # merge the first bin that is too small with the bin below it, or above it if it is the lowest
+      b = int(short[0])
+      del starts[b if b > 0 else 1]
+
+  def sample(self, degrees, n_simulation, seed=None, start=0):
+    """
+    For each simulation, draw as many distinct nodes from each bin as <degrees> fall in it, from
+    the streams sample_indices uses
+
+    Returns
+    -------
+    samples : np.ndarray of int32, shape (n_simulation, len(degrees))
+      sorted universe indices of each simulation
+
+    seed : int
+      see sample_indices
+    """
+    strata = self.matched(degrees)
+    counts = np.bincount(strata.stratum(degrees), minlength=len(strata))
+    seed_seq = np.random.SeedSequence(seed)
+    draws = _draws(seed_seq, len(degrees), n_simulation, start)
+    samples = np.empty(draws.shape, dtype=np.int64)
+    col = 0
+    for b, count in enumerate(counts.tolist()):
+      if count == 0:
+        continue
+      local = _floyd(draws[:, col:col + count], int(strata.starts[b + 1] - strata.starts[b]))
+      samples[:, col:col + count] = strata.order[strata.starts[b] + local]
+      col += count
+    samples.sort(axis=1)
+    return samples.astype(np.int32), seed_seq.entropy
+
+def simulate(names, size, n_simulation, seed=None, start=0):
+  """
+  Parameters
+  ----------
+  names : list of str
+    node universe to sample from
+
+  size : int
+    number of nodes in each simulation
+
+  start : int
+    number of the first simulation; see sample_indices
+
+  Returns
+  -------
+  samples : SimSamples
+  """
+  samples, entropy = sample_indices(len(names), size, n_simulation, seed=seed, start=start)
+  return SimSamples(names, samples, entropy)
+
+def simulate_degree_matched(names, strata, degrees, n_simulation, seed=None, start=0):
+  """
+  Parameters
+  ----------
+  names : list of str
+    node universe to sample from
+
+  strata : DegreeStrata
+    degree bins of <names>
+
+  degrees : list of int
+    degrees of the real sources; each simulation draws a node of the same bin for each
+
+  Returns
+  -------
+  samples : SimSamples
+  """
+  samples, entropy = strata.sample(degrees, n_simulation, seed=seed, start=start)
+  return SimSamples(names, samples, entropy, null='degree')
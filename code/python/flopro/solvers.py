@@ -0,0 +1,519 @@
+"""
+Min-cost flow solvers used by flow.py
+
+Every solver has the interface of ortools' SimpleMinCostFlow as used by flow.py: arcs are added
+with AddArcWithCapacityAndUnitCost, or in bulk with AddArcsWithCapacityAndUnitCost, and are
+numbered in the order they are added; supplies are set with SetNodeSupply; Solve returns a
+status that is compared with the solver's OPTIMAL attribute; and the solution is read with
+OptimalCost, NumArcs, Tail, Head and Flow, or in bulk with Flows.
+
+  ortools
+    ortools' SimpleMinCostFlow, a cost-scaling push-relabel algorithm, from the
+    ortools.graph.python.min_cost_flow module of ortools 9, which requirements.txt pins, or
+    from the ortools.graph.pywrapgraph module of older versions. Only ortools 9 adds arcs and
+    reads flows as whole arrays; with pywrapgraph the bulk methods loop over the arcs one call
+    at a time, and are no faster than adding and reading arcs one by one
+  ssp
+    successive shortest paths over NumPy arrays. Each augmentation searches the residual
+    network outward from every node with remaining supply, relaxing the arcs out of a whole
+    frontier of nodes at once, until the nearest node with remaining demand is found, and sends
+    as much flow as it can along that path. Node potentials keep reduced arc costs
+    non-negative, so each search only visits nodes closer than the nearest demand. The number
+    of augmentations is at most the total supply, which in flow.py is min_sources *
+    min_targets, so this is fast when the total flow is small. Arc costs must be non-negative
+    integers.
+
+The ssp solver also records each augmentation, see SspSolver.Augmentations. After the first k
+units of supply have been sent the flow is optimal for that amount of supply, so one solve gives
+the optimal flows for every amount of flow up to the total (see flopro.flow_curve).
+
+Both solvers return optimal solutions, so their optimal costs are identical, but when several
+flows have the optimal cost they may return different ones.
+
+Solve takes an optional time limit in seconds and returns the solver's TIMEOUT status when it
+runs out. ortools cannot be interrupted while it solves, so with a time limit it solves in a
+forked child process, which is killed when the time is up; the flows are sent back through a
+pipe. The ssp solver checks the time before each augmentation. When it stops, its flows are the
+optimal flow of the supply sent so far, which is the best solution available; OptimalCost is the
+cost of that flow.
+"""
+import os
+import select
+import signal
+import struct
+import time
+import numpy as np
+from . import SimPathException
+
+SOLVERS = ['ortools', 'ssp']
+SOLVER_DEFAULT = 'ortools'
+
+# status returned by Solve when the time limit runs out; not an ortools status
+TIMEOUT = -1
+
+# status, optimal cost, maximum flow and number of arcs sent back by a forked ortools solve
+_RESULT_HEADER = struct.Struct('<qqqq')
+
+class SolverException(SimPathException):
+  pass
+
+def make_solver(name=SOLVER_DEFAULT):
+  """
+  Parameters
+  ----------
+  name : str
+    one of SOLVERS
+
+  Returns
+  -------
+  solver : OrtoolsSolver or SspSolver
+    a new, empty solver
+  """
+  if name == 'ortools':
+    return OrtoolsSolver()
+  elif name == 'ssp':
+    return SspSolver()
+  else:
+    raise ValueError('Unknown solver "{}"; must be one of {}'.format(name, ', '.join(SOLVERS)))
+
+class OrtoolsSolver(object):
+  """
+  ortools' SimpleMinCostFlow, from ortools.graph.python.min_cost_flow if it can be imported and
+  from ortools.graph.pywrapgraph otherwise
+  """
+  def __init__(self):
+    try:
+      from ortools.graph.python import min_cost_flow
+      self._g = min_cost_flow.SimpleMinCostFlow()
+      self._legacy = False
+      status = min_cost_flow.SimpleMinCostFlow
+    except ImportError:
+      from ortools.graph import pywrapgraph
+      self._g = pywrapgraph.SimpleMinCostFlow()
+      self._legacy = True
+      status = pywrapgraph.SimpleMinCostFlow
+    self.NOT_SOLVED = status.NOT_SOLVED
+    self.OPTIMAL = status.OPTIMAL
+    self.INFEASIBLE = status.INFEASIBLE
+    self.UNBALANCED = status.UNBALANCED
+    self.TIMEOUT = TIMEOUT
+    # (optimal cost, maximum flow, flows) of a solve run in a child process
+    self._solution = None
+
+  def AddArcWithCapacityAndUnitCost(self, tail, head, capacity, unit_cost):
+    self._solution = None
+    if self._legacy:
+      return self._g.AddArcWithCapacityAndUnitCost(tail, head, capacity, unit_cost)
+    return self._g.add_arc_with_capacity_and_unit_cost(tail, head, capacity, unit_cost)
+
+  def AddArcsWithCapacityAndUnitCost(self, tails, heads, capacities, unit_costs):
+    """
+    Add the arcs given by equal-length arrays, in order
+    """
+    self._solution = None
+    if self._legacy:
+      for arc in zip(np.asarray(tails).tolist(), np.asarray(heads).tolist(), np.asarray(capacities).tolist(), np.asarray(unit_costs).tolist()):
+        self._g.AddArcWithCapacityAndUnitCost(*arc)
+    else:
+      self._g.add_arcs_with_capacity_and_unit_cost(np.asarray(tails, dtype=np.int32), np.asarray(heads, dtype=np.int32),
+        np.asarray(capacities, dtype=np.int64), np.asarray(unit_costs, dtype=np.int64))
+
+  def SetNodeSupply(self, node, supply):
+    self._solution = None
+    if self._legacy:
+      self._g.SetNodeSupply(node, supply)
+    else:
+      self._g.set_node_supply(node, supply)
+
+  def Solve(self, time_limit=None):
+    """
+    Parameters
+    ----------
+    time_limit : float or None
+      seconds to wait for the solver; if given, the solve runs in a child process, see module
+      docstring
+
+    Returns
+    -------
+    status : int
+      ortools status, or TIMEOUT
+    """
+    self._solution = None
+    if time_limit is None:
+      return self._solve()
+    if not hasattr(os, 'fork'):
+      raise SolverException('A time limit on the ortools solver requires os.fork')
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+      # child: solve, send the result and exit without running any cleanup of the parent
+      try:
+        os.close(read_fd)
+        status = self._solve()
+        flows = np.zeros(0, dtype=np.int64)
+        cost = max_flow = 0
+        if status == self.OPTIMAL:
+          flows = self.Flows()
+          cost = self.OptimalCost()
+          max_flow = self.MaximumFlow()
+        payload = memoryview(_RESULT_HEADER.pack(int(status), cost, max_flow, len(flows)) + flows.astype('<i8').tobytes())
+        while len(payload) > 0:
+          payload = payload[os.write(write_fd, payload):]
+      finally:
+        os._exit(0)
+
+    os.close(write_fd)
+    deadline = time.perf_counter() + time_limit
+    chunks = []
+    try:
+      while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+          os.kill(pid, signal.SIGKILL)
+          return self.TIMEOUT
+        if select.select([read_fd], [], [], remaining)[0]:
+          chunk = os.read(read_fd, 1 << 20)
+          if not chunk:
+            break
+          chunks.append(chunk)
+    finally:
+      os.close(read_fd)
+      os.waitpid(pid, 0)
+    data = b''.join(chunks)
+    if len(data) < _RESULT_HEADER.size:
+      raise SolverException('The ortools solver process exited without a result')
+    status, cost, max_flow, n_arcs = _RESULT_HEADER.unpack_from(data)
+    flows = np.frombuffer(data, dtype='<i8', count=n_arcs, offset=_RESULT_HEADER.size).astype(np.int64)
+    statuses = {int(value): value for value in (self.NOT_SOLVED, self.OPTIMAL, self.INFEASIBLE, self.UNBALANCED)}
+    status = statuses.get(status, status)
+    if status == self.OPTIMAL:
+      self._solution = (cost, max_flow, flows)
+    return status
+
+  def _solve(self):
+    if self._legacy:
+      return self._g.Solve()
+    return self._g.solve()
+
+  def OptimalCost(self):
+    if self._solution is not None:
+      return self._solution[0]
+    if self._legacy:
+      return self._g.OptimalCost()
+    return self._g.optimal_cost()
+
+  def MaximumFlow(self):
+    if self._solution is not None:
+      return self._solution[1]
+    if self._legacy:
+      return self._g.MaximumFlow()
+    return self._g.maximum_flow()
+
+  def NumArcs(self):
+    if self._legacy:
+      return self._g.NumArcs()
+    return self._g.num_arcs()
+
+  def NumNodes(self):
+    if self._legacy:
+      return self._g.NumNodes()
+    return self._g.num_nodes()
+
+  def Tail(self, arc):
+    if self._legacy:
+      return self._g.Tail(arc)
+    return self._g.tail(arc)
+
+  def Head(self, arc):
+    if self._legacy:
+      return self._g.Head(arc)
+    return self._g.head(arc)
+
+  def Flow(self, arc):
+    if self._solution is not None:
+      return int(self._solution[2][arc])
+    if self._legacy:
+      return self._g.Flow(arc)
+    return self._g.flow(arc)
+
+  def Flows(self):
+    """
+    Returns
+    -------
+    flows : np.ndarray of int64
+      flow on every arc, in arc order
+    """
+    if self._solution is not None:
+      return self._solution[2].copy()
+    if self._legacy:
+      return np.array([self._g.Flow(arc) for arc in range(self._g.NumArcs())], dtype=np.int64)
+    return np.asarray(self._g.flows(np.arange(self._g.num_arcs())), dtype=np.int64)
+
+  def Capacity(self, arc):
+    if self._legacy:
+      return self._g.Capacity(arc)
+    return self._g.capacity(arc)
+
+  def UnitCost(self, arc):
+    if self._legacy:
+      return self._g.UnitCost(arc)
+    return self._g.unit_cost(arc)
+
+  def Supply(self, node):
+    if self._legacy:
+      return self._g.Supply(node)
+    return self._g.supply(node)
+
+class SspSolver(object):
+  """
+  Successive shortest path solver; see module docstring
+  """
+  NOT_SOLVED = 0
+  OPTIMAL = 1
+  INFEASIBLE = 3
+  UNBALANCED = 4
+  TIMEOUT = TIMEOUT
+
+  def __init__(self):
+    # arcs added one at a time are buffered in lists, bulk arcs are kept as array chunks
+    self._pending = ([], [], [], [])
+    self._chunks = []
+    self._supply = {}
+    self._flow = None
+    self._optimal_cost = None
+    self._augmentations = []
+
+  def _flush(self):
+    if self._pending[0]:
+      self._chunks.append(tuple(np.array(values, dtype=np.int64) for values in self._pending))
+      self._pending = ([], [], [], [])
+    if len(self._chunks) > 1:
+      self._chunks = [tuple(np.concatenate(values) for values in zip(*self._chunks))]
+
+  def _arcs(self):
+    """
+    Returns
+    -------
+    tail, head, capacity, cost : np.ndarray of int64
+    """
+    self._flush()
+    if not self._chunks:
+      return tuple(np.zeros(0, dtype=np.int64) for i in range(4))
+    return self._chunks[0]
+
+  def AddArcWithCapacityAndUnitCost(self, tail, head, capacity, unit_cost):
+    arc = self.NumArcs()
+    for values, value in zip(self._pending, (tail, head, capacity, unit_cost)):
+      values.append(value)
+    self._flow = None
+    return arc
+
+  def AddArcsWithCapacityAndUnitCost(self, tails, heads, capacities, unit_costs):
+    """
+    Add the arcs given by equal-length arrays, in order
+    """
+    self._flush()
+    self._chunks.append(tuple(np.asarray(values, dtype=np.int64) for values in (tails, heads, capacities, unit_costs)))
+    self._flow = None
+
+  def SetNodeSupply(self, node, supply):
+    self._supply[node] = supply
+    self._flow = None
+
+  def NumArcs(self):
+    return sum(len(chunk[0]) for chunk in self._chunks) + len(self._pending[0])
+
+  def NumNodes(self):
+    tail, head = self._arcs()[:2]
+    n_nodes = 0
+    if len(tail) > 0:
+      n_nodes = int(max(tail.max(), head.max())) + 1
+    if self._supply:
+      n_nodes = max(n_nodes, max(self._supply) + 1)
+    return n_nodes
+
+  def Tail(self, arc):
+    return int(self._arcs()[0][arc])
+
+  def Head(self, arc):
+    return int(self._arcs()[1][arc])
+
+  def Capacity(self, arc):
+    return int(self._arcs()[2][arc])
+
+  def UnitCost(self, arc):
+    return int(self._arcs()[3][arc])
+
+  def Supply(self, node):
+    return self._supply.get(node, 0)
+
+  def Flow(self, arc):
+    return int(self._flow[arc])
+
+  def Flows(self):
+    return self._flow.copy()
+
+  def OptimalCost(self):
+    return self._optimal_cost
+
+  def Augmentations(self):
+    """
+    Returns
+    -------
+    augmentations : list of (int, int, np.ndarray of int64, np.ndarray of int64)
+      for each augmentation of the last Solve, in order: the amount of flow sent, the cost of
+      sending one unit along the path, the arcs of the path, and +1 for each arc whose flow
+      increased or -1 for each whose flow was cancelled
+    """
+    return list(self._augmentations)
+
+  def MaximumFlow(self):
+    return sum(supply for supply in self._supply.values() if supply > 0)
+
+  def Solve(self, time_limit=None):
+    """
+    Parameters
+    ----------
+    time_limit : float or None
+      seconds after which no further augmentation is started
+
+    Returns
+    -------
+    status : int
+      OPTIMAL, INFEASIBLE if some supply cannot reach a node with demand, UNBALANCED if the
+      supplies do not sum to 0, or TIMEOUT, in which case the flows and their cost are those of
+      the supply sent so far
+
+    Raises
+    ------
+    SolverException
+      if an arc has a negative cost
+    """
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    tail, head, capacity, cost = self._arcs()
+    n_arcs = len(tail)
+    n_nodes = self.NumNodes()
+    flow = np.zeros(n_arcs, dtype=np.int64)
+    self._flow = flow
+    self._optimal_cost = None
+    self._augmentations = []
+    if n_arcs > 0 and cost.min() < 0:
+      raise SolverException('The ssp solver requires non-negative arc costs')
+    excess = np.zeros(n_nodes, dtype=np.int64)
+    for node, supply in self._supply.items():
+      excess[node] = supply
+    if excess.sum() != 0:
+      return self.UNBALANCED
+
+    # residual arc i < n_arcs is arc i, residual arc n_arcs + i is the reverse of arc i; residual
+    # arcs are kept sorted by tail, then id, so the arcs out of a set of nodes can be gathered at
+    # once, and are addressed by their position in that order
+    res_tail = np.concatenate((tail, head))
+    order = np.sort(res_tail * (2 * n_arcs) + np.arange(2 * n_arcs)) % (2 * n_arcs)
+    position = np.empty(2 * n_arcs, dtype=np.int64)
+    position[order] = np.arange(2 * n_arcs)
+    partner = position[(order + n_arcs) % (2 * n_arcs)]
+    res_tail = res_tail[order]
+    res_head = np.concatenate((head, tail))[order]
+    res_cost = np.concatenate((cost, -cost))[order]
+    res_capacity = np.concatenate((capacity, np.zeros(n_arcs, dtype=np.int64)))[order]
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(res_tail, minlength=n_nodes))))
+    # node potentials keep the reduced costs of residual arcs non-negative
+    potential = np.zeros(n_nodes, dtype=np.int64)
+    while (excess > 0).any():
+      if deadline is not None and time.perf_counter() >= deadline:
+        flow[:] = res_capacity[position[n_arcs:]]
+        self._optimal_cost = int((flow * cost).sum())
+        return self.TIMEOUT
+      dist, pred, sink = self._shortest_path(indptr, res_head, res_cost, res_capacity, excess, potential)
+      if sink < 0:
+        return self.INFEASIBLE
+
+      # walk back to a node with supply
+      path = []
+      node = sink
+      while pred[node] >= 0:
+        path.append(int(pred[node]))
+        node = int(res_tail[pred[node]])
+      path = np.array(path, dtype=np.int64)
+      amount = min(int(excess[node]), int(-excess[sink]), int(res_capacity[path].min()))
+      res_capacity[path] -= amount
+      res_capacity[partner[path]] += amount
+      excess[node] -= amount
+      excess[sink] += amount
+      arcs = order[path[::-1]]
+      self._augmentations.append((amount, int(res_cost[path].sum()), arcs % n_arcs, np.where(arcs < n_arcs, 1, -1)))
+      potential += np.minimum(dist, dist[sink])
+    # the flow on an arc is the residual capacity of its reverse
+    flow[:] = res_capacity[position[n_arcs:]]
+    self._optimal_cost = int((flow * cost).sum())
+    return self.OPTIMAL
+
+  @staticmethod
+  def _shortest_path(indptr, head, cost, capacity, excess, potential):
+    """
+    Label-correcting search over the residual arcs with positive <capacity>, indexed in CSR
+    order by <indptr>, from every node with positive <excess> until the nearest node with
+    negative excess is settled. Arcs are searched by their reduced costs, <cost> plus the
+    <potential> of their tail minus that of their head, which must be non-negative. Each round relaxes all arcs out of the nodes whose
+    label changed in the previous round at once; nodes whose label is not below that of the
+    nearest node with negative excess found so far are not expanded.
+
+    Sources start with label -potential, so labels plus potentials are distances from the set
+    of sources over the original costs and the labels are reduced distances.
+
+    Returns
+    -------
+    dist : np.ndarray of int64
+      label of each node, exact for nodes whose label is at most that of <sink>, or the int64
+      maximum if the node was not reached
+
+    pred : np.ndarray of int64
+      CSR position of the last arc on a shortest path, or -1 for sources and unreached nodes
+
+    sink : int
+      node with negative excess and the smallest label, or -1 if none was reached
+    """
+    n_nodes = len(excess)
+    inf = np.iinfo(np.int64).max
+    dist = np.full(n_nodes, inf, dtype=np.int64)
+    sources = np.flatnonzero(excess > 0)
+    dist[sources] = -potential[sources]
+    pred = np.full(n_nodes, -1, dtype=np.int64)
+    is_sink = excess < 0
+    nodes = sources
+    bound = inf
+    for i in range(n_nodes + 1):
+      sinks = np.flatnonzero(is_sink & (dist < inf))
+      if len(sinks) > 0:
+        bound = dist[sinks].min()
+      nodes = nodes[dist[nodes] < bound]
+      if len(nodes) == 0:
+        break
+      # CSR positions of the arcs out of <nodes>
+      starts = indptr[nodes]
+      counts = indptr[nodes + 1] - starts
+      arcs = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+      t = np.repeat(nodes, counts)
+      keep = capacity[arcs] > 0
+      arcs, t = arcs[keep], t[keep]
+      h = head[arcs]
+      cand = dist[t] + cost[arcs] + potential[t] - potential[h]
+      better = cand < dist[h]
+      h, arcs, cand = h[better], arcs[better], cand[better]
+      if len(h) == 0:
+        break
+      best = np.full(n_nodes, inf, dtype=np.int64)
+      np.minimum.at(best, h, cand)
+      # the first of the arcs reaching a node at its new label becomes its predecessor
+      win = cand == best[h]
+      nodes, first = np.unique(h[win], return_index=True)
+      dist[nodes] = best[nodes]
+      pred[nodes] = arcs[win][first]
+    else:
+      raise SolverException('Negative cost cycle in the residual network')
+    sinks = np.flatnonzero(is_sink & (dist < inf))
+    if len(sinks) == 0:
+      return dist, pred, -1
+    return dist, pred, int(sinks[np.argmin(dist[sinks])])
@@ -0,0 +1,319 @@
+"""
+Ingest raw STRING and iRefIndex interaction dumps
+
+A STRING protein.links.full file (or an iRefIndex MITAB file) lists every interaction the
+database knows about together with its evidence scores, and is usually distributed gzip
+compressed. string_to_abc streams such a dump in blocks of complete lines, keeps the
+interactions whose score passes a threshold, and writes them as an abc file (see
+flopro.parsers.abc) or as a compiled network (see flopro.network).
+
+Blocks are filtered by a pool of worker processes and written in file order, so the output does
+not depend on the number of processes. Only a few blocks are in flight at once, so memory use
+does not grow with the size of the dump.
+
+STRING
+  Proteins are named <taxon>.<ENSP>; interactions of other taxa are dropped and the taxon prefix
+  is removed. The score is an evidence channel, combined_score by default, on STRING's 0-1000
+  scale; the abc weight is score / 1000.
+
+iRefIndex
+  Interactors are named <db>:<id>; the db prefix is removed. Interactions with either interactor
+  outside of the taxon are dropped. The score is one of the np, lpr or hpr fields of the
+  confidence column; iRefIndex has no edge confidence on a [0,1] scale so every abc weight is 1.
+"""
+import os, os.path
+import sys
+import io
+import gzip
+import hashlib
+import collections
+import multiprocessing as mp
+from . import SimPathException
+from .network import DEDUPE_DEFAULT, CompiledNetwork, write_network
+from .parsers.abc import CHUNK_SIZE, iter_line_chunks, read_abc_arrays, parse_abc
+from .parsers.util import parse_db_header
+
+TAXON_DEFAULT = '9606'
+STRING_CHANNEL_DEFAULT = 'combined_score'
+STRING_SCORE_MAX = 1000
+IREFINDEX_CHANNELS = ['np', 'lpr', 'hpr']
+IREFINDEX_CHANNEL_DEFAULT = 'np'
+OUT_FORMATS = ['abc', 'compiled']
+GZIP_MAGIC = b'\x1f\x8b'
+
+# iRefIndex MITAB columns
+_UID_A, _UID_B, _TAX_A, _TAX_B, _CONFIDENCE = 0, 1, 9, 10, 14
+
+# abc weight text of each STRING score
+_STRING_WEIGHTS = ['{:g}'.format(score / STRING_SCORE_MAX).encode() for score in range(STRING_SCORE_MAX + 1)]
+
+class StringDbException(SimPathException):
+  pass
+
+def _open_db(fh):
+  """
+  Returns
+  -------
+  fh : io-like
+    binary file handle for a path, '-' (stdin), or a text or binary file handle; gzip
+    compressed input is decompressed transparently
+
+  close : bool
+    True if the caller is responsible for closing fh
+  """
+  close = False
+  if fh == '-':
+    fh = sys.stdin
+  if type(fh) is str:
+    fp = fh
+    fh = open(fp, 'rb')
+    close = True
+    if fh.peek(2)[:2] == GZIP_MAGIC:
+      fh.close()
+      fh = gzip.open(fp, 'rb')
+  else:
+    fh = getattr(fh, 'buffer', fh)
+    if hasattr(fh, 'peek') and fh.peek(2)[:2] == GZIP_MAGIC:
+      fh = gzip.GzipFile(fileobj=fh, mode='rb')
+  return fh, close
+
+class _ChunkFilter(object):
+  """
+  Picklable function from a block of database lines to a block of abc lines
+  """
+  def __init__(self, db_type, header, channel=None, min_score=0, taxon=TAXON_DEFAULT):
+    self.db_type = db_type
+    self.min_score = min_score
+    if db_type == 'string':
+      if channel is None:
+        channel = STRING_CHANNEL_DEFAULT
+      header = [word.decode() for word in header]
+      if channel not in header[2:]:
+        raise StringDbException('Unknown STRING channel "{}"; must be one of {}'.format(channel, ', '.join(header[2:])))
+      self.n_cols = len(header)
+      self.score_col = header.index(channel)
+      self.prefix = None if taxon is None else (taxon + '.').encode()
+    else:
+      if channel is None:
+        channel = IREFINDEX_CHANNEL_DEFAULT
+      if channel not in IREFINDEX_CHANNELS:
+        raise StringDbException('Unknown iRefIndex channel "{}"; must be one of {}'.format(channel, ', '.join(IREFINDEX_CHANNELS)))
+      self.channel = (channel + ':').encode()
+      self.taxid = None if taxon is None else 'taxid:{}('.format(taxon).encode()
+
+  def __call__(self, data):
+    """
+    Returns
+    -------
+    abc : bytes
+
+    n_lines : int
+      number of interactions in <data>
+
+    n_kept : int
+      number of interactions written to <abc>
+    """
+    if self.db_type == 'string':
+      return self._filter_string(data)
+    return self._filter_irefindex(data)
+
+  def _filter_string(self, data):
+    out = []
+    n_lines = 0
+    prefix = self.prefix
+    n_prefix = 0 if prefix is None else len(prefix)
+    for line in data.splitlines():
+      words = line.split()
+      if not words:
+        continue
+      n_lines += 1
+      if len(words) != self.n_cols:
+        raise StringDbException('Expected {} columns in STRING line: {}'.format(self.n_cols, line.decode('utf-8', 'replace')))
+      score = int(words[self.score_col])
+      if score < self.min_score:
+        continue
+      protein1, protein2 = words[0], words[1]
+      if prefix is not None:
+        if not (protein1.startswith(prefix) and protein2.startswith(prefix)):
+          continue
+        protein1 = protein1[n_prefix:]
+        protein2 = protein2[n_prefix:]
+      weight = _STRING_WEIGHTS[score] if 0 <= score <= STRING_SCORE_MAX else '{:g}'.format(score / STRING_SCORE_MAX).encode()
+      out.append(b' '.join((protein1, protein2, weight)))
+    return _join_lines(out), n_lines, len(out)
+
+  def _filter_irefindex(self, data):
+    out = []
+    n_lines = 0
+    for line in data.splitlines():
+      if not line.strip():
+        continue
+      n_lines += 1
+      words = line.split(b'\t')
+      if len(words) <= _CONFIDENCE:
+        raise StringDbException('Expected at least {} columns in iRefIndex line: {}'.format(_CONFIDENCE + 1, line.decode('utf-8', 'replace')))
+      if self.taxid is not None and not (words[_TAX_A].startswith(self.taxid) and words[_TAX_B].startswith(self.taxid)):
+        continue
+      score = None
+      for field in words[_CONFIDENCE].split(b'|'):
+        if field.startswith(self.channel):
+          score = int(field[len(self.channel):])
+      if score is None or score < self.min_score:
+        continue
+      uid_a = words[_UID_A].split(b':', 1)[-1]
+      uid_b = words[_UID_B].split(b':', 1)[-1]
+      out.append(b' '.join((uid_a, uid_b, b'1')))
+    return _join_lines(out), n_lines, len(out)
+
+def _join_lines(lines):
+  if not lines:
+    return b''
+  return b'\n'.join(lines) + b'\n'
+
+def iter_abc_blocks(fh, channel=None, min_score=0, taxon=TAXON_DEFAULT, processes=1, chunk_size=CHUNK_SIZE):
+  """
+  Stream a STRING or iRefIndex dump and yield its filtered interactions as abc; see module
+  docstring
+
+  Parameters
+  ----------
+  fh : str or file-like
+    path, '-' for stdin, or file handle of a possibly gzip compressed dump
+
+  channel : str or None
+    score to threshold; default is combined_score for STRING and np for iRefIndex
+
+  min_score : int
+    interactions with score < min_score are dropped
+
+  taxon : str or None
+    NCBI taxonomy id of interactions to keep; if None, keep all interactions and do not strip
+    STRING protein name prefixes
+
+  processes : int
+    number of worker processes filtering blocks of lines
+
+  Returns
+  -------
+  db_type : str
+
+  blocks : generator of (bytes, int, int)
+    see _ChunkFilter.__call__
+  """
+  fh, close = _open_db(fh)
+  try:
+    header = fh.readline()
+    try:
+      db_type = parse_db_header(header)
+    except RuntimeError as e:
+      raise StringDbException(str(e))
+    chunk_filter = _ChunkFilter(db_type, header.split(), channel=channel, min_score=min_score, taxon=taxon)
+  except:
+    if close:
+      fh.close()
+    raise
+  return db_type, _iter_filtered(fh, close, chunk_filter, processes, chunk_size)
+
+def _iter_filtered(fh, close, chunk_filter, processes, chunk_size):
+  try:
+    chunks = iter_line_chunks(fh, chunk_size)
+    if processes <= 1:
+      for data in chunks:
+        yield chunk_filter(data)
+      return
+    pool = mp.Pool(processes=processes)
+    try:
+      # keep a bounded number of blocks in flight, unlike Pool.imap which reads ahead without limit
+      pending = collections.deque()
+      for data in chunks:
+        pending.append(pool.apply_async(chunk_filter, (data,)))
+        if len(pending) >= 2 * processes:
+          yield pending.popleft().get()
+      while pending:
+        yield pending.popleft().get()
+    finally:
+      pool.terminate()
+      pool.join()
+  finally:
+    if close:
+      fh.close()
+
+def string_to_abc(infile, outfile, out_format='abc', channel=None, min_score=0, taxon=TAXON_DEFAULT, processes=1, cost_transform='linear100', dedupe=DEDUPE_DEFAULT):
+  """
+  Filter a STRING or iRefIndex dump into an abc file or compiled network
+
+  Parameters
+  ----------
+  infile : str or file-like
+    see iter_abc_blocks
+
+  outfile : str or file-like
+    if <out_format> is 'abc', path, '-' for stdout, or file handle; if 'compiled', the directory
+    to write the compiled network to, which must not exist
+
+  out_format : str
+    one of OUT_FORMATS
+
+  channel, min_score, taxon, processes
+    see iter_abc_blocks
+
+  cost_transform, dedupe : str
+    see flopro.network.load_network; only used if <out_format> is 'compiled'
+
+  Returns
+  -------
+  stats : dict
+    db_type, number of interactions read (n_lines) and kept (n_kept), and for compiled output
+    the number of kept interactions merged into another by <dedupe> (n_duplicates)
+  """
+  if out_format not in OUT_FORMATS:
+    raise StringDbException('Unknown output format "{}"; must be one of {}'.format(out_format, ', '.join(OUT_FORMATS)))
+  if out_format == 'compiled' and os.path.exists(outfile):
+    raise StringDbException('Compiled network output directory {} already exists'.format(outfile))
+
+  db_type, blocks = iter_abc_blocks(infile, channel=channel, min_score=min_score, taxon=taxon, processes=processes)
+  stats = {'db_type': db_type, 'n_lines': 0, 'n_kept': 0, 'n_duplicates': 0}
+  if out_format == 'abc':
+    if outfile == '-':
+      outfile = sys.stdout
+    close = type(outfile) is str
+    ofh = open(outfile, 'wb') if close else getattr(outfile, 'buffer', outfile)
+    try:
+      for abc, n_lines, n_kept in blocks:
+        ofh.write(abc)
+        stats['n_lines'] += n_lines
+        stats['n_kept'] += n_kept
+    finally:
+      if close:
+        ofh.close()
+      else:
+        ofh.flush()
+  else:
+    abc_blocks = []
+    for abc, n_lines, n_kept in blocks:
+      abc_blocks.append(abc)
+      stats['n_lines'] += n_lines
+      stats['n_kept'] += n_kept
+    abc = b''.join(abc_blocks)
+    del abc_blocks
+    abc_fh = io.BytesIO(abc)
+    network = CompiledNetwork.from_arrays(*read_abc_arrays(abc_fh), cost_transform=cost_transform, dedupe=dedupe)
+    network.manifest['network_id'] = hashlib.sha256(abc).hexdigest()[:16]
+    if type(infile) is str and infile != '-':
+      network.manifest['source'] = os.path.abspath(infile)
+    stats['n_duplicates'] = network.manifest['n_duplicates']
+    network.manifest['ingest'] = {'db_type': db_type, 'channel': channel, 'min_score': min_score, 'taxon': taxon}
+    write_network(network, outfile)
+  return stats
+
+def parse_string_fh(fh, channel=None, min_score=0, taxon=TAXON_DEFAULT):
+  """
+  Read a STRING or iRefIndex dump into a graph; see iter_abc_blocks
+
+  Returns
+  -------
+  G : nx.Graph
+    interaction network with abc weights as the "weight" edge attribute
+  """
+  db_type, blocks = iter_abc_blocks(fh, channel=channel, min_score=min_score, taxon=taxon)
+  return parse_abc(io.BytesIO(b''.join(abc for abc, n_lines, n_kept in blocks)))
@@ -0,0 +1,136 @@
+"""
+Nested subnetworks of the edges at or above a list of weight thresholds
+
+Filtering a network at several confidence cutoffs gives nested subnetworks: the edges with
+weight >= t for a tight cutoff t are a subset of those for any looser one. ThresholdSweep sorts
+the edges of a compiled network by weight once, so the edges of every subnetwork are a prefix of
+that order, and the edges added between two cutoffs are the slice between their prefixes. The
+subnetworks share the node ids and name table of the full network.
+
+flopro.flow.solve_thresholds solves the flow problem on each subnetwork from the tightest to the
+loosest cutoff. Because each subnetwork contains the previous one:
+
+  - connected components, and with them the feasibility check of flopro.feasibility, are
+    updated with only the added edges
+  - the optimal cost of a tighter cutoff is an upper bound on the optimal cost of a looser one,
+    since its flow is still a flow in the larger subnetwork
+  - if the added edges are all removed by pruning, the pruned problem is the same as the
+    previous one and its solution is reused
+"""
+import numpy as np
+from .network import CompiledNetwork
+
+class ThresholdSweep(object):
+  """
+  Parameters
+  ----------
+  network : flopro.network.CompiledNetwork
+
+  thresholds : list of float
+    weight cutoffs; an edge is kept at a cutoff if its weight is at least the cutoff
+
+  Attributes
+  ----------
+  thresholds : list of float
+    distinct cutoffs from tightest (largest) to loosest
+
+  n_edges : list of int
+    edges kept at each cutoff
+  """
+  def __init__(self, network, thresholds):
+    self.network = network
+    self.thresholds = sorted(set(float(threshold) for threshold in thresholds), reverse=True)
+    weight = np.asarray(network.weight)
+    # edges by decreasing weight, in network order among equal weights
+    self.order = np.argsort(-weight, kind='stable')
+    negated = -weight[self.order]
+    self.n_edges = [int(np.searchsorted(negated, -threshold, side='right')) for threshold in self.thresholds]
+
+  def edge_ids(self, i):
+    """
+    Returns
+    -------
+    edge_ids : np.ndarray of int64
+      edges kept at the i-th cutoff, in network order
+    """
+    return np.sort(self.order[:self.n_edges[i]])
+
+  def added_edge_ids(self, i):
+    """
+    Returns
+    -------
+    edge_ids : np.ndarray of int64
+      edges kept at the i-th cutoff but not at the one before it
+    """
+    start = self.n_edges[i - 1] if i > 0 else 0
+    return self.order[start:self.n_edges[i]]
+
+  def subnetwork(self, i):
+    """
+    Returns
+    -------
+    network : flopro.network.CompiledNetwork
+      edges kept at the i-th cutoff, in network order, over all nodes of the network; its
+      manifest records the cutoff as weight_threshold
+    """
+    network = self.network
+    edge_ids = self.edge_ids(i)
+    manifest = dict(network.manifest)
+    manifest['weight_threshold'] = self.thresholds[i]
+    manifest['n_edges'] = len(edge_ids)
+    return CompiledNetwork(network.names, network.tail[edge_ids], network.head[edge_ids], network.weight[edge_ids],
+      network.cost[edge_ids], manifest)
+
+class ThresholdResult(object):
+  """
+  Result of the flow problem at one cutoff; see flopro.flow.solve_thresholds
+
+  Attributes
+  ----------
+  threshold : float
+
+  n_edges : int
+    edges kept at the cutoff
+
+  feasibility : flopro.feasibility.Feasibility or None
+    result of the check, if one was run
+
+  problem : flopro.flow.FlowProblem or None
+    problem that was solved, or that of the tighter cutoff whose solution was reused; None if
+    the check found the problem infeasible
+
+  solved : bool
+
+  status : str
+    see flopro.flow.STATUSES
+
+  optimal_cost : int or None
+
+  cost_upper_bound : int or None
+    optimal cost of the nearest tighter cutoff that was solved
+
+  reused_from : float or None
+    tighter cutoff whose solution was reused because pruning left the same problem
+  """
+  def __init__(self, threshold, n_edges):
+    self.threshold = threshold
+    self.n_edges = n_edges
+    self.feasibility = None
+    self.problem = None
+    self.solved = False
+    self.status = None
+    self.optimal_cost = None
+    self.cost_upper_bound = None
+    self.reused_from = None
+
+def same_problem(pruned1, pruned2):
+  """
+  Returns
+  -------
+  same : bool
+    whether two pruned networks (see flopro.prune) over the same nodes have the same edges and
+    contracted chains
+  """
+  return (np.array_equal(pruned1.tail, pruned2.tail) and np.array_equal(pruned1.head, pruned2.head) and
+    np.array_equal(pruned1.cost, pruned2.cost) and pruned1.chains == pruned2.chains and
+    pruned1.chain_costs == pruned2.chain_costs)
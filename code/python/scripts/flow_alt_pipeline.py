@@ -5,7 +5,9 @@ import numpy as np
 import networkx as nx
 import flopro.parsers.abc
 from flopro import script_utils
-import flow
+import flopro.sim_results
+import flopro.sim_samples
+import flopro.flow as flow
 
 # TODO dont assume targets file is already pre-processed to be the same size as targets-file?
 # TODO check to assume all targets are in the network
@@ -20,18 +22,48 @@ null virus sources and targets.
   parser.add_argument('--alt-sources-file', required=True)
   parser.add_argument('--alt-targets-file', required=True)
   parser.add_argument('--n-simulation', required=True, help="Number of sub-samplings to perform")
+  parser.add_argument('--seed', type=int, help='seed of the simulated screens; see flow_sim_screens.py')
+  parser.add_argument('--null', choices=flopro.sim_samples.NULLS, default=flopro.sim_samples.NULL_DEFAULT, help='null model of the simulated screens; see flow_sim_screens.py')
+  parser.add_argument('--min-stratum-size', type=int, help='With --null degree, see flow_sim_screens.py')
   parser.add_argument('--local', action='store_true')
+  parser.add_argument('--jobs', type=int, help='With --local, number of jobs run at once; jobs start once the jobs they depend on have finished. Default is --workers, or 1')
   parser.add_argument('--dry-run', action='store_true')
+  parser.add_argument('--workers', type=int, help='Solve the simulated runs and compute node frequency in one flow_sim_engine.py job with this many worker processes, instead of one job per run or --batch-size runs')
+  parser.add_argument('--batch-size', type=int, default=1, help='Number of simulated runs solved by each job; with more than 1, jobs run flow_batch.py, which loads the network and builds the solver once per job')
+  parser.add_argument('--results-only', action='store_true', help='With --workers or --batch-size above 1, record the simulated runs only in the simulation result store, without a flow<i> output directory per run, and have flow_sim_signif.py and write_pvals.py read the store')
   args = parser.parse_args()
+  if args.results_only and args.workers is None and args.batch_size <= 1:
+    sys.stderr.write('--results-only requires --workers or --batch-size above 1; each flow.py job writes its own output directory\n')
+    sys.exit(2)
   script_utils.log_script(sys.argv)
 
   job_graph = nx.DiGraph()
   job_id = 0
 
+  # share one compiled network cache and network options among all jobs
+  # jobs that only read the node index of the network use the same cache entry
+  cache_args = ['--dedupe', args.dedupe]
+  if args.network_cache_dir is not None:
+    cache_args += ['--network-cache-dir', args.network_cache_dir]
+  network_args = cache_args + ['--prune', args.prune, '--solver', args.solver, '--precheck', args.precheck]
+  if args.time_limit is not None:
+    network_args += ['--time-limit', str(args.time_limit)]
+
+  # flow.py jobs append their per-phase metrics to one file
+  metrics_args = []
+  if args.metrics_out is not None:
+    metrics_args = ['--metrics-out', args.metrics_out]
+
+  sample_args = ['--null', args.null]
+  if args.seed is not None:
+    sample_args += ['--seed', str(args.seed)]
+  if args.min_stratum_size is not None:
+    sample_args += ['--min-stratum-size', str(args.min_stratum_size)]
+
   # sub-sample source lists from significant ICC-MS Hep C hits 
   attrs = {
     'exe': 'flow_sim_screens.py',
-    'args': ['--n-simulation', args.n_simulation, '--sources-file', args.sources_file, '--edges-file', args.edges_file, '--outdir', args.outdir, '--alt-sources-file', args.alt_sources_file],
+    'args': ['--n-simulation', args.n_simulation, '--sources-file', args.sources_file, '--edges-file', args.edges_file, '--outdir', args.outdir, '--alt-sources-file', args.alt_sources_file] + sample_args + cache_args,
     'out': os.path.join(args.outdir, 'flow_sim_screens.out'),
     'err': os.path.join(args.outdir, 'flow_sim_screens.err'),
     'env': 'flu'
@@ -42,39 +74,81 @@ null virus sources and targets.
   
   # NOTE the following is the same procedure as flow_sim_pipeline.py except for use of --alt-targets-file
 
-  # simulated runs of flow.py
-  flow_result_fps = []
+  # simulated runs of flow.py, of flow_batch.py with --batch-size runs per job, or of flow_sim_engine.py
+  # every job reads its simulations from the one sample matrix and appends its flow results to
+  # its own shard of one store directory, since appends to one file from jobs on different hosts
+  # are not safe over NFS; the store is started afresh so results of an earlier run of the
+  # pipeline are not counted
+  sim_samples_fp = os.path.join(args.outdir, flopro.sim_samples.SAMPLES_FN)
+  sim_results_dir = os.path.join(args.outdir, flopro.sim_results.RESULTS_DIR)
+  if not os.path.exists(sim_results_dir):
+    os.mkdir(sim_results_dir)
+  if not args.dry_run:
+    flopro.sim_results.clear(sim_results_dir)
+  sim_runs = []
   for i in range(int(args.n_simulation)):
     flow_outdir = os.path.join(args.outdir, 'flow{}'.format(i))
-    if not os.path.exists(flow_outdir):
+    if not args.results_only and not os.path.exists(flow_outdir):
       os.mkdir(flow_outdir) # TODO mkdir_p
-    sim_fp = os.path.join(args.outdir, 'sim{}.txt'.format(i))
+    sim_runs.append((i, flow_outdir))
+  results_only_args = ['--results-only'] if args.results_only else []
+
+  sim_flow_job_ids = []
+  if args.workers is not None:
+    # solve every simulated run and compute node frequency in one job
     attrs = {
-      'exe': 'flow.py',
-      'args': ['--sources-file', sim_fp, '--edges-file', args.edges_file, '--targets-file', args.alt_targets_file, '--outdir', flow_outdir, '--mapping-file', args.mapping_file, '--min-sources', str(args.min_sources), '--min-targets', str(args.min_targets), '--flow-only'],
-      'out': os.path.join(flow_outdir, 'flow.out'),
-      'err': os.path.join(flow_outdir, 'flow.err'),
+      'exe': 'flow_sim_engine.py',
+      'args': ['--edges-file', args.edges_file, '--targets-file', args.alt_targets_file, '--min-sources', str(args.min_sources), '--min-targets', str(args.min_targets), '--sim-samples', sim_samples_fp, '--sim-results', flopro.sim_results.shard_fp(sim_results_dir, 'flow_sim_engine'), '--outdir', args.outdir, '--workers', str(args.workers)] + results_only_args + network_args,
+      'out': os.path.join(args.outdir, 'flow_sim_engine.out'),
+      'err': os.path.join(args.outdir, 'flow_sim_engine.err'),
       'env': 'flu'
     }
     job_graph.add_node(job_id, **attrs)
     job_graph.add_edge(sim_screens_id, job_id)
-    flow_result_fps.append(os.path.join(flow_outdir, 'flow_result.graphml'))
     job_id += 1
+  elif args.batch_size <= 1:
+    for i, flow_outdir in sim_runs:
+      attrs = {
+        'exe': 'flow.py',
+        'args': ['--sources-file', sim_samples_fp, '--sim-index', str(i), '--sim-results', flopro.sim_results.shard_fp(sim_results_dir, 'flow{}'.format(i)), '--edges-file', args.edges_file, '--targets-file', args.alt_targets_file, '--outdir', flow_outdir, '--mapping-file', args.mapping_file, '--min-sources', str(args.min_sources), '--min-targets', str(args.min_targets), '--flow-only'] + network_args + metrics_args,
+        'out': os.path.join(flow_outdir, 'flow.out'),
+        'err': os.path.join(flow_outdir, 'flow.err'),
+        'env': 'flu'
+      }
+      job_graph.add_node(job_id, **attrs)
+      job_graph.add_edge(sim_screens_id, job_id)
+      sim_flow_job_ids.append(job_id)
+      job_id += 1
+  else:
+    for batch_start in range(0, len(sim_runs), args.batch_size):
+      batch = sim_runs[batch_start:batch_start + args.batch_size]
+      batch_name = 'flow_batch{}'.format(batch_start // args.batch_size)
+      attrs = {
+        'exe': 'flow_batch.py',
+        'args': ['--edges-file', args.edges_file, '--targets-file', args.alt_targets_file, '--min-sources', str(args.min_sources), '--min-targets', str(args.min_targets)] + network_args + ['--sim-samples', sim_samples_fp, '--sims', str(batch[0][0]), str(batch[-1][0] + 1), '--sim-results', flopro.sim_results.shard_fp(sim_results_dir, batch_name)] + results_only_args,
+        'out': os.path.join(args.outdir, batch_name + '.out'),
+        'err': os.path.join(args.outdir, batch_name + '.err'),
+        'env': 'flu'
+      }
+      job_graph.add_node(job_id, **attrs)
+      job_graph.add_edge(sim_screens_id, job_id)
+      sim_flow_job_ids.append(job_id)
+      job_id += 1
 
   # compute node frequency
-  attrs = {
-    'exe': 'flow_sim_frequency.py',
-    'args': ['--flow-results'] + flow_result_fps + ['--edges-file', args.edges_file, '--outdir', args.outdir],
-    'out': os.path.join(args.outdir, 'flow_sim_frequency.out'),
-    'err': os.path.join(args.outdir, 'flow_sim_frequency.err'),
-    'env': 'flu'
-  }
-  freq_job_id = job_id
-  job_graph.add_node(freq_job_id, **attrs)
-  for i in range(int(args.n_simulation)):
-    sim_flow_job_id = i+1
-    job_graph.add_edge(sim_flow_job_id, freq_job_id)
-  job_id += 1
+  if args.workers is None:
+    attrs = {
+      'exe': 'flow_sim_frequency.py',
+      'args': ['--sim-results', sim_results_dir, '--edges-file', args.edges_file, '--outdir', args.outdir] + cache_args,
+      'out': os.path.join(args.outdir, 'flow_sim_frequency.out'),
+      'err': os.path.join(args.outdir, 'flow_sim_frequency.err'),
+      'env': 'flu'
+    }
+    freq_job_id = job_id
+    job_graph.add_node(freq_job_id, **attrs)
+    for sim_flow_job_id in sim_flow_job_ids:
+      job_graph.add_edge(sim_flow_job_id, freq_job_id)
+    job_id += 1
 
   # do the real flow run
   flow_outdir = os.path.join(args.outdir, 'flow_real')
@@ -82,7 +156,7 @@ null virus sources and targets.
     os.mkdir(flow_outdir)
   attrs = {
     'exe': 'flow.py',
-    'args': ['--sources-file', args.sources_file, '--edges-file', args.edges_file, '--targets-file', args.targets_file, '--outdir', flow_outdir, '--mapping-file', args.mapping_file, '--min-sources', str(args.min_sources), '--min-targets', str(args.min_targets), '--node-weights', os.path.join(args.outdir, 'node_frequency.csv')],
+    'args': ['--sources-file', args.sources_file, '--edges-file', args.edges_file, '--targets-file', args.targets_file, '--outdir', flow_outdir, '--mapping-file', args.mapping_file, '--min-sources', str(args.min_sources), '--min-targets', str(args.min_targets), '--node-weights', os.path.join(args.outdir, 'node_frequency.csv')] + network_args + metrics_args,
     'out': os.path.join(flow_outdir, 'flow.out'),
     'err': os.path.join(flow_outdir, 'flow.err'),
     'env': 'flu'
@@ -94,9 +168,12 @@ null virus sources and targets.
   # do significance test
   node_frequency_fp = os.path.join(args.outdir, 'node_frequency.csv')
   flow_result_fp = os.path.join(flow_outdir, 'flow_result.graphml')
+  frequency_args = ['--node-frequency', node_frequency_fp]
+  if args.results_only:
+    frequency_args = ['--sim-results', sim_results_dir, '--edges-file', args.edges_file] + cache_args
   attrs = {
     'exe': 'flow_sim_signif.py',
-    'args': ['--flow-result', flow_result_fp, '--node-frequency', node_frequency_fp, '--outdir', args.outdir],
+    'args': ['--flow-result', flow_result_fp] + frequency_args + ['--outdir', args.outdir],
     'out': os.path.join(args.outdir, 'flow_sim_signif.out'),
     'err': os.path.join(args.outdir, 'flow_sim_signif.err'),
     'env': 'flu'
@@ -108,7 +185,7 @@ null virus sources and targets.
   # add p-value table
   attrs = {
     'exe':'write_pvals.py',
-    'args': ['-q', node_frequency_fp, '-n', args.n_simulation, '-f', flow_result_fp, '-o', os.path.join(args.outdir, 'pvals.csv')],
+    'args': frequency_args + ['-n', args.n_simulation, '-f', flow_result_fp, '-o', os.path.join(args.outdir, 'pvals.csv')],
     'out': os.path.join(args.outdir, 'write_pvals.out'),
     'err': os.path.join(args.outdir, 'write_pvals.err'),
     'env': 'flu'
@@ -118,7 +195,8 @@ null virus sources and targets.
   job_id += 1
   
   condor = (not args.local)
-  script_utils.run_digraph(args.outdir, job_graph, condor=condor, dry_run=args.dry_run)
+  jobs = args.jobs if args.jobs is not None else (args.workers or 1)
+  script_utils.run_digraph(args.outdir, job_graph, condor=condor, dry_run=args.dry_run, workers=jobs)
 
 if __name__ == "__main__":
   main()
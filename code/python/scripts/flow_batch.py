@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+Solve the flow problem of flow.py for many source files against the same network and targets in
+one process. The network is loaded and its solver arcs are built once, and runs only change node
+supplies (see BatchSolver), so the solver is never rebuilt and the flow of a run does not depend
+on the runs solved before it. Each run writes flow_result.graphml and flow_meta.tsv to its output
+directory, as flow.py --flow-only does.
+
+The network is pruned once (see flow.py --prune) for the union of all source files, which
+keeps every node that can carry flow in any of the runs.
+
+Runs can also be simulations of a sample matrix written by flow_sim_screens.py (see
+flopro.sim_samples), read directly with --sim-samples. With --sim-results, the outcome, metrics
+and flow graph of every run are also appended to a simulation result store (see
+flopro.sim_results), numbered by simulation. With --results-only as well, the store is the only
+output of the runs, and no per-run output directories are created.
+"""
+import argparse, sys
+import os, os.path
+import numpy as np
+import flopro.feasibility
+import flopro.flow_result
+import flopro.metrics
+import flopro.sim_results
+import flopro.sim_samples
+import flopro.solvers
+import flopro.flow as flow
+
+class BatchSolver(object):
+  """
+  Solver of the flow problems of many source sets, built once
+
+  Instead of the artificial source of flow.py, with arcs of capacity min_targets to the sources
+  of one run, every node of <all_sources> gets a gate node with an arc of capacity min_targets to
+  it and an arc to a slack node, all of cost 0. A run gives the gates of its sources a supply of
+  min_targets each and the slack node a demand of the supply that is not needed, so that exactly
+  min_sources * min_targets units reach the artificial target through the network, and each
+  source sends at most min_targets of them, as in flow.py. The optimal cost is the same. Runs
+  only set node supplies, so every run is solved on the same arcs, and its flow depends only on
+  its sources, not on the runs solved before it.
+
+  Parameters
+  ----------
+  network : flopro.network.CompiledNetwork
+
+  targets : set of str
+
+  all_sources : set of str
+    union of the sources of every run
+
+  min_sources, min_targets : int
+    see flow.py
+
+  prune : str
+    see flopro.prune.prune_network
+
+  solver : str
+    see flopro.solvers
+
+  precheck : str
+    see flopro.feasibility; runs that fail the check are not solved
+
+  time_limit : float or None
+    seconds the solver may run for each run; see flopro.solvers
+  """
+  def __init__(self, network, targets, all_sources, min_sources, min_targets, prune, solver=flopro.solvers.SOLVER_DEFAULT, precheck=flopro.feasibility.PRECHECK_DEFAULT, time_limit=None):
+    self.network = network
+    self.id_table = network.id_table()
+    self.flow = min_sources * min_targets
+    self.source_capacity = min_targets
+    self.targets = targets
+    self.min_sources = min_sources
+    self.solver = solver
+    self.min_targets = min_targets
+    self.pruned = flow.prune_network(network, self.id_table, all_sources, targets, mode=prune)
+    source_ids = self.id_table.ids(sorted(all_sources))
+    self.source_ids = np.unique(source_ids[source_ids >= 0])
+    self.precheck = precheck
+    self.time_limit = time_limit
+    self.feasibility = None
+    self.status = None
+    self.metrics = None
+    if precheck != 'none':
+      self.labels = flopro.feasibility.connected_components(self.id_table.n_nodes, self.pruned.tail, self.pruned.head)
+      target_ids = self.id_table.ids(list(targets))
+      self.target_ids = target_ids[target_ids >= 0]
+    self.reset()
+
+  def reset(self):
+    """
+    Build the solver, with a gate node for each node of all_sources, as the node ids
+    id_table.target_id + 1, ..., in node id order, and the slack node after them
+    """
+    self.G = flow.build_solver(self.pruned.tail, self.pruned.head, self.pruned.cost, self.flow, solver=self.solver)
+    flow.add_sources_targets(self.G, [], self.targets, self.id_table, self.source_capacity, self.min_sources)
+    self.G.SetNodeSupply(self.id_table.target_id, -self.flow)
+    gate_ids = np.arange(len(self.source_ids)) + self.id_table.target_id + 1
+    self.gates = dict(zip(self.source_ids.tolist(), gate_ids.tolist()))
+    self.slack_id = self.id_table.target_id + 1 + len(self.source_ids)
+    zeros = np.zeros(len(self.source_ids), dtype=np.int64)
+    capacities = np.full(len(self.source_ids), self.source_capacity, dtype=np.int64)
+    self.G.AddArcsWithCapacityAndUnitCost(gate_ids, self.source_ids, capacities, zeros)
+    self.G.AddArcsWithCapacityAndUnitCost(gate_ids, np.full(len(self.source_ids), self.slack_id, dtype=np.int64), capacities, zeros)
+    self.run_gates = []
+
+  def solve(self, sources):
+    """
+    Returns
+    -------
+    solved : bool
+      False if the run failed the precheck, in which case self.feasibility says why, or could
+      not be solved; self.status is the outcome, one of flopro.flow.STATUSES, and self.metrics
+      times the precheck and solve of the run
+    """
+    self.metrics = flopro.metrics.Metrics()
+    source_ids = self.id_table.ids(sorted(sources))
+    source_ids = source_ids[source_ids >= 0]
+    if self.precheck != 'none':
+      with self.metrics.phase('precheck'):
+        self.feasibility = flopro.feasibility.check_feasibility(self.labels, source_ids, self.target_ids, self.min_sources, self.min_targets, mode=self.precheck)
+      self.metrics.set('feasibility', self.feasibility.to_dict())
+      if not self.feasibility.feasible:
+        self.status = 'infeasible'
+        self.metrics.set('status', self.status)
+        return False
+    for gate_id in self.run_gates:
+      self.G.SetNodeSupply(gate_id, 0)
+    self.run_gates = [self.gates[node_id] for node_id in source_ids.tolist()]
+    excess = len(self.run_gates) * self.source_capacity - self.flow
+    if excess < 0:
+      # the sources cannot send min_sources * min_targets units, as with flow.py's source arcs
+      self.run_gates = []
+      self.status = 'infeasible'
+      self.metrics.set('status', self.status)
+      return False
+    for gate_id in self.run_gates:
+      self.G.SetNodeSupply(gate_id, self.source_capacity)
+    self.G.SetNodeSupply(self.slack_id, -excess)
+    with self.metrics.phase('solve'):
+      status = self.G.Solve() if self.time_limit is None else self.G.Solve(time_limit=self.time_limit)
+    if status == self.G.OPTIMAL:
+      self.status = 'optimal'
+    elif status == self.G.TIMEOUT:
+      self.status = 'timeout'
+    elif status == self.G.INFEASIBLE:
+      self.status = 'infeasible'
+    else:
+      self.status = 'failed'
+    self.metrics.set('status', self.status)
+    return self.status == 'optimal'
+
+  def flow_result(self):
+    """
+    Returns
+    -------
+    result : flopro.flow_result.FlowResult
+      arcs carrying flow in the last solved run, with the gates given the id of the artificial
+      source, id_table.source_id, as in flow.py, and without the arcs to the slack node
+    """
+    result = flow.flow_result(self.G, self.id_table, self.pruned)
+    keep = result.heads != self.slack_id
+    tails = result.tails[keep]
+    tails[tails > self.id_table.target_id] = self.id_table.source_id
+    return flopro.flow_result.FlowResult(tails, result.heads[keep], result.flows[keep], self.id_table,
+      None if result.costs is None else result.costs[keep])
+
+  def flow_graph(self):
+    """
+    Returns
+    -------
+    H : nx.DiGraph
+      flow of the last solved run, without the artificial source and target; its optimal cost
+      and size are added to self.metrics
+    """
+    with self.metrics.phase('extract'):
+      H = self.flow_result().to_networkx()
+    self.metrics.set('optimal_cost', self.G.OptimalCost())
+    self.metrics.set('n_flow_nodes', H.number_of_nodes())
+    self.metrics.set('n_flow_edges', H.number_of_edges())
+    return H
+
+def read_batch_file(fp):
+  """
+  Returns
+  -------
+  pairs : list of (str, str)
+    sources file and output directory of each run, from the tab-separated lines of <fp>
+  """
+  pairs = []
+  with open(fp) as fh:
+    for line in fh:
+      line = line.rstrip('\n')
+      if line:
+        sources_fp, outdir = line.split('\t')
+        pairs.append((sources_fp, outdir))
+  return pairs
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  flow.add_network_args(parser)
+  parser.add_argument('--targets-file', required=True, help='target node file path')
+  parser.add_argument('--min-sources', type=int, required=True, help='see flow.py')
+  parser.add_argument('--min-targets', type=int, required=True, help='see flow.py')
+  parser.add_argument('--sources-files', nargs='*', default=[], help='source node file of each run')
+  parser.add_argument('--outdirs', nargs='*', default=[], help='output directory of each run, in the order of --sources-files')
+  parser.add_argument('--batch-file', help='tab-separated file of <sources file> <output directory> lines; runs are appended to those of --sources-files')
+  parser.add_argument('--sim-samples', help='sample matrix written by flow_sim_screens.py; simulation i in --sims is solved into <sim-outdir>/flow<i> after the other runs')
+  parser.add_argument('--sims', type=int, nargs=2, metavar=('START', 'STOP'), help='simulations START, ..., STOP - 1 of --sim-samples; default is all of them')
+  parser.add_argument('--sim-outdir', help='directory of the flow<i> output directories of --sim-samples; default is the directory of --sim-samples')
+  parser.add_argument('--sim-results', help='simulation result store to append the outcome of every run to; runs of --sim-samples are numbered by simulation and other runs -1')
+  parser.add_argument('--results-only', action='store_true', help='only append the outcome of every run to --sim-results, without writing per-run output directories')
+  parser.add_argument('--no-exit-on-fail', action='store_true', help='see flow.py')
+  parser.add_argument('--verbose', '-v', action='store_true')
+  args = parser.parse_args()
+  if args.results_only and args.sim_results is None:
+    sys.stderr.write('--results-only requires --sim-results\n')
+    sys.exit(2)
+
+  if len(args.sources_files) != len(args.outdirs):
+    sys.stderr.write('--sources-files and --outdirs must have the same length\n')
+    sys.exit(2)
+  runs = list(zip(args.sources_files, args.outdirs))
+  if args.batch_file is not None:
+    runs += read_batch_file(args.batch_file)
+  sources_per_run = [flow.parse_nodes(sources_fp) for sources_fp, outdir in runs]
+  run_numbers = [-1] * len(runs)
+  if args.sim_samples is not None:
+    samples = flopro.sim_samples.SimSamples.read(args.sim_samples)
+    start, stop = args.sims if args.sims is not None else (0, len(samples))
+    sim_outdir = args.sim_outdir if args.sim_outdir is not None else os.path.dirname(args.sim_samples)
+    for i in range(start, stop):
+      runs.append(('sim{}'.format(i), os.path.join(sim_outdir, 'flow{}'.format(i))))
+      sources_per_run.append(samples.sources(i))
+      run_numbers.append(i)
+
+  targets = flow.parse_nodes(args.targets_file)
+  network = flow.load_network(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe, verbose=args.verbose)
+  solver = BatchSolver(network, targets, set().union(*sources_per_run), args.min_sources, args.min_targets, args.prune, solver=args.solver, precheck=args.precheck, time_limit=args.time_limit)
+  store = None
+  if args.sim_results is not None:
+    store = flopro.sim_results.ResultStore.for_network(args.sim_results, network)
+
+  failed_statuses = set()
+  for (sources_fp, outdir), sources, run in zip(runs, sources_per_run, run_numbers):
+    if not args.results_only and not os.path.exists(outdir):
+      os.makedirs(outdir)
+    if solver.solve(sources):
+      H = solver.flow_graph()
+      cost = solver.G.OptimalCost()
+      print('{}\t{}'.format(sources_fp, cost))
+      if not args.results_only:
+        flow.write_flow_result(H, outdir, solver.flow, network)
+      if store is not None:
+        store.append_result(run, solver.status, cost, H.nodes(), H.edges(data='flow'), solver.metrics.to_dict())
+      continue
+    if store is not None:
+      store.append_result(run, solver.status, metrics=solver.metrics.to_dict())
+    failed_statuses.add(solver.status)
+    if solver.feasibility is not None and not solver.feasibility.feasible:
+      sys.stderr.write('Infeasible {}: {}\n'.format(sources_fp, solver.feasibility.summary(args.min_sources, args.min_targets)))
+    elif solver.status == 'timeout':
+      sys.stderr.write('Timed out {} after {} seconds\n'.format(sources_fp, args.time_limit))
+    else:
+      sys.stderr.write('Could not solve {}\n'.format(sources_fp))
+  sys.stdout.flush()
+
+  # the exit status of the most pressing outcome of the runs that were not solved; see flow.py
+  if len(failed_statuses) > 0 and not args.no_exit_on_fail:
+    sys.exit(flow.exit_status(failed_statuses))
+
+if __name__ == "__main__":
+  main()
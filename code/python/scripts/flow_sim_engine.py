@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+Solve the flow problem of flow.py for many simulated source files with a pool of worker
+processes and compute the node frequency of the resulting flow graphs, as flow_sim_frequency.py
+does, in one job.
+
+Each worker loads and prunes the network once (see flow_batch.BatchSolver), then solves the
+shards of consecutive runs it is handed. Each run writes flow_result.graphml and flow_meta.tsv
+to its output directory, as flow.py --flow-only does, and the outcome, metrics and flow graph of
+each run stream back to this process shard by shard, in run order.
+
+Each worker builds its solver once and keeps it for every shard; runs only change node supplies
+(see flow_batch.BatchSolver), so the flow graph of a run, even one with several equal-cost
+optima, does not depend on --chunk-size, --workers or which worker solves which shard.
+
+Simulated runs are read directly from the sample matrix written by flow_sim_screens.py with
+--sim-samples (see flopro.sim_samples). The outcome, metrics and flow graph of every run are
+collected as simulation result records (see flopro.sim_results), from which node frequency is
+counted, and which --sim-results also appends to a store. With --results-only, the simulated
+runs write no flow<i> output directories, and the store is their only output.
+"""
+import argparse, sys
+import os, os.path
+import multiprocessing as mp
+import flopro.feasibility
+import flopro.network
+import flopro.node_index
+import flopro.prune
+import flopro.sim_results
+import flopro.sim_samples
+import flopro.solvers
+import flopro.flow as flow
+import flow_batch
+
+CHUNK_SIZE_DEFAULT = 25
+
+# per-worker state, set by _init_worker
+_worker = {}
+
+def _init_worker(edges_file, cache_dir, dedupe, targets, all_sources, min_sources, min_targets, prune, solver, precheck, time_limit):
+  network = flow.load_network(edges_file, cache_dir=cache_dir, dedupe=dedupe)
+  _worker['network'] = network
+  _worker['solver'] = flow_batch.BatchSolver(network, targets, all_sources, min_sources, min_targets, prune, solver=solver, precheck=precheck, time_limit=time_limit)
+
+def _solve_shard(shard):
+  """
+  Parameters
+  ----------
+  shard : list of (int, set of str, str or None)
+    run index, sources and output directory of consecutive runs; runs without an output
+    directory only return their nodes
+
+  Returns
+  -------
+  results : list of (int, str, int or None, list of str, list of (str, str, int), dict)
+    run index, status (see flopro.flow.STATUSES), optimal cost or None if the run could not be
+    solved, nodes and edges of the flow graph, and metrics of the run
+  """
+  solver = _worker['solver']
+  results = []
+  for i, sources, outdir in shard:
+    if not solver.solve(sources):
+      results.append((i, solver.status, None, [], [], solver.metrics.to_dict()))
+      continue
+    H = solver.flow_graph()
+    if outdir is not None:
+      if not os.path.exists(outdir):
+        os.makedirs(outdir)
+      flow.write_flow_result(H, outdir, solver.flow, _worker['network'])
+    results.append((i, solver.status, solver.G.OptimalCost(), list(H.nodes()), list(H.edges(data='flow')), solver.metrics.to_dict()))
+  return results
+
+class Engine(object):
+  """
+  Worker processes that each load the network and build a BatchSolver once, and then solve the
+  shards they are handed; with 1 worker, shards are solved in this process
+
+  Parameters
+  ----------
+  all_sources : set of str
+    union of the sources of every run the engine will solve
+
+  workers : int
+
+  See run_simulations for the other parameters.
+  """
+  def __init__(self, edges_file, targets, all_sources, min_sources, min_targets, workers=1, cache_dir=None, dedupe=flopro.network.DEDUPE_DEFAULT, prune=flopro.prune.PRUNE_DEFAULT, solver=flopro.solvers.SOLVER_DEFAULT, precheck=flopro.feasibility.PRECHECK_DEFAULT, time_limit=None):
+    init_args = (edges_file, cache_dir, dedupe, targets, all_sources, min_sources, min_targets, prune, solver, precheck, time_limit)
+    self.pool = None
+    if workers == 1:
+      _init_worker(*init_args)
+    else:
+      self.pool = mp.Pool(processes=workers, initializer=_init_worker, initargs=init_args)
+
+  def solve(self, shards):
+    """
+    Returns
+    -------
+    results : iterator of tuple
+      see _solve_shard, in the order of <shards>
+    """
+    if self.pool is None:
+      for shard in shards:
+        for result in _solve_shard(shard):
+          yield result
+      return
+    for results in self.pool.imap(_solve_shard, shards):
+      for result in results:
+        yield result
+
+  def close(self):
+    if self.pool is not None:
+      self.pool.terminate()
+      self.pool.join()
+      self.pool = None
+
+def shard_runs(tasks, chunk_size=CHUNK_SIZE_DEFAULT):
+  """
+  Returns
+  -------
+  shards : list of list
+    consecutive <chunk_size> tasks
+  """
+  return [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+
+def run_simulations(runs, edges_file, targets, min_sources, min_targets, workers=1, chunk_size=CHUNK_SIZE_DEFAULT, cache_dir=None, dedupe=flopro.network.DEDUPE_DEFAULT, prune=flopro.prune.PRUNE_DEFAULT, solver=flopro.solvers.SOLVER_DEFAULT, precheck=flopro.feasibility.PRECHECK_DEFAULT, time_limit=None):
+  """
+  Parameters
+  ----------
+  runs : list of (set of str, str)
+    sources and output directory of each run
+
+  workers : int
+    number of worker processes; with 1, runs are solved in this process
+
+  chunk_size : int
+    number of runs in each shard
+
+  Returns
+  -------
+  results : iterator of tuple
+    see _solve_shard, in run order
+  """
+  all_sources = set().union(*[sources for sources, outdir in runs])
+  tasks = [(i, sources, outdir) for i, (sources, outdir) in enumerate(runs)]
+  shards = shard_runs(tasks, chunk_size)
+  engine = Engine(edges_file, targets, all_sources, min_sources, min_targets, workers=max(1, min(workers, len(shards))),
+    cache_dir=cache_dir, dedupe=dedupe, prune=prune, solver=solver, precheck=precheck, time_limit=time_limit)
+  try:
+    for result in engine.solve(shards):
+      yield result
+  finally:
+    engine.close()
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  flow.add_network_args(parser)
+  parser.add_argument('--targets-file', required=True, help='target node file path')
+  parser.add_argument('--min-sources', type=int, required=True, help='see flow.py')
+  parser.add_argument('--min-targets', type=int, required=True, help='see flow.py')
+  parser.add_argument('--sources-files', nargs='*', default=[], help='source node file of each run')
+  parser.add_argument('--outdirs', nargs='*', default=[], help='output directory of each run, in the order of --sources-files')
+  sims = parser.add_mutually_exclusive_group()
+  sims.add_argument('--sim-samples', help='after the runs of --sources-files, solve simulation i of this sample matrix, written by flow_sim_screens.py, into <outdir>/flow<i>')
+  sims.add_argument('--n-simulation', type=int, help='after the runs of --sources-files, solve <outdir>/sim<i>.txt into <outdir>/flow<i> for i < N, as written by flow_sim_screens.py --write-txt')
+  parser.add_argument('--outdir', required=True, help='directory for node_frequency.csv, flow_costs.tsv and flow_status.tsv')
+  parser.add_argument('--workers', type=int, default=mp.cpu_count(), help='number of worker processes; default is the number of CPUs')
+  parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE_DEFAULT, help='number of consecutive runs in each shard handed to a worker; default {}'.format(CHUNK_SIZE_DEFAULT))
+  parser.add_argument('--sim-results', help='simulation result store to also append the outcome of every run to; runs of --sim-samples are numbered by simulation and other runs -1')
+  parser.add_argument('--results-only', action='store_true', help='solve the simulations of --sim-samples or --n-simulation without writing their flow<i> output directories; their outcome is only recorded in --sim-results and the files of --outdir')
+  parser.add_argument('--no-exit-on-fail', action='store_true', help='see flow.py')
+  args = parser.parse_args()
+
+  if len(args.sources_files) != len(args.outdirs):
+    sys.stderr.write('--sources-files and --outdirs must have the same length\n')
+    sys.exit(2)
+  run_fps = list(zip(args.sources_files, args.outdirs))
+  if args.n_simulation is not None:
+    run_fps += [(os.path.join(args.outdir, 'sim{}.txt'.format(i)), None if args.results_only else os.path.join(args.outdir, 'flow{}'.format(i))) for i in range(args.n_simulation)]
+  runs = [(flow.parse_nodes(sources_fp), outdir) for sources_fp, outdir in run_fps]
+  run_numbers = [-1] * len(args.sources_files) + list(range(len(runs) - len(args.sources_files)))
+  if args.sim_samples is not None:
+    samples = flopro.sim_samples.SimSamples.read(args.sim_samples)
+    for i, sources in enumerate(samples):
+      outdir = None if args.results_only else os.path.join(args.outdir, 'flow{}'.format(i))
+      run_fps.append(('sim{}'.format(i), outdir))
+      runs.append((sources, outdir))
+      run_numbers.append(i)
+  targets = flow.parse_nodes(args.targets_file)
+
+  node_index = flopro.node_index.load_node_index(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe)
+  store = flopro.sim_results.ResultStore(args.sim_results, node_index.names)
+
+  n_failed = 0
+  records = []
+  results = run_simulations(runs, args.edges_file, targets, args.min_sources, args.min_targets,
+    workers=args.workers, chunk_size=args.chunk_size, cache_dir=args.network_cache_dir,
+    dedupe=args.dedupe, prune=args.prune, solver=args.solver, precheck=args.precheck, time_limit=args.time_limit)
+  with open(os.path.join(args.outdir, 'flow_costs.tsv'), 'w') as costs_fh:
+    for i, status, cost, nodes, edges, metrics in results:
+      sources_fp = run_fps[i][0]
+      records.append(store.encode(run_numbers[i], status, cost, nodes, edges, metrics))
+      if cost is None:
+        sys.stderr.write('Could not solve {}: {}\n'.format(sources_fp, status))
+        costs_fh.write('{}\tNA\t{}\n'.format(sources_fp, status))
+        n_failed += 1
+        continue
+      costs_fh.write('{}\t{}\t{}\n'.format(sources_fp, cost, status))
+  if args.sim_results is not None:
+    store.append(records)
+  sim_results = flopro.sim_results.SimResults.from_bytes(b''.join(records), names=node_index.names)
+  counts = sim_results.frequency(len(node_index))
+  status_counts = dict.fromkeys(flow.STATUSES, 0)
+  status_counts.update(sim_results.status_counts())
+
+  ofp = os.path.join(args.outdir, 'node_frequency.csv')
+  with open(ofp, 'w') as ofh:
+    for node, count in zip(node_index.names, counts.tolist()):
+      ofh.write('{},{}\n'.format(node, count))
+
+  # runs that timed out are counted apart from infeasible ones
+  with open(os.path.join(args.outdir, 'flow_status.tsv'), 'w') as fh:
+    for status in flow.STATUSES:
+      fh.write('{}\t{}\n'.format(status, status_counts[status]))
+
+  if n_failed > 0 and not args.no_exit_on_fail:
+    # the exit status of the most pressing outcome of the runs that were not solved, as flow.py maps it
+    sys.exit(flow.exit_status([status for status in flow.STATUSES if status_counts[status] > 0]))
+
+if __name__ == "__main__":
+  main()
@@ -1,35 +1,168 @@
 #!/usr/bin/env python
 import sys, argparse
 import os, os.path
-import networkx as nx
-import flopro.parsers.abc
+import re
+import json
+import multiprocessing as mp
+import xml.etree.ElementTree as ET
+import flopro.node_index
+import flopro.flow as flow
+import flopro.sim_results
+
+GRAPHML_NODE_TAG = '{http://graphml.graphdrawing.org/xmlns}node'
+
+def read_status(flow_result_fp):
+  """
+  Returns
+  -------
+  status : str or None
+    status of the run that wrote <flow_result_fp>, from the flow_metrics.json flow.py writes to
+    the same directory, or None if there is none
+  """
+  metrics_fp = os.path.join(os.path.dirname(flow_result_fp), 'flow_metrics.json')
+  if not os.path.exists(metrics_fp):
+    return None
+  with open(metrics_fp) as fh:
+    return json.load(fh)['stats'].get('status')
+
+def read_graphml_nodes(fp):
+  """
+  Returns
+  -------
+  nodes : list of str
+    node ids of the graphml file <fp>, read without building a graph
+  """
+  nodes = []
+  for event, elem in ET.iterparse(fp):
+    if elem.tag == GRAPHML_NODE_TAG:
+      nodes.append(elem.get('id'))
+    elem.clear()
+  return nodes
+
+def import_flow_result(run_fp):
+  """
+  Parameters
+  ----------
+  run_fp : (int, str)
+    run number and flow_result.graphml path of a run
+
+  Returns
+  -------
+  result : (int, str, str, list of str)
+    run number, path, status and nodes of the run; runs without a flow result, and partial
+    results of runs that timed out, have no nodes
+  """
+  run, fp = run_fp
+  status = read_status(fp)
+  if os.path.exists(fp) and status in (None, 'optimal'):
+    return run, fp, 'optimal', read_graphml_nodes(fp)
+  return run, fp, status or 'unknown', []
+
+def find_flow_results(flow_result_dir):
+  """
+  Returns
+  -------
+  run_fps : list of (int, str)
+    run number and flow_result.graphml path of each flow<i> subdirectory of <flow_result_dir>, by
+    run number
+  """
+  run_fps = []
+  for name in os.listdir(flow_result_dir):
+    match = re.match(r'^flow(\d+)$', name)
+    if match is not None and os.path.isdir(os.path.join(flow_result_dir, name)):
+      run_fps.append((int(match.group(1)), os.path.join(flow_result_dir, name, 'flow_result.graphml')))
+  return sorted(run_fps)
+
+def import_flow_results(run_fps, store, workers=1):
+  """
+  Parse the graphml flow results <run_fps> with <workers> processes
+
+  Returns
+  -------
+  records : list of bytes
+    simulation result records of the runs, encoded by <store>
+  """
+  if workers > 1 and len(run_fps) > 1:
+    pool = mp.Pool(processes=min(workers, len(run_fps)))
+    try:
+      results = list(pool.imap(import_flow_result, run_fps, chunksize=max(1, len(run_fps) // (4 * workers))))
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
+  else:
+    results = [import_flow_result(run_fp) for run_fp in run_fps]
+  records = []
+  for run, fp, status, nodes in results:
+    if status != 'optimal':
+      sys.stdout.write('[warning] no flow result counted for {} (status {})\n'.format(fp, status))
+    records.append(store.encode(run, status, nodes=nodes))
+  return records
 
 def main():
   parser = argparse.ArgumentParser(description="""
 Compute node frequency of nodes in the resulting flow graph for many simulated runs.
-""")
-  parser.add_argument('--flow-results', nargs='+', help="Flow result graphml files", required=True)
+
+Flow results are read from the simulation result store --sim-results that flow.py, flow_batch.py
+and flow_sim_engine.py append to, a file or a directory of per-job shards (see
+flopro.sim_results). Flow results written as graphml
+files, given by path or by the directories of their flow<i> subdirectories, are imported in
+parallel and also appended to --sim-results, if it is given.
+
+With --edge-frequency, the number of runs whose flow graph has each edge, and its total flow
+over them, are also written from the edge flows of the store.
+""", formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--sim-results', help='simulation result store, a file or a directory of shards')
+  parser.add_argument('--flow-results', nargs='*', default=[], help='flow result graphml files')
+  parser.add_argument('--flow-result-dirs', nargs='*', default=[], help='directories whose flow<i> subdirectories hold the flow_result.graphml of run i')
+  parser.add_argument('--workers', type=int, default=1, help='number of processes that parse graphml flow results')
   parser.add_argument('--edges-file', required=True)
+  flow.add_network_cache_args(parser)
+  parser.add_argument('--edge-frequency', action='store_true', help='also write edge_frequency.csv of <tail>,<head>,<runs>,<total flow> lines')
   parser.add_argument('--outdir')
   args = parser.parse_args()
+  if args.sim_results is None and len(args.flow_results) == 0 and len(args.flow_result_dirs) == 0:
+    sys.stderr.write('One of --sim-results, --flow-results or --flow-result-dirs is required\n')
+    sys.exit(2)
+
+  node_index = flopro.node_index.load_node_index(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe)
+  store_fp = args.sim_results
+  if store_fp is not None and os.path.isdir(store_fp):
+    # imported runs go to a shard of their own
+    store_fp = flopro.sim_results.shard_fp(store_fp, 'flow_sim_frequency')
+  store = flopro.sim_results.ResultStore(store_fp, node_index.names)
 
-  node_to_count = {}
-  G_ppi = flopro.parsers.abc.parse_abc(args.edges_file)
-  for node in G_ppi.nodes():
-    node_to_count[node] = 0
+  # runs without a flow result are counted by their status, so timeouts are told apart from
+  # infeasible runs; partial results of runs that timed out are not counted as flow results
+  run_fps = [(-1, fp) for fp in args.flow_results]
+  for flow_result_dir in args.flow_result_dirs:
+    run_fps += find_flow_results(flow_result_dir)
+  records = import_flow_results(run_fps, store, workers=args.workers)
+  data = b''.join(records)
+  if args.sim_results is not None:
+    if len(records) > 0:
+      store.append(records)
+    data = flopro.sim_results.read_bytes(args.sim_results)
+    if len(data) == 0:
+      sys.stderr.write('[warning] {} has no records; no run appended a flow result to it\n'.format(args.sim_results))
+  sim_results = flopro.sim_results.SimResults.from_bytes(data, names=node_index.names)
+  counts = sim_results.frequency(len(node_index))
+  status_counts = sim_results.status_counts()
 
-  for flow_result_fp in args.flow_results:
-    if os.path.exists(flow_result_fp):
-      G = nx.read_graphml(flow_result_fp)
-      for node in G.nodes():
-        node_to_count[node] += 1
-    else:
-      sys.stdout.write('[warning] missing flow result {}\n'.format(flow_result_fp))
+  with open(os.path.join(args.outdir, 'flow_status.tsv'), 'w') as fh:
+    for status in sorted(status_counts):
+      fh.write('{}\t{}\n'.format(status, status_counts[status]))
 
   ofp = os.path.join(args.outdir, 'node_frequency.csv')
   with open(ofp, 'w') as ofh:
-    for node, count in node_to_count.items():
+    for node, count in zip(node_index.names, counts.tolist()):
       ofh.write('{},{}\n'.format(node, count))
 
+  if args.edge_frequency:
+    tails, heads, edge_counts, flows = sim_results.edge_frequency(len(node_index))
+    with open(os.path.join(args.outdir, 'edge_frequency.csv'), 'w') as ofh:
+      for tail, head, count, total in zip(tails.tolist(), heads.tolist(), edge_counts.tolist(), flows.tolist()):
+        ofh.write('{},{},{},{}\n'.format(node_index.names[tail], node_index.names[head], count, total))
+
 if __name__ == "__main__":
   main()
@@ -1,38 +1,89 @@
 #!/usr/bin/env python
 import sys, argparse
-import numpy as np
-import flopro.parsers.abc
-import flow
+import flopro.node_index
+import flopro.sim_samples
+import flopro.flow as flow
 import os, os.path
 
+def sampling_universe(node_index, alt_sources_file=None):
+  """
+  Returns
+  -------
+  nodes : list of str
+    sorted nodes to sample hits from: those of <alt_sources_file> that are in the network if it
+    is given, otherwise every node of the network
+  """
+  if alt_sources_file is not None:
+    nodes = []
+    with open(alt_sources_file) as fh:
+      for line in fh:
+        line = line.rstrip()
+        nodes.append(line)
+    n_nodes_pre = len(nodes)
+    nodes = list(filter(lambda x: x in node_index, nodes))
+    n_nodes_post = len(nodes)
+    sys.stderr.write('[warning] {} nodes were removed from --alt-sources-file because they are not present in the --edges-file network\n'.format(n_nodes_pre - n_nodes_post))
+  else:
+    nodes = node_index.names
+  return sorted(nodes)
+
+def screen_sampler(node_index, universe, sources_real, null=flopro.sim_samples.NULL_DEFAULT, min_stratum_size=flopro.sim_samples.MIN_STRATUM_SIZE):
+  """
+  Parameters
+  ----------
+  universe : list of str
+    see sampling_universe
+
+  sources_real : set of str
+
+  null : str
+    'uniform' draws as many nodes as <sources_real> uniformly from <universe>; 'degree' draws, for
+    each real source in the network, a node of <universe> in the same degree bin, from degree
+    bins of at least <min_stratum_size> nodes built once here
+
+  Returns
+  -------
+  sample : function (n_simulation, seed=None, start=0) -> flopro.sim_samples.SimSamples
+  """
+  if null == 'uniform':
+    size = len(sources_real)
+    def sample(n_simulation, seed=None, start=0):
+      return flopro.sim_samples.simulate(universe, size, n_simulation, seed=seed, start=start)
+    return sample
+  sources = sorted(node for node in sources_real if node in node_index)
+  if len(sources) < len(sources_real):
+    sys.stderr.write('[warning] {} sources are not in the --edges-file network and have no degree to match; simulations have {} nodes\n'.format(len(sources_real) - len(sources), len(sources)))
+  degrees = [node_index.degree(node) for node in sources]
+  strata = flopro.sim_samples.DegreeStrata.from_degrees([node_index.degree(node) for node in universe], min_size=min_stratum_size).matched(degrees)
+  def sample(n_simulation, seed=None, start=0):
+    return flopro.sim_samples.simulate_degree_matched(universe, strata, degrees, n_simulation, seed=seed, start=start)
+  return sample
+
+def add_null_args(parser):
+  parser.add_argument('--null', choices=flopro.sim_samples.NULLS, default=flopro.sim_samples.NULL_DEFAULT, help='uniform samples hits uniformly; degree samples, for each real source, a node of similar degree (see flopro.sim_samples). Default {}'.format(flopro.sim_samples.NULL_DEFAULT))
+  parser.add_argument('--min-stratum-size', type=int, default=flopro.sim_samples.MIN_STRATUM_SIZE, help='with --null degree, fewest nodes in a degree bin; default {}'.format(flopro.sim_samples.MIN_STRATUM_SIZE))
+
 def main():
   parser = argparse.ArgumentParser(description="""
-Simulate genetic screening hits by uniform random sampling.
+Simulate genetic screening hits by uniform random sampling, or by sampling nodes of the same
+degrees as the real hits with --null degree.
 If --alt-sources-file is present, hits are sub-sampled from the alternative sources file.
 Otherwise, hits are simulated from the provided network nodes in --edges-file.
-""")
+All simulations are written to one sample matrix, <outdir>/{}; see flopro.sim_samples.
+""".format(flopro.sim_samples.SAMPLES_FN))
   parser.add_argument('--n-simulation', type=int, required=True)
   parser.add_argument('--sources-file', required=True)
   parser.add_argument('--edges-file', help='network file in abc format (node node weight)', required=True)
+  flow.add_network_cache_args(parser)
   parser.add_argument('--alt-sources-file', help='newline-delimited list of gene identifiers')
   parser.add_argument('--outdir', required=True)
+  parser.add_argument('--seed', type=int, help='seed of the simulations; if not given, one is drawn and recorded in the sample matrix')
+  add_null_args(parser)
+  parser.add_argument('--write-txt', action='store_true', help='also write the nodes of simulation i to <outdir>/sim<i>.txt')
   args = parser.parse_args()
 
-  G = flopro.parsers.abc.parse_abc(args.edges_file)
-  nodes = None # universe to sample from
-  if args.alt_sources_file is not None:
-    nodes = []
-    with open(args.alt_sources_file) as fh:
-      for line in fh:
-        line = line.rstrip()
-        nodes.append(line)
-    n_nodes_pre = len(nodes)
-    nodes = list(filter(lambda x: x in G, nodes))
-    n_nodes_post = len(nodes)
-    sys.stderr.write('[warning] {} nodes were removed from --alt-sources-file because they are not present in the --edges-file network\n'.format(n_nodes_pre - n_nodes_post))
-  else:
-    nodes = G.nodes()
-  nodes = sorted(nodes)
+  node_index = flopro.node_index.load_node_index(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe)
+  nodes = sampling_universe(node_index, args.alt_sources_file)
 
   # note real sources file
   # TODO what if some of the input sources are not actually in the edges-file graph
@@ -40,12 +91,15 @@ Otherwise, hits are simulated from the provided network nodes in --edges-file.
   sources_real = flow.parse_nodes(sources_real_fp)
 
   # simulate screens
-  for i in range(args.n_simulation):
-    sample_inds = np.random.choice(len(nodes), size=len(sources_real), replace=False)
-    sample_nodes = list(map(lambda x: nodes[x], sample_inds))
-    ofp = os.path.join(args.outdir, 'sim{}.txt'.format(i))
-    with open(ofp, 'w') as ofh:
-      ofh.write('\n'.join(sample_nodes))
+  sample = screen_sampler(node_index, nodes, sources_real, null=args.null, min_stratum_size=args.min_stratum_size)
+  samples = sample(args.n_simulation, seed=args.seed)
+  samples.write(os.path.join(args.outdir, flopro.sim_samples.SAMPLES_FN))
+  sys.stdout.write('seed {}\n'.format(samples.seed))
+  if args.write_txt:
+    for i, sample_nodes in enumerate(samples):
+      ofp = os.path.join(args.outdir, 'sim{}.txt'.format(i))
+      with open(ofp, 'w') as ofh:
+        ofh.write('\n'.join(sorted(sample_nodes)))
 
 if __name__ == "__main__":
   main()
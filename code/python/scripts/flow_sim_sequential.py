@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Simulate screens and solve them in batches until the empirical p-value of every node of the real
+flow result is resolved, instead of solving a fixed number of simulations.
+
+Simulated screens are drawn as flow_sim_screens.py draws them, with the same --null and from
+the same seeded streams, so simulation i is the same as the i-th of flow_sim_screens.py --seed. Each batch is solved by the
+worker processes of flow_sim_engine.py, which load the network once for all batches. After each
+batch the Besag-Clifford sequential p-values of the nodes of --flow-result are updated (see
+flopro.sequential), and sampling stops once every node has appeared in --exceedances
+simulations or can no longer have a p-value below --alpha, or --n-simulation simulations have
+been drawn. Nodes that are significant at --alpha are counted over all --n-simulation.
+Simulations that cannot be solved count as simulations whose flow graph has no node, as they do
+for write_pvals.py, so p-values are over every simulation drawn; those of the last batch past
+the stopping point are discarded.
+
+As with flow_sim_engine.py, the flow graph of a simulation does not depend on which other
+simulations share its shard, so results do not depend on --batch-size, --chunk-size or --workers.
+
+Writes to --outdir:
+
+  sequential_pvals.tsv     count, effective number of simulations, p-value and whether it is
+                           resolved, of each node of --flow-result
+  sequential_summary.tsv   number of simulations and batches, nodes resolved and why sampling
+                           stopped
+  pvals.csv                p-value of each node, as write_pvals.py writes it
+  node_frequency.csv       frequency of every node in the counted simulations
+  flow_status.tsv          status of the solved simulations
+  sim_samples.npz          the simulations solved (see flopro.sim_samples)
+"""
+import argparse, sys
+import os, os.path
+import multiprocessing as mp
+import numpy as np
+import flopro.node_index
+import flopro.sequential
+import flopro.sim_results
+import flopro.sim_samples
+import flopro.flow as flow
+import flow_sim_engine
+import flow_sim_frequency
+import flow_sim_screens
+
+BATCH_SIZE_DEFAULT = 100
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  flow.add_network_args(parser)
+  parser.add_argument('--sources-file', required=True, help='real sources; simulations sample as many nodes')
+  parser.add_argument('--alt-sources-file', help='sample simulated sources from this file; see flow_sim_screens.py')
+  parser.add_argument('--targets-file', required=True, help='target node file path')
+  parser.add_argument('--min-sources', type=int, required=True, help='see flow.py')
+  parser.add_argument('--min-targets', type=int, required=True, help='see flow.py')
+  parser.add_argument('--flow-result', required=True, help='flow_result.graphml of the real sources')
+  parser.add_argument('--outdir', required=True)
+  parser.add_argument('--n-simulation', type=int, required=True, help='most simulations to solve')
+  parser.add_argument('--exceedances', type=int, default=flopro.sequential.EXCEEDANCES_DEFAULT, help='a node is resolved once it has appeared in this many simulations; the relative error of its p-value is about 1 / sqrt of it. Default {}'.format(flopro.sequential.EXCEEDANCES_DEFAULT))
+  parser.add_argument('--alpha', type=float, default=flopro.sequential.ALPHA_DEFAULT, help='a node is also resolved, as not significant, once its p-value can no longer fall below this within --n-simulation simulations; 0 resolves nodes only by --exceedances. Default {}'.format(flopro.sequential.ALPHA_DEFAULT))
+  parser.add_argument('--batch-size', type=int, default=BATCH_SIZE_DEFAULT, help='simulations solved between checks of the stopping rule; default {}'.format(BATCH_SIZE_DEFAULT))
+  parser.add_argument('--seed', type=int, help='see flow_sim_screens.py')
+  flow_sim_screens.add_null_args(parser)
+  parser.add_argument('--sim-results', help='simulation result store to append the counted simulations to (see flopro.sim_results)')
+  parser.add_argument('--workers', type=int, default=mp.cpu_count(), help='number of worker processes; default is the number of CPUs')
+  parser.add_argument('--chunk-size', type=int, default=flow_sim_engine.CHUNK_SIZE_DEFAULT, help='see flow_sim_engine.py')
+  args = parser.parse_args()
+
+  node_index = flopro.node_index.load_node_index(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe)
+  universe = flow_sim_screens.sampling_universe(node_index, args.alt_sources_file)
+  sample = flow_sim_screens.screen_sampler(node_index, universe, flow.parse_nodes(args.sources_file), null=args.null, min_stratum_size=args.min_stratum_size)
+  targets = flow.parse_nodes(args.targets_file)
+  store = flopro.sim_results.ResultStore(args.sim_results, node_index.names)
+
+  real_nodes = [node for node in flow_sim_frequency.read_graphml_nodes(args.flow_result) if node in node_index]
+  tracker = flopro.sequential.SequentialPvalues([node_index.index(node) for node in real_nodes], len(node_index),
+    exceedances=args.exceedances, max_simulation=args.n_simulation, alpha=args.alpha if args.alpha > 0 else None)
+
+  seed = np.random.SeedSequence(args.seed).entropy
+  sample_blocks = []
+  records = []
+  n_batches = 0
+  n_drawn = 0
+  engine = flow_sim_engine.Engine(args.edges_file, targets, set(universe), args.min_sources, args.min_targets, workers=args.workers,
+    cache_dir=args.network_cache_dir, dedupe=args.dedupe, prune=args.prune, solver=args.solver,
+    precheck=args.precheck, time_limit=args.time_limit)
+  try:
+    # every simulation drawn is counted, so the tracker's count is also the number drawn
+    while not tracker.done:
+      size = min(args.batch_size, args.n_simulation - n_drawn)
+      samples = sample(size, seed=seed, start=n_drawn)
+      tasks = [(n_drawn + j, sources, None) for j, sources in enumerate(samples)]
+      for i, status, cost, nodes, edges, metrics in engine.solve(flow_sim_engine.shard_runs(tasks, args.chunk_size)):
+        if tracker.done:
+          break
+        records.append(store.encode(i, status, cost, nodes, edges, metrics))
+        # partial flow graphs of runs that were not solved are not counted
+        tracker.update(store.node_ids(nodes) if status == 'optimal' else [])
+      sample_blocks.append(samples.samples)
+      n_drawn = len(records)
+      n_batches += 1
+      sys.stdout.write('batch {}: {} simulations counted, {} of {} nodes resolved\n'.format(n_batches, tracker.n_total, int(tracker.resolved.sum()), len(real_nodes)))
+      sys.stdout.flush()
+  finally:
+    engine.close()
+
+  # simulations of the last batch past the stopping point are discarded
+  empty = sample(0, seed=seed)
+  samples = flopro.sim_samples.SimSamples(universe, np.concatenate([empty.samples] + sample_blocks)[:n_drawn], seed, null=empty.null)
+  samples.write(os.path.join(args.outdir, flopro.sim_samples.SAMPLES_FN))
+  if args.sim_results is not None and len(records) > 0:
+    store.append(records)
+  sim_results = flopro.sim_results.SimResults.from_bytes(b''.join(records), names=node_index.names)
+
+  tracker.write(os.path.join(args.outdir, 'sequential_pvals.tsv'), node_index.names)
+  with open(os.path.join(args.outdir, 'pvals.csv'), 'w') as ofh:
+    for node, p_val in zip(real_nodes, tracker.pvalues().tolist()):
+      ofh.write(",".join([node, "{:1.3f}".format(p_val)])+"\n")
+  with open(os.path.join(args.outdir, 'node_frequency.csv'), 'w') as ofh:
+    for node, count in zip(node_index.names, sim_results.frequency(len(node_index)).tolist()):
+      ofh.write('{},{}\n'.format(node, count))
+  status_counts = dict.fromkeys(flow.STATUSES, 0)
+  status_counts.update(sim_results.status_counts())
+  with open(os.path.join(args.outdir, 'flow_status.tsv'), 'w') as fh:
+    for status in flow.STATUSES:
+      fh.write('{}\t{}\n'.format(status, status_counts[status]))
+
+  summary = [
+    ('stop_reason', tracker.stop_reason or 'max_simulation'),
+    ('n_simulation', tracker.n_total),
+    ('n_solved', len(records)),
+    ('n_failed', len(records) - status_counts['optimal']),
+    ('max_simulation', args.n_simulation),
+    ('n_batches', n_batches),
+    ('exceedances', args.exceedances),
+    ('n_nodes', len(real_nodes)),
+    ('alpha', args.alpha),
+    ('n_resolved', int(tracker.resolved.sum())),
+    ('n_futile', int(tracker.futile.sum())),
+    ('median_node_simulations', int(np.median(tracker.n_simulation)) if len(real_nodes) > 0 else 0),
+    ('seed', seed)
+  ]
+  with open(os.path.join(args.outdir, 'sequential_summary.tsv'), 'w') as fh:
+    for key, value in summary:
+      fh.write('{}\t{}\n'.format(key, value))
+  sys.stdout.write('stopped after {} simulations: {}\n'.format(tracker.n_total, summary[0][1]))
+
+if __name__ == "__main__":
+  main()
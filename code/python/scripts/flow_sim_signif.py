@@ -2,26 +2,44 @@
 import sys, argparse
 import os, os.path
 import networkx as nx
+import flopro.node_index
+import flopro.flow as flow
+import flopro.sim_results
 
 def main():
   parser = argparse.ArgumentParser(description="""
 Identify nodes in the resulting flow graph which are signifcant according to the simulated 
 empirical distribution.
-""")
+
+Node frequency is read from the node_frequency.csv of flow_sim_frequency.py, or counted directly
+from the simulation result store --sim-results (see flopro.sim_results).
+""", formatter_class=argparse.RawDescriptionHelpFormatter)
   parser.add_argument('--flow-result', required=True)
-  parser.add_argument('--node-frequency', required=True)
+  frequency = parser.add_mutually_exclusive_group(required=True)
+  frequency.add_argument('--node-frequency')
+  frequency.add_argument('--sim-results', help='simulation result store, a file or a directory of shards; requires --edges-file')
+  parser.add_argument('--edges-file', help='network the runs of --sim-results were solved on')
+  flow.add_network_cache_args(parser)
   parser.add_argument('--outdir', required=True)
   args = parser.parse_args()
+  if args.sim_results is not None and args.edges_file is None:
+    sys.stderr.write('--sim-results requires --edges-file\n')
+    sys.exit(2)
 
   G = nx.read_graphml(args.flow_result)
   node_to_count = {}
-  with open(args.node_frequency, 'r') as fh:
-    for line in fh:
-      line = line.rstrip()
-      words = line.split(',')
-      node = words[0]
-      count = int(words[1])
-      node_to_count[node] = count
+  if args.sim_results is not None:
+    node_index = flopro.node_index.load_node_index(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe)
+    sim_results = flopro.sim_results.SimResults.read(args.sim_results, names=node_index.names)
+    node_to_count = dict(zip(node_index.names, sim_results.frequency(len(node_index)).tolist()))
+  else:
+    with open(args.node_frequency, 'r') as fh:
+      for line in fh:
+        line = line.rstrip()
+        words = line.split(',')
+        node = words[0]
+        count = int(words[1])
+        node_to_count[node] = count
 
   node_count_pairs = []
   for node in G.nodes():
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+import sys, argparse
+from flopro import network_diff
+from flopro import script_utils
+
+def main():
+  parser = argparse.ArgumentParser(description="""
+Apply edge diffs to a compiled network directory (see flopro.network_diff for the format), e.g.
+one written by string_to_abc.py --format compiled. Pass the directory to flow.py as
+--edges-file; flow_meta.tsv records the network revision each result was computed with.
+""")
+  parser.add_argument("--network-dir", "-n", required=True, help="compiled network directory")
+  parser.add_argument("--diff-file", "-d", nargs="*", default=[], help="edge diff files, applied in order; each is one revision")
+  parser.add_argument("--compact", action="store_true", help="afterwards fold all changes into the base arrays")
+  args = parser.parse_args()
+  script_utils.log_script(sys.argv)
+
+  for diff_fp in args.diff_file:
+    with open(diff_fp) as fh:
+      stats = network_diff.apply_diff(args.network_dir, fh)
+    sys.stderr.write("[status] revision {revision}: added {n_added} interactions and {n_added_nodes} nodes, removed {n_removed}, reweighted {n_reweighted}\n".format(**stats))
+  if args.compact:
+    network = network_diff.compact_network(args.network_dir)
+    sys.stderr.write("[status] compacted network {}: {} nodes, {} interactions\n".format(network.version, network.n_nodes, network.n_edges))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import sys, argparse
+import subprocess
+import time
+
+# modules that a flow problem is solved without; importing them only happens for GSEA, rendering
+# and networkx output
+HEAVY_MODULES = ['networkx', 'gprofiler', 'flopro.gsea', 'flopro.plot']
+
+def import_time(statement, repeat):
+  """
+  Returns
+  -------
+  seconds : float
+    smallest wall time of <repeat> fresh interpreters running <statement>, less that of an empty
+    interpreter
+
+  loaded : list of str
+    HEAVY_MODULES loaded by <statement>
+  """
+  def best(code):
+    times = []
+    for i in range(repeat):
+      start = time.perf_counter()
+      out = subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+      times.append(time.perf_counter() - start)
+    return min(times), out
+  baseline, _ = best('pass')
+  check = '{}\nimport sys\nprint(" ".join(m for m in {!r} if m in sys.modules))'.format(statement, HEAVY_MODULES)
+  seconds, out = best(check)
+  return seconds - baseline, out.split()
+
+def main():
+  parser = argparse.ArgumentParser(description="""
+Measure the import time of the flopro modules a flow problem is solved with, and check that they
+do not load networkx, gprofiler or the plotting code. Exits with status 1 if one of them does, or
+if --max-seconds is given and an import takes longer.
+""")
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--max-seconds', type=float, help='fail if importing flopro.flow or flopro.cli takes longer than this')
+  args = parser.parse_args()
+
+  statements = [
+    ('flopro.flow', 'import flopro.flow', True),
+    ('flopro.cli', 'import flopro.cli', True),
+    ('flopro flow parser', 'import argparse, flopro.cli\nflopro.cli.add_flow_parser(argparse.ArgumentParser().add_subparsers())', True),
+    ('flopro.flow + gsea + plot', 'import flopro.flow, flopro.gsea, flopro.plot', False)
+  ]
+  n_fail = 0
+  sys.stdout.write('import\tseconds\theavy_modules_loaded\n')
+  for name, statement, lazy in statements:
+    seconds, loaded = import_time(statement, args.repeat)
+    row = [name, '{:.3f}'.format(seconds), ','.join(loaded) or '-']
+    if lazy and (len(loaded) > 0 or (args.max_seconds is not None and seconds > args.max_seconds)):
+      n_fail += 1
+      row.append('FAIL')
+    sys.stdout.write('\t'.join(row) + '\n')
+  if n_fail > 0:
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
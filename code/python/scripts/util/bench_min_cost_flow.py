@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+import sys, argparse
+import time
+import flopro.network
+import flopro.prune
+import flopro.solvers
+import flopro.flow as flow
+
+def solve(network, id_table, sources, targets, min_sources, min_targets, prune, solver):
+  """
+  Build and solve the flow problem of flow.py with <solver>
+
+  Returns
+  -------
+  cost : int or None
+    optimal cost, or None if the problem could not be solved
+
+  build_time, solve_time : float
+    seconds spent building the solver and solving
+  """
+  total_flow = min_sources * min_targets
+  start = time.perf_counter()
+  pruned = flow.prune_network(network, id_table, sources, targets, mode=prune)
+  G = flow.build_solver(pruned.tail, pruned.head, pruned.cost, total_flow, solver=solver)
+  flow.add_sources_targets(G, sources, targets, id_table, min_targets, min_sources)
+  G.SetNodeSupply(id_table.source_id, total_flow)
+  G.SetNodeSupply(id_table.target_id, -total_flow)
+  build_time = time.perf_counter() - start
+  start = time.perf_counter()
+  cost = G.OptimalCost() if G.Solve() == G.OPTIMAL else None
+  solve_time = time.perf_counter() - start
+  return cost, build_time, solve_time
+
+def main():
+  parser = argparse.ArgumentParser(description="""
+Compare the min-cost flow solvers of flopro.solvers on the flow problem of flow.py for each of
+--sources-files, and check that they find the same optimal cost.
+""")
+  parser.add_argument('--edges-file', required=True)
+  parser.add_argument('--sources-files', nargs='+', required=True)
+  parser.add_argument('--targets-file', required=True)
+  parser.add_argument('--min-sources', type=int, required=True)
+  parser.add_argument('--min-targets', type=int, required=True)
+  parser.add_argument('--network-cache-dir')
+  parser.add_argument('--prune', choices=flopro.prune.PRUNE_MODES, default=flopro.prune.PRUNE_DEFAULT)
+  parser.add_argument('--solvers', nargs='+', choices=flopro.solvers.SOLVERS, default=flopro.solvers.SOLVERS)
+  parser.add_argument('--repeat', type=int, default=1)
+  args = parser.parse_args()
+
+  network = flopro.network.load_network(args.edges_file, cache_dir=args.network_cache_dir)
+  id_table = network.id_table()
+  targets = flow.parse_nodes(args.targets_file)
+  sys.stdout.write('{} nodes, {} edges\n'.format(network.n_nodes, network.n_edges))
+
+  totals = {solver: 0.0 for solver in args.solvers}
+  n_mismatch = 0
+  sys.stdout.write('\t'.join(['sources_file'] + ['{}_cost\t{}_build\t{}_solve'.format(solver, solver, solver) for solver in args.solvers]) + '\n')
+  for sources_fp in args.sources_files:
+    sources = flow.parse_nodes(sources_fp)
+    costs = []
+    row = [sources_fp]
+    for solver in args.solvers:
+      best = None
+      for i in range(args.repeat):
+        cost, build_time, solve_time = solve(network, id_table, sources, targets, args.min_sources, args.min_targets, args.prune, solver)
+        if best is None or build_time + solve_time < best[1] + best[2]:
+          best = (cost, build_time, solve_time)
+      costs.append(best[0])
+      totals[solver] += best[1] + best[2]
+      row += [str(best[0]), '{:.4f}'.format(best[1]), '{:.4f}'.format(best[2])]
+    if len(set(costs)) > 1:
+      n_mismatch += 1
+      row.append('MISMATCH')
+    sys.stdout.write('\t'.join(row) + '\n')
+
+  for solver in args.solvers:
+    sys.stdout.write('total\t{}\t{:.2f}s\n'.format(solver, totals[solver]))
+  if n_mismatch > 0:
+    sys.stderr.write('{} source files with different optimal costs\n'.format(n_mismatch))
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
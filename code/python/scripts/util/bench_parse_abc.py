@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import sys, argparse
+import os, os.path
+import time
+import tempfile
+import numpy as np
+from flopro.parsers.abc import read_abc_arrays
+
+def parse_abc_per_line(edges_file):
+  """
+  Per-line tokenizer formerly used by flow.py construct_digraph
+  """
+  id_dict = {}
+  tails = []
+  heads = []
+  weights = []
+  with open(edges_file) as edges_f:
+    for line in edges_f:
+      tokens = line.strip().split()
+      node1 = tokens[0]
+      if not node1 in id_dict:
+        id_dict[node1] = len(id_dict)
+      node2 = tokens[1]
+      if not node2 in id_dict:
+        id_dict[node2] = len(id_dict)
+      tails.append(id_dict[node1])
+      heads.append(id_dict[node2])
+      weights.append(float(tokens[2]))
+  return list(id_dict.keys()), tails, heads, weights
+
+def write_string_like(fp, n_nodes, n_edges, seed=0):
+  """
+  Write a random network with STRING-like identifiers and weights where each interaction is
+  listed in both directions
+  """
+  rng = np.random.default_rng(seed)
+  names = np.array(['ENSP{:011d}'.format(i) for i in range(n_nodes)])
+  tails = rng.integers(0, n_nodes, size=n_edges)
+  heads = rng.integers(0, n_nodes, size=n_edges)
+  weights = rng.integers(150, 1000, size=n_edges) / 1000
+  block = 1 << 18
+  with open(fp, 'w') as fh:
+    for start in range(0, n_edges, block):
+      end = min(start + block, n_edges)
+      lines = []
+      for u, v, w in zip(names[tails[start:end]], names[heads[start:end]], weights[start:end]):
+        lines.append('{} {} {}\n{} {} {}\n'.format(u, v, w, v, u, w))
+      fh.write(''.join(lines))
+
+def main():
+  parser = argparse.ArgumentParser(description="""
+Compare the bulk abc parser flopro.parsers.abc.read_abc_arrays with the per-line parser it
+replaced. By default a random network about the size of STRING v10.5 human (19,576 proteins,
+5.7 million interactions listed in both directions) is written to a temporary file.
+""")
+  parser.add_argument('--edges-file', help='existing abc file to parse instead of a random network')
+  parser.add_argument('--n-nodes', type=int, default=19576)
+  parser.add_argument('--n-edges', type=int, default=5700000, help='number of interactions; the file has twice as many lines')
+  parser.add_argument('--repeat', type=int, default=1)
+  args = parser.parse_args()
+
+  tmp_dir = None
+  edges_file = args.edges_file
+  if edges_file is None:
+    tmp_dir = tempfile.mkdtemp()
+    edges_file = os.path.join(tmp_dir, 'edges_file.txt')
+    sys.stdout.write('writing random network to {}\n'.format(edges_file))
+    write_string_like(edges_file, args.n_nodes, args.n_edges)
+  sys.stdout.write('{} bytes\n'.format(os.path.getsize(edges_file)))
+
+  try:
+    timings = {}
+    for name, parse_fn in [('per-line', parse_abc_per_line), ('bulk', read_abc_arrays)]:
+      best = None
+      for i in range(args.repeat):
+        start = time.perf_counter()
+        rv = parse_fn(edges_file)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+      timings[name] = best
+      sys.stdout.write('{}\t{:.2f}s\t{} nodes\t{} lines\n'.format(name, best, len(rv[0]), len(rv[1])))
+    sys.stdout.write('speedup\t{:.1f}x\n'.format(timings['per-line'] / timings['bulk']))
+  finally:
+    if tmp_dir is not None:
+      os.remove(edges_file)
+      os.rmdir(tmp_dir)
+
+if __name__ == "__main__":
+  main()
@@ -1,13 +1,30 @@
 #!/usr/bin/env python
 from flopro import string_db
+import flopro.network
 import sys, argparse
 
 def main():
-  parser = argparse.ArgumentParser()
-  parser.add_argument("--infile", "-i", type=argparse.FileType('r'), default=sys.stdin)
-  parser.add_argument("--outfile", "-o", type=argparse.FileType('w'), default=sys.stdout)
+  parser = argparse.ArgumentParser(description="""
+Filter a raw STRING protein.links.full or iRefIndex MITAB dump, optionally gzip compressed, into
+an abc file or a compiled network (see flopro.network). Proteins of other taxa than --taxon are
+dropped and STRING's taxon prefix is removed from protein names.
+""")
+  parser.add_argument("--infile", "-i", default="-", help="database dump; default is stdin")
+  parser.add_argument("--outfile", "-o", default="-", help="abc file, default is stdout; or the directory to write a compiled network to")
+  parser.add_argument("--format", default="abc", choices=string_db.OUT_FORMATS, help="output format")
+  parser.add_argument("--channel", help="score to threshold: a STRING evidence channel, default combined_score, or one of {} for iRefIndex, default {}".format(", ".join(string_db.IREFINDEX_CHANNELS), string_db.IREFINDEX_CHANNEL_DEFAULT))
+  parser.add_argument("--min-score", type=int, default=0, help="drop interactions with score below this; STRING scores are on a 0-1000 scale")
+  parser.add_argument("--taxon", default=string_db.TAXON_DEFAULT, help="NCBI taxonomy id of interactions to keep")
+  parser.add_argument("--all-taxa", action="store_true", help="keep interactions of every taxon and do not strip STRING taxon prefixes")
+  parser.add_argument("--dedupe", choices=flopro.network.DEDUPE_POLICIES, default=flopro.network.DEDUPE_DEFAULT, help="with --format compiled, how to merge interactions listed more than once; see flow.py")
+  parser.add_argument("--processes", type=int, default=1, help="number of worker processes")
   args = parser.parse_args()
-  string_db.string_to_abc(args.infile, args.outfile)
+
+  taxon = None if args.all_taxa else args.taxon
+  stats = string_db.string_to_abc(args.infile, args.outfile, out_format=args.format, channel=args.channel, min_score=args.min_score, taxon=taxon, processes=args.processes, dedupe=args.dedupe)
+  sys.stderr.write("[status] kept {} of {} {} interactions\n".format(stats['n_kept'], stats['n_lines'], stats['db_type']))
+  if args.format == "compiled":
+    sys.stderr.write("[status] dropped {} duplicate interactions\n".format(stats['n_duplicates']))
 
 if __name__ == "__main__":
   main()
@@ -1,11 +1,12 @@
 #!/usr/bin/env python
 import argparse, sys
-import flopro.parsers.abc
+import flopro.node_index
  
 def main():
   parser = argparse.ArgumentParser()
   parser.add_argument("--graph-type", type=str, default="abc")
-  parser.add_argument("--graph", type=argparse.FileType("r"), required=True)
+  parser.add_argument("--graph", type=str, required=True)
+  parser.add_argument("--network-cache-dir", type=str, help="see flow.py")
   parser.add_argument("--gene-list", type=argparse.FileType("r"), default=sys.stdin)
   parser.add_argument("--found", type=argparse.FileType("w"), default=sys.stdout)
   parser.add_argument("--missing", type=argparse.FileType("w"))
@@ -21,7 +22,7 @@ def main():
   # parse graph
   G = None
   if(graph_type == "abc"):
-    G = flopro.parsers.abc.parse_abc(args.graph)
+    G = flopro.node_index.load_node_index(args.graph, cache_dir=args.network_cache_dir)
   else:
     sys.stderr.write("Not implemented")
     sys.exit(2)
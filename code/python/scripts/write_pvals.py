@@ -1,25 +1,45 @@
 #!/usr/bin/env python
 import sys, argparse
 import networkx as nx
+import flopro.node_index
+import flopro.flow as flow
+import flopro.sim_results
 
 def main():
   parser = argparse.ArgumentParser()
   parser.add_argument("--node-frequency", "-q", help="2-column csv")
-  parser.add_argument("--n-simulations", "-n", type=int, help="int")
+  parser.add_argument("--sim-results", help="simulation result store, a file or a directory of shards, to count node frequency from instead of --node-frequency; requires --edges-file")
+  parser.add_argument("--edges-file", help="network the runs of --sim-results were solved on")
+  flow.add_network_cache_args(parser)
+  parser.add_argument("--n-simulations", "-n", type=int, help="int; with --sim-results, default is the number of simulations in the store")
   parser.add_argument("--flow-result", "-f", help="graphml")
   parser.add_argument("--outfile", "-o", help="output file")
   args = parser.parse_args()
+  if (args.node_frequency is None) == (args.sim_results is None) or (args.sim_results is not None and args.edges_file is None):
+    sys.stderr.write("One of --node-frequency or --sim-results with --edges-file is required\n")
+    sys.exit(2)
 
   G = nx.read_graphml(args.flow_result)
 
+  if args.sim_results is not None:
+    node_index = flopro.node_index.load_node_index(args.edges_file, cache_dir=args.network_cache_dir, dedupe=args.dedupe)
+    sim_results = flopro.sim_results.SimResults.read(args.sim_results, names=node_index.names)
+    freqs = zip(node_index.names, sim_results.frequency(len(node_index)).tolist())
+    n_simulations = args.n_simulations if args.n_simulations is not None else sim_results.n_simulation
+  else:
+    freqs = []
+    with open(args.node_frequency) as fh:
+      for line in fh:
+        line = line.rstrip()
+        [id_v, freq_str] = line.split(",")
+        freqs.append((id_v, int(freq_str)))
+    n_simulations = args.n_simulations
+
   ofh = open(args.outfile, 'w')
-  with open(args.node_frequency) as fh:
-    for line in fh:
-      line = line.rstrip()
-      [id_v, freq_str] = line.split(",")
-      if id_v in G:
-        p_val = int(freq_str) / args.n_simulations
-        ofh.write(",".join([id_v, "{:1.3f}".format(p_val)])+"\n")
+  for id_v, freq in freqs:
+    if id_v in G:
+      p_val = freq / n_simulations
+      ofh.write(",".join([id_v, "{:1.3f}".format(p_val)])+"\n")
 
 if __name__ == "__main__":
   main()
@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-from distutils.core import setup
+from setuptools import setup
 
 setup(name="flopro",
   version="0.1",
@@ -7,10 +7,15 @@ setup(name="flopro",
   author="Aaron Baker",
   author_email="abaker@cs.wisc.edu",
   packages=['flopro', 'flopro.parsers'],
+  entry_points={
+    'console_scripts': ['flopro = flopro.cli:main']
+  },
   scripts=[
     'scripts/flow_sim_pipeline.py',
     'scripts/flow_sim_screens.py',
     'scripts/flow.py',
+    'scripts/flow_batch.py',
+    'scripts/flow_sim_engine.py',
     'scripts/flow_sim_frequency.py',
     'scripts/flow_sim_signif.py',
     'scripts/flow_alt_pipeline.py',